@@ -3,17 +3,28 @@
 """
 from .palm_analyzer import PalmAnalyzer
 from .image_processor import PalmImageProcessor
-from .biometric_matcher import BiometricMatcher, AdvancedBiometricMatcher
+from .biometric_matcher import BiometricMatcher, AdvancedBiometricMatcher, ShardedBiometricMatcher, ConcurrentGallery
 from .deep_cnn_analyzer import DeepCNNAnalyzer, AdvancedPalmCNN
 from .anti_spoofing import AntiSpoofingSystem, AdvancedAntiSpoofingSystem
+from .template_quantization import ScalarQuantizer, ProductQuantizer
+from .lsh_index import RandomHyperplaneLSH
+from .template_store import TemplateStore
+from .embedding_cache import EmbeddingCache
 
 __all__ = [
     'PalmAnalyzer',
     'PalmImageProcessor', 
     'BiometricMatcher',
     'AdvancedBiometricMatcher',
+    'ShardedBiometricMatcher',
+    'ConcurrentGallery',
     'DeepCNNAnalyzer',
     'AdvancedPalmCNN',
     'AntiSpoofingSystem',
-    'AdvancedAntiSpoofingSystem'
+    'AdvancedAntiSpoofingSystem',
+    'ScalarQuantizer',
+    'ProductQuantizer',
+    'RandomHyperplaneLSH',
+    'TemplateStore',
+    'EmbeddingCache'
 ]
\ No newline at end of file
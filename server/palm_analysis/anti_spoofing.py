@@ -10,17 +10,52 @@ import logging
 from skimage.feature import local_binary_pattern
 from sklearn.ensemble import IsolationForest
 import tensorflow as tf
+import pickle
+
+try:
+    from .spoofing_features import extract_spoofing_features, extract_spoofing_features_batch, N_SPOOFING_FEATURES
+    from .image_stats import compute_image_stats
+except ImportError:
+    from spoofing_features import extract_spoofing_features, extract_spoofing_features_batch, N_SPOOFING_FEATURES
+    from image_stats import compute_image_stats
+
+# أوزان مكونات النتيجة الكلية وعتبة القرار (total_score > DECISION_THRESHOLD)
+SPOOFING_WEIGHTS = {
+    'temperature': 0.2,
+    'blood_flow': 0.2,
+    'texture': 0.15,
+    'printing': 0.15,
+    'attack': 0.2,
+    'depth': 0.1
+}
+DECISION_THRESHOLD = 0.6
+
+# كواشف الصورة بترتيب التكلفة التصاعدي (زمن صورة 640×480 على نواة واحدة، وcompute_image_stats
+# ~2 ms مرة واحدة)، والعنصر الأخير: هل يقبل الكاشف image_stats
+CASCADE_ORDER = (
+    ('blood_flow', 'detect_blood_flow', 'blood_flow_score', True),                 # ~0 ms
+    ('attack', 'detect_2d_attack', '2d_attack_score', True),                       # 13 ms
+    ('printing', 'detect_printing_artifacts', 'printing_artifact_score', False),   # 29 ms (FFT)
+    ('texture', 'detect_texture_anomalies', 'anomaly_score', True)                 # 75 ms (LBP)
+)
 
 class AntiSpoofingSystem:
-    def __init__(self):
+    def __init__(self, build_cnn_detector: bool = True):
         self.logger = logging.getLogger(__name__)
         
         # نموذج التعلم الآلي لاكتشاف التلاعب
         self.anomaly_detector = IsolationForest(contamination=0.1, random_state=42)
         self.is_trained = False
         
-        # نموذج CNN لاكتشاف التلاعب (إذا متوفر)
-        self.cnn_detector = self._build_cnn_detector()
+        # نموذج CNN لاكتشاف التلاعب (إذا متوفر). عند استخدام رأس الحيوية في
+        # PalmAnalyzer.multi_head_model لا حاجة لبناء نموذج منفصل
+        self.cnn_detector = self._build_cnn_detector() if build_cnn_detector else None
+        # وزن درجة حيوية CNN في النتيجة الكلية (0 حتى يُدرّب رأس الحيوية)
+        self.cnn_liveness_weight = 0.0
+        # التتالي مع الإيقاف المبكر في comprehensive_spoofing_detection
+        self.cascade = False
+        # وزن درجة مكتشف الشذوذ المدرب في النتيجة الكلية (يُستخدم فقط بعد التدريب أو التحميل)
+        self.anomaly_weight = 0.0
         
     def _build_cnn_detector(self) -> Optional[tf.keras.Model]:
         """بناء نموذج CNN للكشف عن التلاعب"""
@@ -58,33 +93,23 @@ class AntiSpoofingSystem:
             'temperature_score': 1.0 if temp_valid and temp_variance else 0.0
         }
     
-    def detect_blood_flow(self, rgb_image: np.ndarray) -> Dict[str, float]:
-        """الكشف عن تدفق الدم (PPG - Photoplethysmography من الصورة)"""
-        # تحويل إلى مساحة الألوان RGB
-        if len(rgb_image.shape) == 2:
-            rgb_image = cv2.cvtColor(rgb_image, cv2.COLOR_GRAY2RGB)
-        
-        # استخراج القنوات
-        b, g, r = cv2.split(rgb_image.astype(np.float32))
+    def detect_blood_flow(self, rgb_image: np.ndarray, image_stats: Optional[Dict] = None) -> Dict[str, float]:
+        """الكشف عن تدفق الدم (PPG - Photoplethysmography من الصورة)
+
+        image_stats: ناتج compute_image_stats لنفس الصورة إذا حُسب مسبقاً.
+        """
+        stats = image_stats or compute_image_stats(rgb_image)
+        b_std, g_std, r_std = stats['channel_stds']
         
         # حساب مؤشر التروية (Perfusion Index)
         # متوسط التباين في القنوات
-        r_variance = np.var(r)
-        g_variance = np.var(g)
-        b_variance = np.var(b)
-        
-        # مؤشر التروية - يعتمد على التغيرات في الألوان
-        perfusion_index = (r_variance + g_variance + b_variance) / 3.0
+        perfusion_index = sum(stats['channel_vars']) / 3.0
         
         # تحليل تباين الألوان - البشرة الحية لها تباين معين
-        color_variance = np.mean([
-            np.std(r.flatten()),
-            np.std(g.flatten()), 
-            np.std(b.flatten())
-        ])
+        color_variance = (b_std + g_std + r_std) / 3.0
         
         # تحليل تباين القناة الحمراء - الأكثر حساسية للدم
-        red_channel_analysis = np.std(r.flatten()) > 10  # مؤشر وجود تدفق دم
+        red_channel_analysis = r_std > 10  # مؤشر وجود تدفق دم
         
         return {
             'perfusion_index': float(perfusion_index),
@@ -93,7 +118,7 @@ class AntiSpoofingSystem:
             'blood_flow_score': 1.0 if red_channel_analysis and color_variance > 15 else 0.0
         }
     
-    def detect_texture_anomalies(self, image: np.ndarray) -> Dict[str, float]:
+    def detect_texture_anomalies(self, image: np.ndarray, image_stats: Optional[Dict] = None) -> Dict[str, float]:
         """الكشف عن شذوذ في نسيج الجلد"""
         if len(image.shape) == 3:
             gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
@@ -114,7 +139,7 @@ class AntiSpoofingSystem:
         edge_density = np.sum(edges > 0) / edges.size
         
         # تحليل التباين - البشرة الطبيعية لها تباين معين
-        contrast = cv2.Laplacian(gray, cv2.CV_64F).var()
+        contrast = (image_stats or compute_image_stats(gray))['laplacian_var']
         
         # تحليل النسيج - البشرة الحقيقية لها نمط معين
         texture_score = 0.3 if 0.1 <= texture_uniformity <= 0.4 else 0.0
@@ -184,7 +209,7 @@ class AntiSpoofingSystem:
             'printing_artifact_score': total_score
         }
     
-    def detect_2d_attack(self, image: np.ndarray) -> Dict[str, float]:
+    def detect_2d_attack(self, image: np.ndarray, image_stats: Optional[Dict] = None) -> Dict[str, float]:
         """الكشف عن محاولات الهجوم ثنائية الأبعاد (صورة مطبوعة)"""
         if len(image.shape) == 3:
             gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
@@ -192,7 +217,7 @@ class AntiSpoofingSystem:
             gray = image
         
         # تحليل التباين - الصور الحية لها تباين أفضل
-        variance = cv2.Laplacian(gray, cv2.CV_64F).var()
+        variance = (image_stats or compute_image_stats(gray))['laplacian_var']
         
         # تحليل التفاصيل - الصور الحية تحتوي على تفاصيل دقيقة
         # كشف الحواف
@@ -255,8 +280,19 @@ class AntiSpoofingSystem:
     def comprehensive_spoofing_detection(self, 
                                        rgb_image: np.ndarray,
                                        thermal_image: Optional[np.ndarray] = None,
-                                       depth_map: Optional[np.ndarray] = None) -> Dict:
-        """الكشف الشامل عن التلاعب"""
+                                       depth_map: Optional[np.ndarray] = None,
+                                       cnn_liveness_score: Optional[float] = None,
+                                       cascade: Optional[bool] = None,
+                                       image_stats: Optional[Dict] = None) -> Dict:
+        """الكشف الشامل عن التلاعب
+
+        cnn_liveness_score: درجة رأس الحيوية من PalmAnalyzer.analyze_palm (نفس
+        التمرير الأمامي لمتجه الميزات)، تُدمج بوزن cnn_liveness_weight.
+        cascade: إيقاف مبكر بعد الكواشف الرخيصة عندما يتحدد القرار (افتراضياً
+        self.cascade). تحليلات الكواشف المتخطاة None وتُذكر في skipped_detectors.
+        image_stats: ناتج compute_image_stats لنفس الصورة (من PalmAnalyzer.analyze_palm)،
+        وإلا يُحسب مرة واحدة هنا لكل الكواشف.
+        """
         # تحليل درجة الحرارة (إذا متوفر)
         temp_result = self.detect_skin_temperature(thermal_image) if thermal_image is not None else {
             'mean_temperature': 0.0,
@@ -265,32 +301,68 @@ class AntiSpoofingSystem:
             'temperature_score': 0.0
         }
         
-        # تحليل تدفق الدم
-        blood_result = self.detect_blood_flow(rgb_image)
-        
-        # تحليل النسيج
-        texture_result = self.detect_texture_anomalies(rgb_image)
-        
-        # تحليل آثار الطباعة
-        print_result = self.detect_printing_artifacts(rgb_image)
-        
-        # تحليل محاولات 2D
-        attack_result = self.detect_2d_attack(rgb_image)
-        
         # تحليل العمق (إذا متوفر)
         depth_result = self.detect_depth_anomalies(depth_map)
         
-        # حساب النتيجة الكلية
-        total_score = (
-            temp_result['temperature_score'] * 0.2 +
-            blood_result['blood_flow_score'] * 0.2 +
-            texture_result['anomaly_score'] * 0.15 +
-            print_result['printing_artifact_score'] * 0.15 +
-            attack_result['2d_attack_score'] * 0.2 +
-            depth_result['depth_score'] * 0.1
-        )
+        cascade = self.cascade if cascade is None else cascade
+        blend_cnn = cnn_liveness_score is not None and self.cnn_liveness_weight > 0
+        use_anomaly_detector = self.is_trained and self.anomaly_weight > 0
+        anomaly_result = None
+        
+        def final_score(score: float, anomaly_score: float) -> float:
+            if use_anomaly_detector:
+                score = (1 - self.anomaly_weight) * score + self.anomaly_weight * anomaly_score
+            if blend_cnn:
+                score = (1 - self.cnn_liveness_weight) * score + self.cnn_liveness_weight * cnn_liveness_score
+            return score
+        
+        def score_bounds() -> Tuple[float, float]:
+            # أدنى وأعلى نتيجة ممكنة (درجة مكتشف الشذوذ قبل حسابها في [0, 1])
+            if anomaly_result is not None:
+                low_anomaly = high_anomaly = anomaly_result['anomaly_model_score']
+            else:
+                low_anomaly, high_anomaly = 0.0, 1.0
+            return final_score(known_score, low_anomaly), final_score(known_score + remaining_weight, high_anomaly)
+        
+        def decided() -> bool:
+            low, high = score_bounds()
+            return low > DECISION_THRESHOLD or high <= DECISION_THRESHOLD
+        
+        # الكواشف على الصورة بترتيب التكلفة. في وضع التتالي يتوقف التنفيذ عندما لا يغير
+        # أي ناتج للكواشف المتبقية (كل درجة في [0, 1]) القرار
+        known_score = (temp_result['temperature_score'] * SPOOFING_WEIGHTS['temperature'] +
+                       depth_result['depth_score'] * SPOOFING_WEIGHTS['depth'])
+        remaining_weight = sum(SPOOFING_WEIGHTS[name] for name, _, _, _ in CASCADE_ORDER)
+        results = {}
+        skipped = []
+        for name, method, score_key, uses_stats in CASCADE_ORDER:
+            if cascade and decided():
+                skipped.append(name)
+                continue
+            if uses_stats:
+                # إحصائيات الصورة تُحسب مرة واحدة عند أول كاشف يحتاجها
+                image_stats = image_stats or compute_image_stats(rgb_image)
+                results[name] = getattr(self, method)(rgb_image, image_stats=image_stats)
+            else:
+                results[name] = getattr(self, method)(rgb_image)
+            known_score += results[name][score_key] * SPOOFING_WEIGHTS[name]
+            remaining_weight -= SPOOFING_WEIGHTS[name]
+        blood_result = results.get('blood_flow')
+        texture_result = results.get('texture')
+        print_result = results.get('printing')
+        attack_result = results.get('attack')
+        
+        # مكتشف الشذوذ المدرب (FFT وLBP على الصورة كاملة) هو الأعلى تكلفة فيأتي أخيراً
+        if use_anomaly_detector:
+            if cascade and decided():
+                skipped.append('anomaly_detector')
+            else:
+                anomaly_result = self.detect_feature_anomalies(rgb_image)
         
-        is_real = total_score > 0.6
+        # الكواشف المتخطاة تُحسب بصفر، فالنتيجة هي الحد الأدنى الممكن ولها نفس القرار
+        total_score, score_upper_bound = score_bounds()
+        
+        is_real = total_score > DECISION_THRESHOLD
         
         return {
             'is_real': is_real,
@@ -302,77 +374,106 @@ class AntiSpoofingSystem:
             'printing_analysis': print_result,
             'attack_analysis': attack_result,
             'depth_analysis': depth_result,
+            'anomaly_analysis': anomaly_result,
+            'cnn_liveness_score': cnn_liveness_score,
+            'score_upper_bound': score_upper_bound,
+            'skipped_detectors': skipped,
             'detailed_report': {
                 'temperature_valid': temp_result['temperature_valid'],
-                'blood_flow_detected': blood_result['red_channel_valid'],
-                'texture_normal': texture_result['anomaly_score'] > 0.5,
-                'no_printing_artifacts': print_result['printing_artifact_score'] > 0.5,
-                'not_2d_attack': attack_result['2d_attack_score'] > 0.5,
-                'depth_valid': depth_result['depth_available'] and depth_result['depth_score'] > 0.5
+                'blood_flow_detected': blood_result['red_channel_valid'] if blood_result else None,
+                'texture_normal': texture_result['anomaly_score'] > 0.5 if texture_result else None,
+                'no_printing_artifacts': print_result['printing_artifact_score'] > 0.5 if print_result else None,
+                'not_2d_attack': attack_result['2d_attack_score'] > 0.5 if attack_result else None,
+                'depth_valid': depth_result['depth_available'] and depth_result['depth_score'] > 0.5,
+                'no_feature_anomaly': anomaly_result['is_inlier'] if anomaly_result else None
             }
         }
     
-    def train_anomaly_detector(self, genuine_samples: List[np.ndarray], fake_samples: List[np.ndarray]):
-        """تدريب مكتشف الشذوذ"""
-        # استخراج ميزات من العينات
-        genuine_features = []
-        fake_features = []
-        
-        for sample in genuine_samples:
-            features = self._extract_spoofing_features(sample)
-            genuine_features.append(features)
-        
-        for sample in fake_samples:
-            features = self._extract_spoofing_features(sample)
-            fake_features.append(features)
-        
-        # دمج البيانات
-        all_features = genuine_features + fake_features
-        X = np.array(all_features)
+    def train_anomaly_detector(self, genuine_samples: List[np.ndarray], fake_samples: Optional[List[np.ndarray]] = None,
+                               n_workers: Optional[int] = None) -> Dict[str, float]:
+        """تدريب مكتشف الشذوذ على العينات الحقيقية فقط
+
+        IsolationForest يتعلم توزيع العينات الطبيعية، فالعينات المزيفة لا تدخل التدريب
+        (وإلا صارت جزءاً من "الطبيعي" ورفعت درجتها). تُستخدم fake_samples للتحقق فقط:
+        نسبة المزيفة المرفوضة مقابل نسبة الحقيقية المقبولة. العينات صور أو مسارات صور؛
+        الميزات تُستخرج بمجمع عمليات (n_workers، 1 للتسلسلي).
+        """
+        genuine_samples, fake_samples = list(genuine_samples), list(fake_samples or [])
+        # استخراج ميزات الفئتين بمجمع واحد
+        X = self.extract_spoofing_features_batch(genuine_samples + fake_samples, n_workers)
+        X_genuine = X[:len(genuine_samples)]
+        X_genuine = X_genuine[~np.isnan(X_genuine).any(axis=1)]
+        X_fake = X[len(genuine_samples):]
+        X_fake = X_fake[~np.isnan(X_fake).any(axis=1)]
+        if len(X_genuine) < 2:
+            raise ValueError("يحتاج مكتشف الشذوذ إلى عينتين حقيقيتين مقروءتين على الأقل")
         
         # تدريب مكتشف الشذوذ
-        self.anomaly_detector.fit(X)
+        self.anomaly_detector.fit(X_genuine)
         self.is_trained = True
         
-        self.logger.info(f"تم تدريب مكتشف الشذوذ مع {len(genuine_samples)} عينات حقيقية و{len(fake_samples)} عينات مزيفة")
+        report = {
+            'n_genuine': len(X_genuine),
+            'n_fake': len(X_fake),
+            'genuine_acceptance_rate': float(np.mean(self.anomaly_scores(X_genuine) > 0.5))
+        }
+        if len(X_fake):
+            report['fake_rejection_rate'] = float(np.mean(self.anomaly_scores(X_fake) <= 0.5))
+        self.logger.info(f"تم تدريب مكتشف الشذوذ على {len(X_genuine)} عينة حقيقية: {report}")
+        return report
     
     def _extract_spoofing_features(self, image: np.ndarray) -> List[float]:
         """استخراج ميزات للكشف عن التلاعب"""
-        features = []
-        
-        # ميزات التباين
-        if len(image.shape) == 3:
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        else:
-            gray = image
-        
-        variance = cv2.Laplacian(gray, cv2.CV_64F).var()
-        features.append(variance)
-        
-        # ميزات الحواف
-        edges = cv2.Canny(gray, 50, 150)
-        edge_density = np.sum(edges > 0) / edges.size
-        features.append(edge_density)
-        
-        # ميزات التردد
-        f_transform = np.fft.fft2(gray)
-        magnitude_spectrum = np.log(np.abs(f_transform) + 1)
-        freq_energy = np.mean(magnitude_spectrum)
-        features.append(freq_energy)
-        
-        # ميزات النسيج
-        lbp = local_binary_pattern(gray, P=8, R=1, method='uniform')
-        hist, _ = np.histogram(lbp.ravel(), bins=10, range=(0, 10), density=True)
-        texture_features = list(hist)
-        features.extend(texture_features)
-        
-        return features
+        return extract_spoofing_features(image).tolist()
+    
+    def extract_spoofing_features_batch(self, samples: List, n_workers: Optional[int] = None) -> np.ndarray:
+        """ميزات دفعة من الصور أو المسارات كمصفوفة ثنائية الأبعاد (صف لكل عينة)"""
+        return extract_spoofing_features_batch(samples, n_workers=n_workers)
+    
+    def anomaly_scores(self, features: np.ndarray) -> np.ndarray:
+        """درجات مكتشف الشذوذ لمصفوفة ميزات دفعة واحدة في [0, 1] (> 0.5 عينة طبيعية)
+
+        decision_function موجبة للعينات الطبيعية وسالبة للشاذة، ومداها العملي ±0.5.
+        """
+        if not self.is_trained:
+            raise ValueError("مكتشف الشذوذ غير مدرب")
+        return np.clip(0.5 + self.anomaly_detector.decision_function(np.atleast_2d(features)), 0.0, 1.0)
+    
+    def detect_feature_anomalies(self, image: np.ndarray) -> Dict[str, float]:
+        """تقييم صورة بمكتشف الشذوذ المدرب"""
+        features = extract_spoofing_features(image)
+        score = float(self.anomaly_scores(features)[0])
+        return {
+            'anomaly_model_score': score,
+            'is_inlier': score > 0.5
+        }
+    
+    def save_anomaly_detector(self, filepath: str) -> None:
+        """حفظ مكتشف الشذوذ المدرب حتى لا يُعاد تدريبه عند كل تشغيل"""
+        if not self.is_trained:
+            raise ValueError("مكتشف الشذوذ غير مدرب")
+        with open(filepath, 'wb') as f:
+            pickle.dump({
+                'anomaly_detector': self.anomaly_detector,
+                'n_features': N_SPOOFING_FEATURES
+            }, f)
+        self.logger.info(f"تم حفظ مكتشف الشذوذ في {filepath}")
+    
+    def load_anomaly_detector(self, filepath: str) -> None:
+        """تحميل مكتشف شذوذ محفوظ"""
+        with open(filepath, 'rb') as f:
+            data = pickle.load(f)
+        if data['n_features'] != N_SPOOFING_FEATURES:
+            raise ValueError(f"عدد ميزات المكتشف المحفوظ {data['n_features']} لا يطابق {N_SPOOFING_FEATURES}")
+        self.anomaly_detector = data['anomaly_detector']
+        self.is_trained = True
+        self.logger.info(f"تم تحميل مكتشف الشذوذ من {filepath}")
 
 class AdvancedAntiSpoofingSystem(AntiSpoofingSystem):
     """نظام مكافحة تزوير متقدم مع دعم للتعلم العميق"""
     
-    def __init__(self):
-        super().__init__()
+    def __init__(self, build_cnn_detector: bool = True):
+        super().__init__(build_cnn_detector)
         self.temporal_analyzer = TemporalPatternAnalyzer()
         
     def analyze_temporal_consistency(self, image_sequence: List[np.ndarray]) -> Dict[str, float]:
@@ -469,6 +570,106 @@ class TemporalPatternAnalyzer:
             'sequence_length': len(image_sequence)
         }
 
+class StreamingTemporalAnalyzer:
+    """محلل زمني تدفقي: push(frame) لكل إطار وresult() في أي لحظة
+
+    بديل لـ TemporalPatternAnalyzer.analyze_sequence بذاكرة ثابتة: يحتفظ بالإطار
+    السابق فقط ومجاميع الحركة والارتباط، بدون تكديس الإطارات. كل إطار يُحجَّم إلى
+    حجم التحليل الذي يحدده الإطار الأول، فلا تُتخطى أزواج إطارات بأحجام مختلفة.
+
+    الافتراضي (frame_size=None) يحلل بدقة الإطار الأول فتطابق القيم analyze_sequence
+    وعتباتها. frame_size يصغّر الإطارات (الضلع الأطول) لتسريع التحليل، لكن التصغير
+    بـ INTER_AREA يخفض الضوضاء فيخفض متوسط الحركة ويغير الارتباط، ولذلك يجب معايرة
+    motion_range وmin_consistency لذلك الحجم على التقاطات حقيقية.
+    """
+    
+    def __init__(self, frame_size: Optional[int] = None, motion_range: Tuple[float, float] = (5.0, 50.0),
+                 min_consistency: float = 0.7):
+        self.frame_size = frame_size
+        self.motion_range = motion_range
+        self.min_consistency = min_consistency
+        self.reset()
+    
+    def reset(self) -> None:
+        self.frame_count = 0
+        self.pairs = 0
+        self._analysis_shape = None
+        self._previous = None
+        self._previous_centered = None
+        self._previous_norm = 0.0
+        self._motion_sum = 0.0
+        self._consistency_sum = 0.0
+    
+    def _prepare(self, frame: np.ndarray) -> np.ndarray:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if len(frame.shape) == 3 else frame
+        if self._analysis_shape is None:
+            height, width = gray.shape[:2]
+            scale = self.frame_size / max(height, width) if self.frame_size else 1.0
+            if scale < 1:
+                height, width = max(1, int(round(height * scale))), max(1, int(round(width * scale)))
+            self._analysis_shape = (height, width)
+        if gray.shape[:2] != self._analysis_shape:
+            height, width = self._analysis_shape
+            shrinking = height * width < gray.shape[0] * gray.shape[1]
+            gray = cv2.resize(gray, (width, height), interpolation=cv2.INTER_AREA if shrinking else cv2.INTER_LINEAR)
+        return gray.astype(np.float32)
+    
+    def push(self, frame: np.ndarray) -> None:
+        """إضافة إطار وتحديث المجاميع مع الإطار السابق"""
+        current = self._prepare(frame)
+        centered = current - current.mean()
+        norm = float(np.linalg.norm(centered))
+        
+        if self._previous is not None:
+            self._motion_sum += float(np.mean(np.abs(current - self._previous)))
+            # ارتباط بيرسون من الإطارين الممركزين (مكافئ np.corrcoef)
+            denominator = norm * self._previous_norm
+            correlation = float(np.dot(centered.ravel(), self._previous_centered.ravel()) / denominator) \
+                if denominator > 0 else 0.0
+            self._consistency_sum += abs(correlation)
+            self.pairs += 1
+        
+        self._previous = current
+        self._previous_centered = centered
+        self._previous_norm = norm
+        self.frame_count += 1
+    
+    def result(self) -> Dict[str, float]:
+        """النتيجة حتى الإطار الأخير (بنفس صيغة analyze_sequence)
+
+        بدون أي زوج إطارات تكون كل الدرجات صفراً (فشل مغلق) بدلاً من 1.0.
+        """
+        if self.pairs == 0:
+            return {
+                'temporal_consistency': 0.0,
+                'motion_validity': 0.0,
+                'avg_motion': 0.0,
+                'temporal_score': 0.0,
+                'sequence_length': self.frame_count
+            }
+        
+        avg_motion = self._motion_sum / self.pairs
+        avg_consistency = self._consistency_sum / self.pairs
+        
+        low, high = self.motion_range
+        motion_validity = 0.3 if low < avg_motion < high else 0.0
+        consistency_score = avg_consistency if avg_consistency > self.min_consistency else 0.0
+        temporal_score = (motion_validity + consistency_score) / 2.0
+        
+        return {
+            'temporal_consistency': float(avg_consistency),
+            'motion_validity': float(motion_validity),
+            'avg_motion': float(avg_motion),
+            'temporal_score': float(temporal_score),
+            'sequence_length': self.frame_count
+        }
+    
+    def is_live(self) -> bool:
+        """حركة طبيعية مع تماسك بين الإطارات (الصورة المطبوعة الثابتة بلا حركة)؛ False بدون أزواج"""
+        result = self.result()
+        return self.pairs > 0 and result['motion_validity'] > 0 and \
+            result['temporal_consistency'] > self.min_consistency
+
 # مثال على الاستخدام
 if __name__ == "__main__":
     spoofing_system = AdvancedAntiSpoofingSystem()
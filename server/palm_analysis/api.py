@@ -7,35 +7,215 @@ import numpy as np
 import cv2
 import requests
 from io import BytesIO
+from runtime_config import configure_runtime, get_runtime_config
+# خيوط TensorFlow وOpenCV وoneDNN لكل عامل قبل تحميل TensorFlow (PALM_WORKERS)
+RUNTIME_CONFIG = configure_runtime()
 from palm_analyzer import PalmAnalyzer
+from backbones import DEFAULT_PROFILE, select_model_profile
 from image_processor import PalmImageProcessor
-from biometric_matcher import AdvancedBiometricMatcher
-from anti_spoofing import AdvancedAntiSpoofingSystem
+from biometric_matcher import AdvancedBiometricMatcher, ConcurrentGallery
+from enrollment_log import EnrollmentLog
+from template_store import TemplateStore
+from anti_spoofing import AdvancedAntiSpoofingSystem, StreamingTemporalAnalyzer
+from quality_gate import quality_precheck, decode_reduced
 import base64
 import logging
-from typing import Dict, Any
+import os
+import signal
+import time
+import threading
+import tempfile
+from typing import Dict, Any, Optional, Tuple, Iterator, List
 
 app = Flask(__name__)
 CORS(app)
 
 # تهيئة أنظمة التحليل
-palm_analyzer = PalmAnalyzer()
+# ملف تعريف النموذج: صريح، أو أدق ملف ضمن ميزانية زمن الطلب (مللي ثانية)
+MODEL_PROFILE = os.environ.get('PALM_MODEL_PROFILE')
+if not MODEL_PROFILE and os.environ.get('PALM_LATENCY_BUDGET_MS'):
+    MODEL_PROFILE = select_model_profile(float(os.environ['PALM_LATENCY_BUDGET_MS']))
+palm_analyzer = PalmAnalyzer(profile=MODEL_PROFILE or DEFAULT_PROFILE)
+# ذاكرة مؤقتة للميزات: الصور المكررة (إعادة التسجيل والمحاولات) تتجاوز CNN
+EMBEDDING_CACHE_SIZE = int(os.environ.get('PALM_EMBEDDING_CACHE_SIZE', '1024'))
+if EMBEDDING_CACHE_SIZE > 0:
+    palm_analyzer.enable_embedding_cache(EMBEDDING_CACHE_SIZE, disk_path=os.environ.get('PALM_EMBEDDING_CACHE_DIR'))
+# محرك TFLite مكمم اختياري لخوادم CPU (ملف من tflite_backend.convert_palm_models)
+if os.environ.get('PALM_TFLITE_MODEL'):
+    palm_analyzer.use_tflite(os.environ['PALM_TFLITE_MODEL'],
+                             num_threads=int(os.environ.get('PALM_TFLITE_THREADS', '0'))
+                             or RUNTIME_CONFIG['intra_op_threads'] or None)
 image_processor = PalmImageProcessor()
 biometric_matcher = AdvancedBiometricMatcher()
-anti_spoofing_system = AdvancedAntiSpoofingSystem()
+# المعرض المحفوظ بملف نموذج آخر يُرفض عند التحميل (متجهات غير متوافقة)
+biometric_matcher.model_profile = palm_analyzer.profile
+# سياسة قوالب المستخدم (يُطبق بعد تحميل المعرض): 'append' افتراضياً، و'cluster' يدمج
+# عينات كل مستخدم في حتى PALM_TEMPLATES_PER_USER قالباً ممثلاً موزوناً بالجودة
+TEMPLATE_POLICY = os.environ.get('PALM_TEMPLATE_POLICY', 'append')
+TEMPLATES_PER_USER = int(os.environ.get('PALM_TEMPLATES_PER_USER', '3'))
+# درجة حيوية CNN تأتي من رأس الحيوية في PalmAnalyzer، فلا يُبنى نموذج تزوير منفصل
+anti_spoofing_system = AdvancedAntiSpoofingSystem(build_cnn_detector=False)
+anti_spoofing_system.cnn_liveness_weight = float(os.environ.get('PALM_CNN_LIVENESS_WEIGHT', '0'))
+# إيقاف مبكر لكواشف التزوير عندما يتحدد القرار (livenessScore يصبح الحد الأدنى للنتيجة)
+anti_spoofing_system.cascade = os.environ.get('PALM_SPOOFING_CASCADE', '0') == '1'
+# مكتشف شذوذ IsolationForest مدرب مسبقاً (save_anomaly_detector) يُدمج بوزن PALM_ANOMALY_WEIGHT
+if os.environ.get('PALM_ANOMALY_MODEL'):
+    anti_spoofing_system.load_anomaly_detector(os.environ['PALM_ANOMALY_MODEL'])
+    anti_spoofing_system.anomaly_weight = float(os.environ.get('PALM_ANOMALY_WEIGHT', '0.2'))
+# رفض الالتقاطات الضبابية أو سيئة التعريض أو بدون كف قبل فك الترميز الكامل وCNN
+# (معطل افتراضياً حتى تُعاير العتبات على التقاطات حقيقية لكل جهاز)
+QUALITY_GATE_ENABLED = os.environ.get('PALM_QUALITY_GATE', '0') == '1'
+# أخذ عينات الإطارات للتحليل الزمني التدفقي (إطار/ثانية وأقصى عدد إطارات لكل طلب)
+STREAM_SAMPLE_FPS = float(os.environ.get('PALM_STREAM_SAMPLE_FPS', '5'))
+STREAM_MAX_FRAMES = int(os.environ.get('PALM_STREAM_MAX_FRAMES', '30'))
 
 # تمكين التسجيل
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def download_image_from_url(url: str) -> np.ndarray:
-    """تحميل صورة من رابط"""
+# تحميل المعرض المحفوظ (معنون في الذاكرة ومشترك بين العمليات)
+GALLERY_PATH = os.environ.get('PALM_GALLERY_PATH')
+if GALLERY_PATH and os.path.isdir(GALLERY_PATH):
+    biometric_matcher.load_gallery(GALLERY_PATH)
+    if biometric_matcher.template_policy != TEMPLATE_POLICY:
+        logger.warning(f"المعرض المحفوظ بسياسة القوالب '{biometric_matcher.template_policy}'؛ "
+                       f"تُطبق PALM_TEMPLATE_POLICY='{TEMPLATE_POLICY}' على التسجيلات الجديدة")
+# إعداد البيئة يغلب السياسة المحفوظة في المعرض، ويُطبق قبل إعادة تشغيل سجل التسجيل
+biometric_matcher.set_template_policy(TEMPLATE_POLICY, TEMPLATES_PER_USER)
+
+# سجل التسجيل المسبق: إعادة تشغيل التسجيلات غير المضمّنة في آخر لقطة
+ENROLLMENT_LOG_PATH = os.environ.get('PALM_ENROLLMENT_LOG')
+COMPACTION_INTERVAL = float(os.environ.get('PALM_COMPACTION_INTERVAL', '300'))
+enrollment_log = EnrollmentLog(ENROLLMENT_LOG_PATH) if ENROLLMENT_LOG_PATH else None
+enrollment_lock = threading.Lock()
+if enrollment_log is not None:
+    enrollment_log.replay(biometric_matcher.add_palm_sample, after_sequence=biometric_matcher.enrollment_sequence)
+    # لا يعود التسلسل للخلف: اللقطة قد تكون أحدث من السجل (سجل مفقود أو مستبدل)
+    enrollment_log.advance_to(biometric_matcher.enrollment_sequence)
+    biometric_matcher.enrollment_sequence = max(biometric_matcher.enrollment_sequence, enrollment_log.last_sequence)
+
+# مستودع القوالب المشترك بين العمال: تحميل كامل عند التشغيل ثم مزامنة تزايدية
+TEMPLATE_STORE_PATH = os.environ.get('PALM_TEMPLATE_STORE')
+STORE_SYNC_INTERVAL = float(os.environ.get('PALM_STORE_SYNC_INTERVAL', '2'))
+template_store = TemplateStore(TEMPLATE_STORE_PATH) if TEMPLATE_STORE_PATH else None
+if template_store is not None:
+    biometric_matcher.sync_from_store(template_store)
+    if enrollment_log is not None:
+        logger.warning("PALM_TEMPLATE_STORE مضبوط: التسجيلات الجديدة تُكتب إلى المستودع وليس إلى PALM_ENROLLMENT_LOG")
+
+# المعرض المشترك بين الخيوط: القراءة من لقطات ثابتة والكتابة بدفعات
+palm_gallery = ConcurrentGallery(biometric_matcher, template_store=template_store, enrollment_log=enrollment_log)
+
+def _reload_gallery(signum, frame):
+    """إعادة تحميل المعرض في الخلفية عند استلام SIGHUP"""
+    if GALLERY_PATH and os.path.isdir(GALLERY_PATH):
+        palm_gallery.reload_async(GALLERY_PATH)
+
+def install_signal_handlers() -> bool:
+    """تسجيل SIGHUP لإعادة تحميل المعرض (من الخيط الرئيسي فقط، مثلاً post_worker_init في gunicorn)"""
+    if not hasattr(signal, 'SIGHUP') or threading.current_thread() is not threading.main_thread():
+        return False
+    signal.signal(signal.SIGHUP, _reload_gallery)
+    return True
+
+def compact_enrollments() -> None:
+    """حفظ لقطة المعرض وحذف سجلات التسجيل المضمّنة فيها (حتى enrollment_sequence للقطة فقط)"""
+    if enrollment_log is None or not GALLERY_PATH:
+        return
+    palm_gallery.compact_log(GALLERY_PATH)
+
+def _compaction_loop() -> None:
+    while True:
+        time.sleep(COMPACTION_INTERVAL)
+        try:
+            compact_enrollments()
+        except Exception as e:
+            logger.error(f"خطأ في ضغط سجل التسجيل: {str(e)}")
+
+if enrollment_log is not None and GALLERY_PATH:
+    threading.Thread(target=_compaction_loop, daemon=True).start()
+
+def _store_sync_loop() -> None:
+    while True:
+        time.sleep(STORE_SYNC_INTERVAL)
+        try:
+            palm_gallery.sync_store()
+        except Exception as e:
+            logger.error(f"خطأ في مزامنة مستودع القوالب: {str(e)}")
+
+if template_store is not None:
+    threading.Thread(target=_store_sync_loop, daemon=True).start()
+
+def download_image_bytes(url: str) -> bytes:
+    """تحميل محتوى صورة من رابط"""
     response = requests.get(url)
     response.raise_for_status()
-    image_array = np.asarray(bytearray(response.content), dtype=np.uint8)
+    return response.content
+
+def download_image_from_url(url: str) -> np.ndarray:
+    """تحميل صورة من رابط"""
+    image_array = np.asarray(bytearray(download_image_bytes(url)), dtype=np.uint8)
     image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
     return image
 
+def load_palm_image(url: str) -> Tuple[Optional[np.ndarray], Optional[Dict]]:
+    """تحميل الصورة مع فحص الجودة على فك ترميز مصغّر قبل فك الترميز الكامل
+
+    يعيد (الصورة، تقرير الفحص). عند الرفض تكون الصورة None ولا يُدفع فك الترميز
+    الكامل ولا استدلال CNN.
+    """
+    data = download_image_bytes(url)
+    quality_gate = None
+    if QUALITY_GATE_ENABLED:
+        preview, full_size = decode_reduced(data)
+        if preview is None:
+            return None, None
+        quality_gate = quality_precheck(preview, full_size)
+        if not quality_gate['passed']:
+            return None, quality_gate
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return image, quality_gate
+
+def sample_video_frames(data: bytes) -> Iterator[np.ndarray]:
+    """إطارات فيديو قصير بمعدل STREAM_SAMPLE_FPS: الإطارات المتخطاة تُقرأ بـ grab دون تحويلها"""
+    fd, path = tempfile.mkstemp(suffix='.mp4')
+    capture = None
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        capture = cv2.VideoCapture(path)
+        fps = capture.get(cv2.CAP_PROP_FPS) or STREAM_SAMPLE_FPS
+        step = max(1, int(round(fps / STREAM_SAMPLE_FPS)))
+        index = sampled = 0
+        while sampled < STREAM_MAX_FRAMES and capture.grab():
+            if index % step == 0:
+                ok, frame = capture.retrieve()
+                if ok:
+                    sampled += 1
+                    yield frame
+            index += 1
+    finally:
+        if capture is not None:
+            capture.release()
+        os.remove(path)
+
+def sample_frame_urls(urls: List[str], step: int = 1) -> Iterator[np.ndarray]:
+    """تدفق إطارات من روابط: كل step إطار، بدقة كاملة كإطارات الفيديو
+
+    عتبات StreamingTemporalAnalyzer (الحركة والاتساق) معايرة على الدقة الكاملة، فلا
+    يُستخدم فك الترميز المصغّر هنا وإلا اختلف القرار لنفس المقطع حسب مسار الإدخال.
+    """
+    for url in urls[::step][:STREAM_MAX_FRAMES]:
+        frame = cv2.imdecode(np.frombuffer(download_image_bytes(url), dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is not None:
+            yield frame
+
+def quality_rejection(quality_gate: Optional[Dict]):
+    """رد الرفض عند فشل فحص الجودة، أو None"""
+    if quality_gate is None or quality_gate['passed']:
+        return None
+    return jsonify({'error': 'جودة صورة بصمة الكف غير كافية', 'qualityGate': quality_gate}), 400
+
 def validate_palm_image(image: np.ndarray) -> bool:
     """التحقق من صلاحية صورة بصمة الكف"""
     if image is None:
@@ -63,8 +243,11 @@ def analyze_palm():
         image_url = data['imageUrl']
         user_id = data.get('userId', None)
         
-        # تحميل الصورة
-        image = download_image_from_url(image_url)
+        # تحميل الصورة (فحص الجودة على إطار مصغّر أولاً)
+        image, quality_gate = load_palm_image(image_url)
+        rejection = quality_rejection(quality_gate)
+        if rejection is not None:
+            return rejection
         
         if not validate_palm_image(image):
             return jsonify({'error': 'صورة بصمة الكف غير صالحة'}), 400
@@ -76,7 +259,9 @@ def analyze_palm():
         enhanced_features = image_processor.extract_palm_features_advanced(image)
         
         # التحقق من التزوير
-        spoofing_result = anti_spoofing_system.comprehensive_spoofing_detection(image)
+        spoofing_result = anti_spoofing_system.comprehensive_spoofing_detection(
+            image, cnn_liveness_score=analysis_result['cnn_liveness_score'],
+            image_stats=analysis_result['image_stats'])
         
         # التحقق من جودة الصورة
         quality_score = analysis_result['quality_score']
@@ -103,6 +288,7 @@ def analyze_palm():
                 'liveness': analysis_result['liveness'],
                 'quality': analysis_result['quality_score'],
                 'confidence': analysis_result['confidence'],
+                'qualityGate': quality_gate,
                 'spoofingDetection': spoofing_result
             }
         }
@@ -129,8 +315,11 @@ def register_palm():
         image_url = data['imageUrl']
         user_id = data['userId']
         
-        # تحميل الصورة
-        image = download_image_from_url(image_url)
+        # تحميل الصورة (فحص الجودة على إطار مصغّر أولاً)
+        image, quality_gate = load_palm_image(image_url)
+        rejection = quality_rejection(quality_gate)
+        if rejection is not None:
+            return rejection
         
         if not validate_palm_image(image):
             return jsonify({'error': 'صورة بصمة الكف غير صالحة'}), 400
@@ -139,14 +328,29 @@ def register_palm():
         analysis_result = palm_analyzer.analyze_palm(image)
         
         # التحقق من التزوير
-        spoofing_result = anti_spoofing_system.comprehensive_spoofing_detection(image)
+        spoofing_result = anti_spoofing_system.comprehensive_spoofing_detection(
+            image, cnn_liveness_score=analysis_result['cnn_liveness_score'],
+            image_stats=analysis_result['image_stats'])
         
         if not spoofing_result['is_real']:
             return jsonify({'error': 'تم اكتشاف تزوير - الصورة ليست حقيقية'}), 400
         
         # إضافة العينة إلى نظام المطابقة
         feature_vector = np.array(analysis_result['features'])
-        biometric_matcher.add_palm_sample(feature_vector, f'user_{user_id}', user_id)
+        quality = analysis_result['quality_score']
+        sequence = None
+        if template_store is not None:
+            # المستودع دائم (commit لكل تسجيل) ويحل محل سجل التسجيل؛ النشر إلى المعرض
+            # بدفعات من _store_sync_loop كل PALM_STORE_SYNC_INTERVAL ثانية لكل العمال
+            template_store.add(feature_vector, f'user_{user_id}', user_id, quality)
+        else:
+            with enrollment_lock:
+                sequence = enrollment_log.append(feature_vector, f'user_{user_id}', user_id, quality, wait_durable=False) \
+                    if enrollment_log is not None else None
+                palm_gallery.add_palm_sample(feature_vector, f'user_{user_id}', user_id, quality, sequence=sequence)
+        if sequence is not None:
+            # fsync مجمّع مع التسجيلات المتزامنة الأخرى
+            enrollment_log.wait_durable(sequence)
         
         result = {
             'success': True,
@@ -175,8 +379,11 @@ def verify_palm():
         image_url = data['imageUrl']
         user_id = data['userId']
         
-        # تحميل الصورة
-        image = download_image_from_url(image_url)
+        # تحميل الصورة (فحص الجودة على إطار مصغّر أولاً)
+        image, quality_gate = load_palm_image(image_url)
+        rejection = quality_rejection(quality_gate)
+        if rejection is not None:
+            return rejection
         
         if not validate_palm_image(image):
             return jsonify({'error': 'صورة بصمة الكف غير صالحة'}), 400
@@ -185,14 +392,17 @@ def verify_palm():
         analysis_result = palm_analyzer.analyze_palm(image)
         
         # التحقق من التزوير
-        spoofing_result = anti_spoofing_system.comprehensive_spoofing_detection(image)
+        spoofing_result = anti_spoofing_system.comprehensive_spoofing_detection(
+            image, cnn_liveness_score=analysis_result['cnn_liveness_score'],
+            image_stats=analysis_result['image_stats'])
         
         if not spoofing_result['is_real']:
             return jsonify({'error': 'تم اكتشاف تزوير - الصورة ليست حقيقية'}), 400
         
         # مطابقة بصمة الكف
         feature_vector = np.array(analysis_result['features'])
-        match_result = biometric_matcher.match_palm_print(feature_vector)
+        match_result = palm_gallery.match_palm_print(feature_vector)
+        palm_gallery.record_match(match_result)
         
         is_verified = match_result['is_match'] and match_result['match_details']['user_id'] == user_id
         
@@ -217,6 +427,49 @@ def verify_palm():
         logger.error(f"خطأ في التحقق من بصمة الكف: {str(e)}")
         return jsonify({'error': 'حدث خطأ أثناء التحقق من بصمة الكف'}), 500
 
+@app.route('/api/palm-liveness-stream', methods=['POST'])
+def liveness_stream():
+    """التحليل الزمني لمكافحة التزوير على فيديو قصير أو تدفق إطارات بذاكرة ثابتة"""
+    try:
+        data = request.get_json()
+        
+        if not data or ('videoUrl' not in data and 'frameUrls' not in data):
+            return jsonify({'error': 'رابط الفيديو أو روابط الإطارات مطلوبة'}), 400
+        
+        if 'videoUrl' in data:
+            frames = sample_video_frames(download_image_bytes(data['videoUrl']))
+        else:
+            frame_step = data.get('frameStep', 1)
+            if not isinstance(data['frameUrls'], list):
+                return jsonify({'error': 'frameUrls يجب أن تكون قائمة روابط'}), 400
+            if isinstance(frame_step, bool) or not isinstance(frame_step, int) or frame_step < 1:
+                return jsonify({'error': 'frameStep يجب أن يكون عدداً صحيحاً موجباً'}), 400
+            frames = sample_frame_urls(data['frameUrls'], frame_step)
+        
+        # كل إطار يُحلل عند وصوله ثم يُترك
+        temporal_analyzer = StreamingTemporalAnalyzer()
+        for frame in frames:
+            temporal_analyzer.push(frame)
+        
+        # بدون زوج إطارات واحد على الأقل لا يوجد دليل حيوية
+        if temporal_analyzer.pairs < 1:
+            return jsonify({'error': 'عدد الإطارات غير كاف للتحليل الزمني'}), 400
+        
+        temporal_result = temporal_analyzer.result()
+        
+        return jsonify({
+            'isLive': temporal_analyzer.is_live(),
+            'temporalScore': temporal_result['temporal_score'],
+            'framesAnalyzed': temporal_result['sequence_length'],
+            'temporalAnalysis': temporal_result
+        }), 200
+        
+    except requests.exceptions.RequestException:
+        return jsonify({'error': 'لا يمكن تحميل الفيديو أو الإطارات من الروابط المحددة'}), 400
+    except Exception as e:
+        logger.error(f"خطأ في التحليل الزمني: {str(e)}")
+        return jsonify({'error': 'حدث خطأ أثناء التحليل الزمني'}), 500
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """التحقق من صحة الخدمة"""
@@ -227,8 +480,23 @@ def health_check():
             'image_processor': True,
             'biometric_matcher': True,
             'anti_spoofing': True
-        }
+        },
+        'runtime': get_runtime_config()
     }), 200
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """إحصائيات المطابقة التراكمية"""
+    result = {
+        'matching': palm_gallery.get_matching_statistics(),
+        'model_profile': palm_analyzer.profile
+    }
+    if template_store is not None:
+        result['template_store'] = template_store.get_store_info()
+    if palm_analyzer.embedding_cache is not None:
+        result['embedding_cache'] = palm_analyzer.embedding_cache.get_stats()
+    return jsonify(result), 200
+
 if __name__ == '__main__':
+    install_signal_handlers()
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,52 @@
+"""
+الهياكل الأساسية (Backbones) لنماذج بصمة الكف وملفات تعريف النماذج حسب ميزانية الزمن
+"""
+from tensorflow.keras.layers import Conv2D, SeparableConv2D, BatchNormalization, Activation
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ملفات تعريف النماذج مرتبة من الأدق إلى الأسرع. reference_latency_ms هو زمن p50
+# لصورة واحدة على نواة CPU واحدة (benchmarks/bench_profiles.py، جدول README)،
+# ويُستخدم عند اختيار الملف دون قياس
+MODEL_PROFILES: Dict[str, Dict] = {
+    'standard': {'input_size': 224, 'backbone': 'conv', 'reference_latency_ms': 19.5},
+    'compact_160': {'input_size': 160, 'backbone': 'separable', 'reference_latency_ms': 4.3},
+    'compact_128': {'input_size': 128, 'backbone': 'separable', 'reference_latency_ms': 2.9},
+}
+DEFAULT_PROFILE = 'standard'
+
+# (عدد المرشحات، الخطوة) لكل كتلة قابلة للفصل بعد طبقة الدخول
+SEPARABLE_BLOCKS = ((64, 1), (128, 2), (128, 1), (256, 2), (256, 1), (512, 2))
+
+def compact_separable_trunk(inputs, stem_filters: int = 32):
+    """جذع خفيف بطبقات التفاف قابلة للفصل عمقياً (Depthwise-Separable)
+
+    طبقة دخول بخطوة 2 ثم كتل SeparableConv2D + BatchNorm + ReLU. الخرج خريطة
+    بدقة 1/16 من الإدخال تُجمّع بـ GlobalAveragePooling2D بدلاً من Flatten.
+    زخم BatchNorm 0.9 لتستقر الإحصائيات المتحركة مع مجموعات تسجيل صغيرة.
+    """
+    x = Conv2D(stem_filters, (3, 3), strides=2, padding='same', use_bias=False)(inputs)
+    x = BatchNormalization(momentum=0.9)(x)
+    x = Activation('relu')(x)
+    for filters, stride in SEPARABLE_BLOCKS:
+        x = SeparableConv2D(filters, (3, 3), strides=stride, padding='same', use_bias=False)(x)
+        x = BatchNormalization(momentum=0.9)(x)
+        x = Activation('relu')(x)
+    return x
+
+def select_model_profile(latency_budget_ms: float, latencies: Optional[Dict[str, float]] = None) -> str:
+    """أدق ملف تعريف يقع زمنه ضمن ميزانية الطلب
+
+    latencies: أزمنة مقاسة على هذا الخادم (مثلاً من bench_profiles)، وإلا تُستخدم
+    الأزمنة المرجعية. إذا لم يقع أي ملف ضمن الميزانية يُختار الأسرع.
+    """
+    latencies = latencies or {name: profile['reference_latency_ms'] for name, profile in MODEL_PROFILES.items()}
+    selected = next((name for name in MODEL_PROFILES if name in latencies and latencies[name] <= latency_budget_ms),
+                    None) or min(latencies, key=latencies.get)
+    if selected != DEFAULT_PROFILE:
+        # الجذوع المدمجة أقل دقة بكثير بعد تدريب قصير، ومتجهاتها غير متوافقة مع المعرض الحالي
+        logger.warning(f"ميزانية {latency_budget_ms} ms اختارت الملف المدمج '{selected}' بدلاً من "
+                       f"'{DEFAULT_PROFILE}': دقة أقل ويتطلب إعادة تسجيل المعرض")
+    return selected
@@ -0,0 +1,40 @@
+"""
+قياس أداء المطابقة المتتالية: قائمة مختصرة في فضاء PCA ثم إعادة ترتيب دقيقة
+التشغيل: python benchmarks/bench_cascade.py [عدد المستخدمين]
+"""
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_quantization import make_gallery, build_matcher
+
+def main():
+    n_users = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    gallery, user_ids, queries = make_gallery(n_users)
+    queries = queries[:200]
+
+    matcher = build_matcher(gallery, user_ids)
+    start = time.perf_counter()
+    exact_top = [matcher.find_best_matches(q, top_k=1)[0]['user_id'] for q in queries]
+    exact_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+    print(f"المعرض: {len(gallery)} قالب × {gallery.shape[1]} بُعد")
+    print(f"{'الإعداد':<28}{'recall@1':>10}{'ms/استعلام':>12}")
+    print(f"{'دقيق (كامل الأبعاد)':<28}{1.0:>10.3f}{exact_ms:>12.2f}")
+
+    for n_components in (16, 32):
+        matcher.pca_model.n_components = n_components
+        matcher.pca_model.fit(gallery[::10])
+        for shortlist in (50, 200, 1000):
+            matcher.enable_cascade(shortlist_size=shortlist)
+            start = time.perf_counter()
+            found = [matcher.find_best_matches(q, top_k=1)[0]['user_id'] for q in queries]
+            ms = (time.perf_counter() - start) / len(queries) * 1000
+            recall = np.mean([a == b for a, b in zip(found, exact_top)])
+            print(f"{f'PCA={n_components} shortlist={shortlist}':<28}{recall:>10.3f}{ms:>12.2f}")
+
+if __name__ == '__main__':
+    main()
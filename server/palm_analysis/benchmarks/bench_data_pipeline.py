@@ -0,0 +1,69 @@
+"""
+قياس سرعة خط إدخال التدريب (صورة/ثانية): ImageDataGenerator مقابل tf.data
+التشغيل: python benchmarks/bench_data_pipeline.py [عدد الصور] [حجم الدفعة]
+"""
+import os
+import sys
+import time
+import tempfile
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deep_cnn_analyzer import DeepCNNAnalyzer
+
+def write_images(directory, n_images, size=320):
+    """صور JPEG اصطناعية على القرص"""
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(n_images):
+        image = rng.integers(0, 255, (size, size, 3), dtype=np.uint8)
+        path = os.path.join(directory, f'palm_{i:05d}.jpg')
+        cv2.imwrite(path, image)
+        paths.append(path)
+    return paths
+
+def images_per_second(batches, n_images):
+    start = time.perf_counter()
+    seen = 0
+    for batch, _ in batches:
+        seen += len(batch)
+        if seen >= n_images:
+            break
+    return seen / (time.perf_counter() - start)
+
+def main():
+    n_images = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    analyzer = DeepCNNAnalyzer()
+    labels = np.random.rand(n_images, analyzer.num_classes).astype(np.float32)
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_images(directory, n_images)
+
+        # المسار الحالي: فك ترميز وتحجيم في Python ثم ImageDataGenerator.flow
+        start = time.perf_counter()
+        arrays = np.stack([cv2.resize(cv2.imread(path), analyzer.input_shape[:2]) for path in paths]).astype(np.float32)
+        decode_seconds = time.perf_counter() - start
+        generator = analyzer.create_data_generator().flow(arrays, labels, batch_size=batch_size, shuffle=True)
+        generator_rate = images_per_second(generator, n_images)
+        generator_total = n_images / (decode_seconds + n_images / generator_rate)
+
+        cache_path = os.path.join(directory, 'palm_cache')
+        dataset = analyzer.create_dataset(paths, labels, batch_size=batch_size, cache_path=cache_path)
+        first_epoch = images_per_second(dataset, n_images)
+        cached_epoch = images_per_second(dataset, n_images)
+        no_augment = images_per_second(
+            analyzer.create_dataset(paths, labels, batch_size=batch_size, augment=False, cache_path=cache_path),
+            n_images)
+
+    print(f"{'المسار':<44}{'صورة/ثانية':>12}")
+    print(f"{'ImageDataGenerator (مع فك الترميز)':<44}{generator_total:>12.1f}")
+    print(f"{'ImageDataGenerator (مصفوفة جاهزة)':<44}{generator_rate:>12.1f}")
+    print(f"{'tf.data الحقبة الأولى (فك ترميز + تخزين)':<44}{first_epoch:>12.1f}")
+    print(f"{'tf.data من التخزين المؤقت':<44}{cached_epoch:>12.1f}")
+    print(f"{'tf.data من التخزين المؤقت بدون تحسين':<44}{no_augment:>12.1f}")
+
+if __name__ == '__main__':
+    main()
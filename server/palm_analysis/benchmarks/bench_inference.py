@@ -0,0 +1,48 @@
+"""
+قياس زمن استخراج متجه الميزات لصورة واحدة: model.predict مقابل الاستدلال المُجمّع
+التشغيل: python benchmarks/bench_inference.py [عدد التكرارات]
+"""
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from palm_analyzer import PalmAnalyzer
+from deep_cnn_analyzer import DeepCNNAnalyzer
+from inference import CompiledInference
+
+def measure(fn, batch, n_runs):
+    """زمن كل استدعاء بالمللي ثانية بعد تكرارين للتسخين"""
+    for _ in range(2):
+        fn(batch)
+    times = []
+    for _ in range(n_runs):
+        start = time.perf_counter()
+        fn(batch)
+        times.append((time.perf_counter() - start) * 1000)
+    return np.percentile(times, 50), np.percentile(times, 99)
+
+def main():
+    n_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+    palm = PalmAnalyzer()
+    deep = DeepCNNAnalyzer()
+    deep.model = deep.build_custom_cnn()
+    models = (('PalmAnalyzer', palm.palm_cnn_model), ('DeepCNNAnalyzer', deep.model))
+
+    print(f"{'النموذج':<18}{'المسار':<22}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, model in models:
+        batch = np.random.rand(1, *model.input_shape[1:]).astype(np.float32)
+        paths = [('predict', lambda x, m=model: m.predict(x, verbose=0))]
+        for jit_compile in (False, True):
+            compiled = CompiledInference(model, jit_compile=jit_compile)
+            compiled.warmup()
+            paths.append(('tf.function + XLA' if jit_compile else 'tf.function', compiled))
+        for label, fn in paths:
+            p50, p99 = measure(fn, batch, n_runs)
+            print(f"{name:<18}{label:<22}{p50:>10.2f}{p99:>10.2f}")
+
+if __name__ == '__main__':
+    main()
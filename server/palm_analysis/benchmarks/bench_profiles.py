@@ -0,0 +1,99 @@
+"""
+جدول الدقة والزمن لملفات تعريف النموذج (الجذع القياسي 224 والجذوع المدمجة 160/128)
+الدقة: rank-1 على هويات اصطناعية بعد تدريب قصير لرأس الميزات كمصنف هويات
+التشغيل: python benchmarks/bench_profiles.py [عدد الهويات] [عدد الحقب]
+"""
+import os
+import sys
+import time
+import cv2
+import numpy as np
+import tensorflow as tf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from palm_analyzer import PalmAnalyzer
+from backbones import MODEL_PROFILES, select_model_profile
+
+SAMPLES_PER_IDENTITY = 8
+TRAIN_SAMPLES = 5
+
+def synthetic_identities(n_identities, rng, size=320):
+    """لكل هوية نمط خطوط ثابت، والعينات تختلف بالدوران والإزاحة والإضاءة والضوضاء"""
+    samples = []
+    for _ in range(n_identities):
+        base = np.full((size, size, 3), rng.integers(120, 200, 3), dtype=np.uint8)
+        for _ in range(10):
+            x1, y1, x2, y2 = rng.integers(0, size, 4)
+            cv2.line(base, (int(x1), int(y1)), (int(x2), int(y2)), (60, 40, 40), int(rng.integers(2, 5)))
+        identity = []
+        for _ in range(SAMPLES_PER_IDENTITY):
+            matrix = cv2.getRotationMatrix2D((size / 2, size / 2), rng.uniform(-8, 8), rng.uniform(0.95, 1.05))
+            matrix[:, 2] += rng.uniform(-10, 10, 2)
+            image = cv2.warpAffine(base, matrix, (size, size), borderMode=cv2.BORDER_REPLICATE).astype(np.float32)
+            image = image * rng.uniform(0.8, 1.2) + rng.normal(0, 6, image.shape)
+            identity.append(np.clip(image, 0, 255).astype(np.uint8))
+        samples.append(identity)
+    return samples
+
+def rank1_accuracy(analyzer, samples, epochs):
+    """تدريب قصير ثم مطابقة عينات الاختبار بجيب التمام مع متوسط عينات التدريب لكل هوية"""
+    def prepare(images):
+        return np.concatenate([analyzer.preprocess_palm_image(image) for image in images]).astype(np.float32)
+
+    train = [prepare(identity[:TRAIN_SAMPLES]) for identity in samples]
+    test = [prepare(identity[TRAIN_SAMPLES:]) for identity in samples]
+    x_train = np.concatenate(train)
+    y_train = np.repeat(np.arange(len(samples)), TRAIN_SAMPLES)
+
+    features = analyzer.palm_cnn_model
+    classifier = tf.keras.Sequential([features, tf.keras.layers.Dense(len(samples), activation='softmax')])
+    classifier.compile(optimizer=tf.keras.optimizers.Adam(1e-3), loss='sparse_categorical_crossentropy')
+    classifier.fit(x_train, y_train, epochs=epochs, batch_size=16, shuffle=True, verbose=0)
+
+    def embed(batch):
+        vectors = features.predict(batch, verbose=0)
+        return vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-8)
+
+    centroids = np.stack([embed(batch).mean(axis=0) for batch in train])
+    correct = total = 0
+    for label, batch in enumerate(test):
+        predicted = np.argmax(embed(batch) @ centroids.T, axis=1)
+        correct += int(np.sum(predicted == label))
+        total += len(batch)
+    return correct / total
+
+def latency_ms(analyzer, image, n_runs=200):
+    """زمن p50/p99 لتمرير أمامي لصورة واحدة (بعد المعالجة المسبقة)"""
+    batch = analyzer.preprocess_palm_image(image).astype(np.float32)
+    analyzer.palm_cnn_inference(batch)
+    timings = []
+    for _ in range(n_runs):
+        start = time.perf_counter()
+        analyzer.palm_cnn_inference(batch)
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.percentile(timings, 50), np.percentile(timings, 99)
+
+def main():
+    n_identities = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    epochs = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    rng = np.random.default_rng(0)
+    samples = synthetic_identities(n_identities, rng)
+
+    latencies = {}
+    print(f"{'الملف':<14}{'الإدخال':>7}{'معاملات (M)':>13}{'p50 ms':>9}{'p99 ms':>9}{'rank-1':>9}")
+    for name, profile in MODEL_PROFILES.items():
+        tf.keras.utils.set_random_seed(0)
+        analyzer = PalmAnalyzer(profile=name)
+        p50, p99 = latency_ms(analyzer, samples[0][0])
+        latencies[name] = p50
+        accuracy = rank1_accuracy(analyzer, samples, epochs)
+        params = analyzer.multi_head_model.count_params() / 1e6
+        print(f"{name:<14}{profile['input_size']:>7}{params:>13.2f}{p50:>9.2f}{p99:>9.2f}{accuracy:>9.3f}")
+
+    print()
+    for budget in (5, 10, 20, 50):
+        print(f"ميزانية {budget} ms → {select_model_profile(budget, latencies)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+قياس أداء تكميم القوالب: الذاكرة لكل مليون قالب وفقدان الدقة
+التشغيل: python benchmarks/bench_quantization.py [عدد المستخدمين]
+"""
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from biometric_matcher import BiometricMatcher
+
+DIM = 128
+SAMPLES_PER_USER = 3
+
+def make_gallery(n_users: int, noise: float = 0.35, seed: int = 0):
+    """معرض اصطناعي: مركز لكل مستخدم مع عينات مشوشة"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_users, DIM)).astype(np.float32)
+    gallery = np.repeat(centers, SAMPLES_PER_USER, axis=0)
+    gallery += noise * rng.normal(size=gallery.shape).astype(np.float32)
+    user_ids = [f'u{i}' for i in range(n_users) for _ in range(SAMPLES_PER_USER)]
+    queries = centers + noise * rng.normal(size=centers.shape).astype(np.float32)
+    return gallery, user_ids, queries
+
+def build_matcher(gallery: np.ndarray, user_ids) -> BiometricMatcher:
+    matcher = BiometricMatcher()
+    matcher.feature_vectors = gallery
+    matcher.user_ids = user_ids
+    matcher.labels = user_ids
+    matcher.is_trained = True
+    # المعرض مُطبَّع مسبقاً في هذا القياس
+    matcher.scaler.mean_ = np.zeros(DIM)
+    matcher.scaler.scale_ = np.ones(DIM)
+    matcher.scaler.n_features_in_ = DIM
+    return matcher
+
+def run(matcher: BiometricMatcher, queries: np.ndarray, exact_top: list, top_k: int = 10):
+    recall_at_1 = 0
+    recall_at_k = 0
+    start = time.perf_counter()
+    for q, truth in zip(queries, exact_top):
+        matches = matcher.find_best_matches(q, top_k=top_k)
+        found = [m['user_id'] for m in matches]
+        recall_at_1 += found[0] == truth[0]
+        recall_at_k += len(set(found) & set(truth)) / len(set(truth))
+    elapsed = (time.perf_counter() - start) / len(queries) * 1000
+    return recall_at_1 / len(queries), recall_at_k / len(queries), elapsed
+
+def main():
+    n_users = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    gallery, user_ids, queries = make_gallery(n_users)
+    queries = queries[:200]
+
+    matcher = build_matcher(gallery, user_ids)
+    exact_top = [[m['user_id'] for m in matcher.find_best_matches(q, top_k=10)] for q in queries]
+    _, _, exact_ms = run(matcher, queries, exact_top)
+
+    print(f"المعرض: {len(gallery)} قالب × {DIM} بُعد")
+    print(f"{'الإعداد':<22}{'MB/مليون قالب':>16}{'recall@1':>10}{'recall@10':>11}{'ms/استعلام':>12}")
+    # قائمة Python من float: مؤشر 8 بايت + كائن float بحجم 24 بايت لكل عنصر
+    print(f"{'float (قوائم Python)':<22}{DIM * 32:>16.0f}{1.0:>10.3f}{1.0:>11.3f}{'-':>12}")
+    print(f"{'float32 دقيق':<22}{DIM * 4:>16.0f}{1.0:>10.3f}{1.0:>11.3f}{exact_ms:>12.2f}")
+
+    configs = [
+        ('int8', {}, 0),
+        ('int8', {}, 100),
+        ('pq', {'n_subvectors': 16}, 0),
+        ('pq', {'n_subvectors': 16}, 100),
+        ('pq', {'n_subvectors': 32}, 100),
+    ]
+    for method, kwargs, rerank in configs:
+        matcher = build_matcher(gallery, user_ids)
+        info = matcher.quantize_gallery(method, rerank_size=rerank, **kwargs)
+        r1, rk, ms = run(matcher, queries, exact_top)
+        name = f"{method}{'/m=' + str(kwargs['n_subvectors']) if kwargs else ''}{' +rerank' if rerank else ''}"
+        # الذاكرة المقيمة للرموز فقط (قوالب float32 لإعادة الترتيب تبقى على القرص)
+        print(f"{name:<22}{info['bytes_per_template']:>16.0f}{r1:>10.3f}{rk:>11.3f}{ms:>12.2f}")
+
+if __name__ == '__main__':
+    main()
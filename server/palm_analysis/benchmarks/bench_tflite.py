@@ -0,0 +1,75 @@
+"""
+تحويل النماذج إلى TFLite (نطاق ديناميكي وint8 كامل) وقياس الانحراف عن float32 والزمن
+التشغيل: python benchmarks/bench_tflite.py [مجلد صور المعايرة] [مجلد الإخراج] [عدد الخيوط]
+"""
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from palm_analyzer import PalmAnalyzer
+from anti_spoofing import AntiSpoofingSystem
+from deep_cnn_analyzer import DeepCNNAnalyzer
+from inference import CompiledInference
+from tflite_backend import TFLiteInference, convert_palm_models, embedding_drift_report
+
+def load_images(directory, n_synthetic=64):
+    """صور المعايرة من المجلد، أو صور اصطناعية بنسيج خطوط عند عدم توفره"""
+    if directory and os.path.isdir(directory):
+        images = [cv2.imread(os.path.join(directory, name)) for name in sorted(os.listdir(directory))]
+        return [image for image in images if image is not None]
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(n_synthetic):
+        image = np.full((320, 320, 3), rng.integers(120, 200, 3), dtype=np.uint8)
+        for _ in range(12):
+            x1, y1, x2, y2 = rng.integers(0, 320, 4)
+            cv2.line(image, (int(x1), int(y1)), (int(x2), int(y2)), (60, 40, 40), int(rng.integers(1, 4)))
+        images.append(cv2.GaussianBlur(image, (3, 3), 0))
+    return images
+
+def latency_ms(fn, batch, n_runs=30):
+    fn(batch)
+    start = time.perf_counter()
+    for _ in range(n_runs):
+        fn(batch)
+    return (time.perf_counter() - start) / n_runs * 1000
+
+def main():
+    images = load_images(sys.argv[1] if len(sys.argv) > 1 else None)
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else 'tflite_models'
+    num_threads = int(sys.argv[3]) if len(sys.argv) > 3 else None
+
+    palm = PalmAnalyzer()
+    spoofing = AntiSpoofingSystem()
+    deep = DeepCNNAnalyzer()
+    deep.model = deep.build_custom_cnn()
+
+    # كل نموذج يُعاير بمعالجة الإدخال التي يستخدمها عند الاستدلال
+    palm_batches = [palm.preprocess_palm_image(image).astype(np.float32) for image in images]
+    raw_batches = [cv2.resize(image, (224, 224))[np.newaxis].astype(np.float32) for image in images]
+    models = {'palm_analyzer': palm.palm_cnn_model, 'cnn_detector': spoofing.cnn_detector, 'deep_cnn': deep.model}
+    batches = {'palm_analyzer': palm_batches, 'cnn_detector': [b / 255.0 for b in raw_batches],
+               'deep_cnn': raw_batches}
+
+    paths = convert_palm_models(models, batches, output_dir)
+
+    print(f"{'النموذج':<16}{'المحرك':<10}{'MB':>7}{'cos متوسط':>11}{'cos أدنى':>10}{'أقصى فرق':>10}{'ms':>8}")
+    for name, model in models.items():
+        reference = CompiledInference(model)
+        backends = {mode: TFLiteInference(paths[f'{name}_{mode}'], num_threads=num_threads)
+                    for mode in ('dynamic', 'int8')}
+        report = embedding_drift_report(reference, backends, batches[name])
+        sample = batches[name][0]
+        print(f"{name:<16}{'float32':<10}{'':>7}{1.0:>11.4f}{1.0:>10.4f}{0.0:>10.4f}{latency_ms(reference, sample):>8.2f}")
+        for mode, backend in backends.items():
+            size = os.path.getsize(paths[f'{name}_{mode}']) / 1e6
+            row = report[mode]
+            print(f"{name:<16}{mode:<10}{size:>7.2f}{row['mean_cosine']:>11.4f}{row['min_cosine']:>10.4f}"
+                  f"{row['max_abs_error']:>10.4f}{latency_ms(backend, sample):>8.2f}")
+
+if __name__ == '__main__':
+    main()
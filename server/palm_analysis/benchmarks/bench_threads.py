@@ -0,0 +1,81 @@
+"""
+مسح إعدادات الخيوط: عدة عمال متزامنين على نفس الخادم، لكل إعداد إنتاجية المجموع وزمن p50/p99
+كل عامل عملية جديدة (spawn) لأن خيوط TensorFlow وoneDNN لا تُضبط إلا قبل تهيئته
+التشغيل: python benchmarks/bench_threads.py [عدد الصور لكل عامل] [أقصى عدد عمال]
+"""
+import os
+import sys
+import time
+import multiprocessing
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from runtime_config import available_cores, compute_thread_budget
+
+def worker(settings, n_images, barrier, results):
+    """عامل واحد: تحليل صور 640×480 (المعالجة المسبقة + CNN) بعد ضبط الخيوط أو بدونه"""
+    if settings is not None:
+        from runtime_config import configure_runtime
+        configure_runtime(**settings)
+    from palm_analyzer import PalmAnalyzer
+    analyzer = PalmAnalyzer()
+    rng = np.random.default_rng(os.getpid())
+    images = [rng.integers(0, 255, (480, 640, 3), dtype=np.uint8) for _ in range(n_images)]
+
+    barrier.wait()
+    start = time.time()
+    timings = []
+    for image in images:
+        t0 = time.perf_counter()
+        analyzer.palm_cnn_inference(analyzer.preprocess_palm_image(image).astype(np.float32))
+        timings.append((time.perf_counter() - t0) * 1000)
+    results.put((start, time.time(), timings))
+
+def run(workers, settings, n_images):
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(settings, n_images, barrier, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    wall = max(end for _, end, _ in collected) - min(start for start, _, _ in collected)
+    timings = np.concatenate([t for _, _, t in collected])
+    return workers * n_images / wall, np.percentile(timings, 50), np.percentile(timings, 99)
+
+def main():
+    n_images = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    cores = available_cores()
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else max(2, cores)
+
+    print(f"الأنوية المتاحة: {cores}")
+    print(f"{'عمال':>5}  {'الإعداد':<22}{'intra':>6}{'inter':>6}{'cv2':>5}{'صورة/ث':>9}{'p50 ms':>9}{'p99 ms':>9}")
+    for workers in sorted({1, 2, cores, max_workers}):
+        if workers > max_workers:
+            continue
+        budget = compute_thread_budget(workers, cores)
+        sweep = [('بدون ضبط (افتراضي)', None)]
+        sweep.append(('حصة لكل عامل', {'workers': workers}))
+        if budget['intra_op_threads'] != cores:
+            sweep.append(('كل الأنوية لكل عامل', {'workers': workers, 'intra_op_threads': cores,
+                                                  'inter_op_threads': cores, 'cv2_threads': cores}))
+        if budget['intra_op_threads'] > 1:
+            sweep.append(('خيط واحد', {'workers': workers, 'intra_op_threads': 1,
+                                        'inter_op_threads': 1, 'cv2_threads': 1}))
+        for label, settings in sweep:
+            rate, p50, p99 = run(workers, settings, n_images)
+            if settings is None:
+                threads = ('-', '-', '-')
+            else:
+                threads = (settings.get('intra_op_threads', budget['intra_op_threads']),
+                           settings.get('inter_op_threads', budget['inter_op_threads']),
+                           settings.get('cv2_threads', budget['cv2_threads']))
+            print(f"{workers:>5}  {label:<22}{threads[0]:>6}{threads[1]:>6}{threads[2]:>5}"
+                  f"{rate:>9.1f}{p50:>9.1f}{p99:>9.1f}")
+
+if __name__ == '__main__':
+    main()
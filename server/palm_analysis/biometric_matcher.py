@@ -8,9 +8,81 @@ from sklearn.svm import SVC
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import train_test_split
 from sklearn.metrics.pairwise import cosine_similarity
-from typing import List, Tuple, Optional, Dict
+from typing import List, Tuple, Optional, Dict, Callable
+from collections import deque
 import pickle
 import logging
+import json
+import os
+import heapq
+import copy
+import threading
+import zlib
+import multiprocessing as mp
+
+try:
+    from .template_quantization import create_quantizer
+    from .lsh_index import RandomHyperplaneLSH
+except ImportError:
+    from template_quantization import create_quantizer
+    from lsh_index import RandomHyperplaneLSH
+
+# إصدار صيغة تخزين المعرض على القرص (الإصدار 1 بلا أجيال ما زال يُقرأ)
+GALLERY_FORMAT_VERSION = 2
+GALLERY_HEADER_FILE = 'header.json'
+GALLERY_TEMPLATES_FILE = 'templates.f32'
+GALLERY_USER_IDS_FILE = 'user_ids.npy'
+GALLERY_LABELS_FILE = 'labels.npy'
+GALLERY_ESTIMATORS_FILE = 'estimators.pkl'
+GALLERY_CODES_FILE = 'quantized_codes.npy'
+GALLERY_NORMS_FILE = 'quantized_norms.npy'
+GALLERY_WEIGHTS_FILE = 'weights.npy'
+
+GALLERY_DATA_FILES = (GALLERY_TEMPLATES_FILE, GALLERY_USER_IDS_FILE, GALLERY_LABELS_FILE,
+                      GALLERY_ESTIMATORS_FILE, GALLERY_CODES_FILE, GALLERY_NORMS_FILE, GALLERY_WEIGHTS_FILE)
+
+def gallery_file(directory: str, name: str, generation: int = 0) -> str:
+    """مسار ملف بيانات المعرض لجيل محدد (templates.f32 -> templates.3.f32)"""
+    if generation <= 0:
+        return os.path.join(directory, name)
+    stem, ext = os.path.splitext(name)
+    return os.path.join(directory, f'{stem}.{generation}{ext}')
+
+def _gallery_file_generation(filename: str) -> Optional[int]:
+    """جيل ملف بيانات معرض من اسمه (0 للإصدار 1 بلا جيل، None لغير ملفات المعرض)"""
+    for name in GALLERY_DATA_FILES:
+        if filename == name:
+            return 0
+        stem, ext = os.path.splitext(name)
+        middle = filename[len(stem) + 1:len(filename) - len(ext)]
+        if filename.startswith(stem + '.') and filename.endswith(ext) and middle.isdigit():
+            return int(middle)
+    return None
+
+# سياسات إدارة قوالب المستخدم
+TEMPLATE_POLICIES = ('append', 'mean', 'cluster')
+
+def fuse_templates(templates: np.ndarray, weights: np.ndarray, new_template: np.ndarray,
+                   quality: float, max_templates: int) -> Tuple[np.ndarray, np.ndarray]:
+    """دمج عينة جديدة في قوالب المستخدم الممثلة (موزونة بالجودة)
+
+    تُضاف العينة كقالب جديد، ثم يُدمج أقرب قالبين (متوسط موزون) حتى لا يتجاوز
+    العدد max_templates. مع max_templates=1 يصبح ذلك متوسطاً متحركاً موزوناً.
+    """
+    templates = np.vstack([templates, new_template.reshape(1, -1)])
+    weights = np.append(weights, max(float(quality), 1e-3))
+    
+    while len(templates) > max_templates:
+        normalized = templates / (np.linalg.norm(templates, axis=1, keepdims=True) + 1e-8)
+        similarity = normalized @ normalized.T
+        np.fill_diagonal(similarity, -np.inf)
+        i, j = np.unravel_index(np.argmax(similarity), similarity.shape)
+        merged = (templates[i] * weights[i] + templates[j] * weights[j]) / (weights[i] + weights[j])
+        keep = [k for k in range(len(templates)) if k not in (i, j)]
+        templates = np.vstack([templates[keep], merged.reshape(1, -1)])
+        weights = np.append(weights[keep], weights[i] + weights[j])
+    
+    return templates, weights
 
 class BiometricMatcher:
     def __init__(self, n_components: int = 100, svm_kernel: str = 'rbf'):
@@ -29,6 +101,38 @@ class BiometricMatcher:
         self.labels = []
         self.user_ids = []
         
+        # قوالب مكممة اختيارية (int8 / PQ) مع إعادة ترتيب float32 للقائمة المختصرة
+        self.quantizer = None
+        self.quantized_codes = None
+        self.quantized_norms = None
+        self.rerank_size = 100
+        
+        # فهرس LSH اختياري لترشيح المرشحين قبل حساب التشابه
+        self.lsh_index = None
+        
+        # وضع التتالي: قائمة مختصرة في فضاء PCA ثم إعادة ترتيب دقيقة
+        self.cascade_shortlist = 0
+        self.cascade_svm_margin = None
+        self.projected_gallery = None
+        self._gallery_cache = None
+        
+        # آخر تسلسل من سجل التسجيل مضمّن في هذا المعرض
+        self.enrollment_sequence = 0
+        # آخر معرف صف محمّل من مستودع القوالب (SQLite) وآخر حذف مستخدم مطبق منه
+        self.store_row_id = 0
+        self.store_deletion_id = 0
+        # ملف تعريف نموذج الميزات (backbones.MODEL_PROFILES) الذي أنتج القوالب، إن عُرف
+        self.model_profile = None
+        
+        # إدارة قوالب المستخدم: 'append' (صف لكل عينة)، 'mean' (متوسط متحرك)،
+        # 'cluster' (حتى max_templates_per_user قالباً ممثلاً)
+        self.template_policy = 'append'
+        self.max_templates_per_user = 3
+        self.template_weights = []
+        # الصفوف المستبدلة تبقى كشواهد محذوفة حتى الضغط حفاظاً على الفهارس
+        self.inactive_rows = set()
+        self._user_rows = None
+        
     def extract_palm_signature(self, feature_vector: np.ndarray) -> np.ndarray:
         """استخراج توقيع فريد من متجه الميزات"""
         # تطبيع المتجه
@@ -57,7 +161,9 @@ class BiometricMatcher:
         self.feature_vectors = X_scaled.tolist()
         self.labels = labels
         self.user_ids = user_ids
+        self.template_weights = [1.0] * len(user_ids)
         self.is_trained = True
+        self._reset_gallery_index()
         
         self.logger.info(f"تم تدريب النموذج بنجاح مع {len(feature_vectors)} عينة")
     
@@ -73,14 +179,32 @@ class BiometricMatcher:
         # تطبيق PCA على المتجه الجديد
         query_pca = self.pca_model.transform(query_scaled)
         
-        # التنبؤ باستخدام SVM
-        predicted_label = self.svm_model.predict(query_pca)[0]
-        confidence = self.svm_model.predict_proba(query_pca).max()
-        
         # حساب التشابه مع أقرب الجيران
-        similarities = cosine_similarity(query_scaled, np.array(self.feature_vectors)).flatten()
-        max_similarity = similarities.max()
-        most_similar_idx = similarities.argmax()
+        skip_svm = self.cascade_shortlist > 0 and self.cascade_svm_margin is not None
+        ranked_indices, ranked_similarities = self._rank_gallery(
+            query_scaled, top_k=10 if skip_svm else 1, query_pca=query_pca
+        )
+        if len(ranked_indices) == 0:
+            # كل الصفوف مستبدلة: لا يوجد قالب نشط للمطابقة
+            return self._no_match_result()
+        max_similarity = ranked_similarities[0]
+        most_similar_idx = ranked_indices[0]
+        
+        if skip_svm:
+            # هامش إعادة الترتيب: الفرق عن أفضل مرشح بتسمية مختلفة
+            top_label = self.labels[most_similar_idx]
+            runner_up = next((sim for idx, sim in zip(ranked_indices[1:], ranked_similarities[1:])
+                              if self.labels[idx] != top_label), -1.0)
+            skip_svm = max_similarity - runner_up >= self.cascade_svm_margin
+        
+        if skip_svm:
+            # الهامش حاسم، لا حاجة لتقييم SVM
+            predicted_label = self.labels[most_similar_idx]
+            confidence = float(np.clip(max_similarity, 0.0, 1.0))
+        else:
+            # التنبؤ باستخدام SVM
+            predicted_label = self.svm_model.predict(query_pca)[0]
+            confidence = self.svm_model.predict_proba(query_pca).max()
         
         # التحقق من العتبة
         is_match = max_similarity >= threshold
@@ -94,25 +218,206 @@ class BiometricMatcher:
             'match_details': {
                 'user_id': self.user_ids[most_similar_idx] if is_match else None,
                 'label': self.labels[most_similar_idx] if is_match else None,
-                'similarity': float(similarities[most_similar_idx]) if is_match else 0.0
+                'similarity': float(max_similarity) if is_match else 0.0
             }
         }
+        if self.cascade_shortlist > 0:
+            result['svm_skipped'] = skip_svm
         
         return result
     
-    def add_palm_sample(self, feature_vector: np.ndarray, label: str, user_id: str) -> None:
-        """إضافة عينة جديدة لقاعدة البيانات"""
+    @staticmethod
+    def _no_match_result() -> Dict:
+        """نتيجة عدم المطابقة (بنفس شكل match_palm_print)"""
+        return {
+            'is_match': False,
+            'confidence': 0.0,
+            'similarity_score': 0.0,
+            'predicted_label': None,
+            'most_similar_user': None,
+            'match_details': {
+                'user_id': None,
+                'label': None,
+                'similarity': 0.0
+            }
+        }
+    
+    def add_palm_sample(self, feature_vector: np.ndarray, label: str, user_id: str,
+                        quality: float = 1.0) -> None:
+        """إضافة عينة جديدة لقاعدة البيانات
+
+        quality: وزن العينة (مثلاً من PalmAnalyzer._calculate_quality_score)،
+        يُستخدم في دمج القوالب عند سياسة 'mean' أو 'cluster'.
+        """
         if not self.is_trained:
             # إذا لم يتم التدريب، نبدأ بقائمة جديدة
             self.feature_vectors = [feature_vector.tolist()]
             self.labels = [label]
             self.user_ids = [user_id]
+            self.template_weights = [max(float(quality), 1e-3)]
+            self.inactive_rows = set()
+            self._user_rows = None
             self.is_trained = True
-        else:
+            return
+        
+        # المعرض المحمّل من القرص للقراءة فقط، ننسخه إلى قوائم عند أول إضافة
+        if isinstance(self.feature_vectors, np.ndarray):
+            self.feature_vectors = self.feature_vectors.tolist()
+            self.labels = list(self.labels)
+            self.user_ids = list(self.user_ids)
+        if not isinstance(self.template_weights, list):
+            self.template_weights = list(self.template_weights)
+        
+        rows = self._user_row_indices().get(user_id, []) if self.template_policy != 'append' else []
+        if not rows:
             # إضافة إلى القائمة الحالية
-            self.feature_vectors.append(feature_vector.tolist())
+            self._append_rows([np.asarray(feature_vector)], label, user_id, [max(float(quality), 1e-3)])
+            return
+        
+        # دمج العينة مع قوالب المستخدم الحالية: الصفوف القديمة تُستبدل بالقوالب المدمجة
+        max_templates = 1 if self.template_policy == 'mean' else self.max_templates_per_user
+        templates = np.vstack([np.asarray(self.feature_vectors[i], dtype=np.float64) for i in rows])
+        weights = np.array([self.template_weights[i] for i in rows], dtype=np.float64)
+        fused, fused_weights = fuse_templates(templates, weights, np.asarray(feature_vector, dtype=np.float64),
+                                              quality, max_templates)
+        self._retire_rows(rows)
+        self._append_rows(list(fused), label, user_id, fused_weights.tolist())
+        
+        # ضغط المعرض عند تراكم الصفوف المستبدلة
+        if len(self.inactive_rows) > max(64, len(self.user_ids) // 4):
+            self.compact_gallery()
+    
+    def _append_rows(self, vectors: List[np.ndarray], label: str, user_id: str, weights: List[float]) -> None:
+        """إلحاق صفوف قوالب مستخدم واحد بالمعرض"""
+        start = len(self.user_ids)
+        for vector in vectors:
+            self.feature_vectors.append(vector.tolist())
             self.labels.append(label)
             self.user_ids.append(user_id)
+        self.template_weights.extend(weights)
+        if self._user_rows is not None:
+            # قوائم جديدة بدلاً من التعديل في المكان (اللقطات قد تتشارك القاموس)
+            self._user_rows = dict(self._user_rows)
+            self._user_rows[user_id] = self._user_rows.get(user_id, []) + list(range(start, start + len(vectors)))
+    
+    def _retire_rows(self, rows: List[int]) -> None:
+        """تعليم صفوف كمستبدلة (تُستبعد من المطابقة وتُحذف عند الضغط)"""
+        self.inactive_rows = self.inactive_rows | set(rows)
+        if self._user_rows is not None:
+            self._user_rows = dict(self._user_rows)
+            for row in rows:
+                user_id = self.user_ids[row]
+                self._user_rows[user_id] = [i for i in self._user_rows.get(user_id, []) if i != row]
+    
+    def _user_row_indices(self) -> Dict[str, List[int]]:
+        """خريطة المستخدم إلى صفوفه النشطة (تُبنى عند الحاجة)"""
+        if self._user_rows is None:
+            user_rows = {}
+            for i, user_id in enumerate(self.user_ids):
+                if i not in self.inactive_rows:
+                    user_rows.setdefault(user_id, []).append(i)
+            self._user_rows = user_rows
+        return self._user_rows
+    
+    def retire_user(self, user_id: str) -> int:
+        """استبعاد كل صفوف مستخدم من المطابقة (مثلاً بعد حذفه من المستودع) وإرجاع عددها"""
+        rows = self._user_row_indices().get(user_id, [])
+        if rows:
+            self._retire_rows(rows)
+        return len(rows)
+    
+    def set_template_policy(self, policy: str, max_templates_per_user: int = 3) -> None:
+        """اختيار سياسة إدارة قوالب المستخدم ('append' أو 'mean' أو 'cluster')"""
+        if policy not in TEMPLATE_POLICIES:
+            raise ValueError(f"سياسة القوالب غير مدعومة: {policy}")
+        if max_templates_per_user < 1:
+            raise ValueError("عدد القوالب لكل مستخدم يجب أن يكون 1 على الأقل")
+        self.template_policy = policy
+        self.max_templates_per_user = max_templates_per_user
+    
+    def compact_gallery(self) -> int:
+        """حذف الصفوف المستبدلة من المعرض وإرجاع عددها
+
+        تُنشأ حاويات جديدة بدلاً من التعديل في المكان، فتبقى اللقطات السابقة صالحة.
+        """
+        if not self.inactive_rows:
+            return 0
+        
+        n_rows = len(self.user_ids)
+        keep = np.array([i not in self.inactive_rows for i in range(n_rows)], dtype=bool)
+        removed = n_rows - int(keep.sum())
+        kept_rows = np.flatnonzero(keep)
+        
+        if isinstance(self.feature_vectors, np.ndarray):
+            self.feature_vectors = np.asarray(self.feature_vectors[kept_rows])
+        else:
+            self.feature_vectors = [self.feature_vectors[i] for i in kept_rows]
+        self.labels = [self.labels[i] for i in kept_rows]
+        self.user_ids = [self.user_ids[i] for i in kept_rows]
+        self.template_weights = [self.template_weights[i] for i in kept_rows]
+        
+        # الفهارس المتزامنة تُرشَّح بنفس القناع، وفهرس LSH يعاد بناؤه
+        if self.quantized_codes is not None:
+            n_codes = len(self.quantized_codes)
+            self.quantized_codes = self.quantized_codes[keep[:n_codes]]
+            self.quantized_norms = self.quantized_norms[keep[:n_codes]]
+        if self.projected_gallery is not None:
+            self.projected_gallery = self.projected_gallery[keep[:len(self.projected_gallery)]]
+        if self.lsh_index is not None:
+            self.lsh_index = copy.copy(self.lsh_index)
+            self.lsh_index.reset()
+        self._gallery_cache = None
+        self.inactive_rows = set()
+        self._user_rows = None
+        
+        self.logger.info(f"تم ضغط المعرض: حذف {removed} قالب مستبدل")
+        return removed
+    
+    def sync_from_store(self, store) -> int:
+        """تحميل القوالب المضافة إلى المستودع بعد آخر مزامنة وإرجاع عددها
+
+        عند بدء التشغيل يُحمّل المستودع كاملاً كمصفوفة واحدة، وبعدها تُلتقط
+        الصفوف التي أضافتها العمليات الأخرى فقط. المستخدمون المحذوفون منذ آخر
+        مزامنة تُستبعد صفوفهم أولاً.
+        """
+        (ids, vectors, labels, user_ids, qualities), (deletion_ids, deleted_users) = \
+            store.fetch_changes_since(self.store_row_id, self.store_deletion_id)
+        if len(deletion_ids):
+            if self.is_trained:
+                for user_id in set(deleted_users):
+                    self.retire_user(user_id)
+            self.store_deletion_id = int(deletion_ids[-1])
+        if len(ids) == 0:
+            return 0
+        
+        if self.template_policy != 'append' and self.is_trained:
+            # الدمج يحتاج منطق add_palm_sample لكل عينة
+            for vector, label, user_id, quality in zip(vectors, labels, user_ids, qualities):
+                self.add_palm_sample(vector, label, user_id, float(quality))
+        elif not self.is_trained:
+            self.feature_vectors = vectors
+            self.labels = list(labels)
+            self.user_ids = list(user_ids)
+            self.template_weights = np.maximum(qualities, 1e-3).tolist()
+            self.inactive_rows = set()
+            self._user_rows = None
+            self._reset_gallery_index()
+            self.is_trained = True
+        else:
+            if isinstance(self.feature_vectors, np.ndarray):
+                self.feature_vectors = np.vstack([self.feature_vectors, vectors.astype(self.feature_vectors.dtype)])
+                self.labels = list(self.labels)
+                self.user_ids = list(self.user_ids)
+            else:
+                self.feature_vectors.extend(vectors.tolist())
+            self.labels.extend(labels)
+            self.user_ids.extend(user_ids)
+            self.template_weights = list(self.template_weights) + np.maximum(qualities, 1e-3).tolist()
+            self._user_rows = None
+        
+        self.store_row_id = int(ids[-1])
+        self.logger.info(f"تمت مزامنة {len(ids)} قالب من المستودع (حتى الصف {self.store_row_id})")
+        return len(ids)
     
     def batch_match(self, feature_vectors: List[np.ndarray], threshold: float = 0.7) -> List[Dict]:
         """مطابقة دفعة من بصمات الكف"""
@@ -136,24 +441,257 @@ class BiometricMatcher:
         # تطبيع المتجه
         query_scaled = self.scaler.transform(query_vector.reshape(1, -1))
         
-        # حساب التشابه مع جميع العينات
-        similarities = cosine_similarity(query_scaled, np.array(self.feature_vectors)).flatten()
-        
-        # فرز النتائج
-        sorted_indices = np.argsort(similarities)[::-1][:top_k]
+        # حساب التشابه وفرز النتائج
+        if self.template_policy == 'append':
+            sorted_indices, similarities = self._rank_gallery(query_scaled, top_k)
+        else:
+            # عدة قوالب لكل مستخدم: نأخذ أفضل تشابه لكل مستخدم
+            sorted_indices, similarities = self._rank_gallery(query_scaled, top_k * self.max_templates_per_user)
+            seen = set()
+            best = [position for position, idx in enumerate(sorted_indices)
+                    if not (self.user_ids[idx] in seen or seen.add(self.user_ids[idx]))][:top_k]
+            sorted_indices, similarities = sorted_indices[best], similarities[best]
         
         matches = []
-        for idx in sorted_indices:
+        for idx, similarity in zip(sorted_indices, similarities):
             match = {
                 'user_id': self.user_ids[idx],
                 'label': self.labels[idx],
-                'similarity': float(similarities[idx]),
+                'similarity': float(similarity),
                 'rank': len(matches) + 1
             }
             matches.append(match)
         
         return matches
     
+    def _gallery_matrix(self) -> np.ndarray:
+        """مصفوفة قوالب المعرض (بدون نسخ إذا كانت محمّلة من القرص)"""
+        if isinstance(self.feature_vectors, np.ndarray):
+            return self.feature_vectors
+        # نحتفظ بنسخة المصفوفة ونعيد بناءها فقط عند تغير حجم القائمة
+        if self._gallery_cache is None or len(self._gallery_cache) != len(self.feature_vectors):
+            self._gallery_cache = np.array(self.feature_vectors)
+        return self._gallery_cache
+    
+    def _reset_gallery_index(self) -> None:
+        """إبطال المصفوفة المؤقتة والرموز المكممة بعد استبدال المعرض"""
+        self._gallery_cache = None
+        self.quantizer = None
+        self.quantized_codes = None
+        self.quantized_norms = None
+        self.projected_gallery = None
+        if self.lsh_index is not None:
+            # المستويات العشوائية مستقلة عن البيانات، نعيد بناء الدلاء فقط
+            self.lsh_index = copy.copy(self.lsh_index)
+            self.lsh_index.reset()
+    
+    def _rank_gallery(self, query_scaled: np.ndarray, top_k: int,
+                      query_pca: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """ترتيب المعرض حسب التشابه وإرجاع أفضل top_k (الفهارس والتشابهات تنازلياً)"""
+        if not self.inactive_rows:
+            return self._rank_rows(query_scaled, top_k, query_pca)
+        
+        # الصفوف المستبدلة تأخذ تشابه -inf داخل كل مرحلة فتبقى القوائم المختصرة بحجم top_k
+        inactive = np.fromiter(self.inactive_rows, dtype=np.intp, count=len(self.inactive_rows))
+        if len(inactive) >= len(self.user_ids):
+            return np.array([], dtype=np.intp), np.array([])
+        indices, similarities = self._rank_rows(query_scaled, top_k, query_pca, inactive)
+        active = np.isfinite(similarities)
+        return indices[active], similarities[active]
+    
+    def _rank_rows(self, query_scaled: np.ndarray, top_k: int,
+                   query_pca: Optional[np.ndarray] = None,
+                   inactive: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """ترتيب صفوف المعرض حسب التشابه (الصفوف في inactive تأخذ -inf)"""
+        gallery = self._gallery_matrix()
+        query = query_scaled.astype(gallery.dtype)
+        self._sync_indexes(gallery)
+        n_active = len(gallery) - (0 if inactive is None else len(inactive))
+        
+        if self.lsh_index is not None:
+            # حساب التشابه للمرشحين من الدلاء المتصادمة فقط
+            candidates = self.lsh_index.candidates(query, len(gallery))
+            if inactive is not None:
+                candidates = candidates[~np.isin(candidates, inactive)]
+            if len(candidates) >= min(top_k, n_active):
+                exact = cosine_similarity(query, np.asarray(gallery[candidates])).flatten()
+                order = self._top_indices(exact, top_k)
+                return candidates[order], exact[order]
+        
+        if self.projected_gallery is not None:
+            # المرحلة 1: مسافات رخيصة في فضاء PCA المخفض
+            if query_pca is None:
+                query_pca = self.pca_model.transform(query_scaled)
+            projected = query_pca.astype(np.float32).ravel()
+            projected /= np.linalg.norm(projected) + 1e-8
+            coarse = self.projected_gallery @ projected
+            self._exclude_rows(coarse, inactive)
+            # المرحلة 2: إعادة ترتيب القائمة المختصرة بالتشابه الكوسيني الكامل
+            shortlist = np.sort(self._top_indices(coarse, max(self.cascade_shortlist, top_k)))
+            exact = cosine_similarity(query, np.asarray(gallery[shortlist])).flatten()
+            self._exclude_rows(exact, inactive, shortlist)
+            order = self._top_indices(exact, top_k)
+            return shortlist[order], exact[order]
+        
+        if self.quantizer is not None:
+            similarities = self.quantizer.similarities(query, self.quantized_codes, self.quantized_norms)
+            self._exclude_rows(similarities, inactive)
+            if self.rerank_size > 0:
+                # إعادة ترتيب القائمة المختصرة بالتشابه الدقيق float32
+                shortlist = np.sort(self._top_indices(similarities, max(self.rerank_size, top_k)))
+                exact = cosine_similarity(query, np.asarray(gallery[shortlist])).flatten()
+                self._exclude_rows(exact, inactive, shortlist)
+                order = self._top_indices(exact, top_k)
+                return shortlist[order], exact[order]
+        else:
+            similarities = cosine_similarity(query, gallery).flatten()
+            self._exclude_rows(similarities, inactive)
+        
+        top = self._top_indices(similarities, top_k)
+        return top, similarities[top]
+    
+    @staticmethod
+    def _exclude_rows(scores: np.ndarray, inactive: Optional[np.ndarray],
+                      rows: Optional[np.ndarray] = None) -> None:
+        """وضع -inf لتشابه الصفوف المستبدلة (scores لكل المعرض أو للصفوف rows فقط)"""
+        if inactive is None or len(inactive) == 0:
+            return
+        if rows is None:
+            scores[inactive] = -np.inf
+        else:
+            scores[np.isin(rows, inactive)] = -np.inf
+    
+    @staticmethod
+    def _top_indices(scores: np.ndarray, k: int) -> np.ndarray:
+        """فهارس أعلى k قيم مرتبة تنازلياً (argpartition بدلاً من الفرز الكامل)"""
+        k = min(k, len(scores))
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        return top[np.argsort(-scores[top], kind='stable')]
+    
+    def quantize_gallery(self, method: str = 'int8', rerank_size: int = 100, **kwargs) -> Dict:
+        """تكميم قوالب المعرض لتقليل الذاكرة وتسريع البحث
+
+        method: 'int8' (تكميم قياسي لكل بُعد) أو 'pq' (تكميم المنتج مع ADC).
+        rerank_size: حجم القائمة المختصرة التي يعاد ترتيبها بالقوالب float32
+        (0 لاستخدام التشابه التقريبي فقط). يمكن أن تبقى قوالب float32 على القرص
+        عبر load_gallery بينما تبقى الرموز المكممة فقط في الذاكرة.
+        """
+        if not self.is_trained:
+            raise ValueError("النموذج غير مدرّب. قم بتدريبه أولاً.")
+        
+        gallery = self._gallery_matrix()
+        quantizer = create_quantizer(method, **kwargs).fit(gallery)
+        self.quantized_codes, self.quantized_norms = quantizer.encode(gallery)
+        self.quantizer = quantizer
+        self.rerank_size = rerank_size
+        
+        info = {
+            'method': quantizer.method,
+            'n_samples': len(self.quantized_codes),
+            'bytes_per_template': quantizer.bytes_per_template(gallery.shape[1]),
+            'rerank_size': rerank_size
+        }
+        self.logger.info(f"تم تكميم المعرض: {info}")
+        return info
+    
+    def enable_cascade(self, shortlist_size: int = 200, svm_skip_margin: Optional[float] = None) -> Dict:
+        """تفعيل المطابقة المتتالية: قائمة مختصرة في فضاء PCA ثم إعادة ترتيب دقيقة
+
+        shortlist_size: عدد المرشحين الذين يعاد ترتيبهم بالتشابه الكامل (0 للتعطيل).
+        svm_skip_margin: إذا تجاوز فرق التشابه بين الأفضل وأقرب مستخدم آخر هذا
+        الهامش، تُستخدم نتيجة إعادة الترتيب مباشرة دون تقييم SVM.
+        """
+        if not hasattr(self.pca_model, 'components_'):
+            raise ValueError("نموذج PCA غير مدرّب. قم بتدريبه أولاً.")
+        
+        self.cascade_shortlist = shortlist_size
+        self.cascade_svm_margin = svm_skip_margin
+        self.projected_gallery = None
+        if shortlist_size > 0:
+            self._sync_indexes(self._gallery_matrix())
+        
+        return {
+            'shortlist_size': shortlist_size,
+            'svm_skip_margin': svm_skip_margin,
+            'projected_dim': int(self.pca_model.components_.shape[0])
+        }
+    
+    def build_lsh_index(self, n_tables: int = 8, n_bits: int = 12) -> Dict:
+        """بناء فهرس LSH متعدد الجداول لترشيح المرشحين في التعرف 1:N"""
+        if not self.is_trained:
+            raise ValueError("النموذج غير مدرّب. قم بتدريبه أولاً.")
+        
+        gallery = self._gallery_matrix()
+        self.lsh_index = RandomHyperplaneLSH(gallery.shape[1], n_tables=n_tables, n_bits=n_bits)
+        self.lsh_index.add(np.asarray(gallery))
+        
+        info = {
+            'n_tables': n_tables,
+            'n_bits': n_bits,
+            'n_indexed': self.lsh_index.n_indexed,
+            'n_buckets': sum(len(table) for table in self.lsh_index.buckets)
+        }
+        self.logger.info(f"تم بناء فهرس LSH: {info}")
+        return info
+    
+    def find_near_duplicates(self, feature_vector: np.ndarray, similarity_threshold: float = 0.95) -> List[Dict]:
+        """كشف التسجيلات شبه المكررة عبر مرشحي LSH (أو المعرض كاملاً بدون فهرس)"""
+        if not self.is_trained:
+            return []
+        
+        gallery = self._gallery_matrix()
+        query = self.scaler.transform(feature_vector.reshape(1, -1)).astype(gallery.dtype)
+        self._sync_indexes(gallery)
+        
+        if self.lsh_index is not None:
+            candidates = self.lsh_index.candidates(query, len(gallery))
+        else:
+            candidates = np.arange(len(gallery))
+        if self.inactive_rows:
+            # القوالب المستبدلة لا تُحسب تسجيلاً مكرراً (نفس قناع _rank_gallery)
+            inactive = np.fromiter(self.inactive_rows, dtype=np.intp, count=len(self.inactive_rows))
+            candidates = candidates[~np.isin(candidates, inactive)]
+        if len(candidates) == 0:
+            return []
+        
+        similarities = cosine_similarity(query, np.asarray(gallery[candidates])).flatten()
+        duplicates = []
+        for position in np.flatnonzero(similarities >= similarity_threshold):
+            idx = candidates[position]
+            duplicates.append({
+                'user_id': self.user_ids[idx],
+                'label': self.labels[idx],
+                'similarity': float(similarities[position])
+            })
+        duplicates.sort(key=lambda d: d['similarity'], reverse=True)
+        return duplicates
+    
+    def _sync_indexes(self, gallery: np.ndarray) -> None:
+        """تحديث الرموز المكممة وفهرس LSH بالعينات المضافة بعد بنائها"""
+        if self.quantizer is not None:
+            self._sync_quantized_codes(gallery)
+        if self.lsh_index is not None and self.lsh_index.n_indexed < len(gallery):
+            self.lsh_index.add(np.asarray(gallery[self.lsh_index.n_indexed:]))
+        if self.cascade_shortlist > 0:
+            n_projected = 0 if self.projected_gallery is None else len(self.projected_gallery)
+            if n_projected < len(gallery):
+                # معرض مُسقط مسبقاً ومُطبَّع (تشابه كوسيني بضرب داخلي)
+                projected = self.pca_model.transform(np.asarray(gallery[n_projected:])).astype(np.float32)
+                projected /= np.linalg.norm(projected, axis=1, keepdims=True) + 1e-8
+                self.projected_gallery = projected if self.projected_gallery is None else \
+                    np.concatenate([self.projected_gallery, projected])
+    
+    def _sync_quantized_codes(self, gallery: np.ndarray) -> None:
+        """ترميز العينات المضافة بعد آخر تكميم"""
+        n_encoded = len(self.quantized_codes)
+        if n_encoded < len(gallery):
+            codes, norms = self.quantizer.encode(np.asarray(gallery[n_encoded:]))
+            self.quantized_codes = np.concatenate([self.quantized_codes, codes])
+            self.quantized_norms = np.concatenate([self.quantized_norms, norms])
+    
     def get_pca_variance_ratio(self) -> np.ndarray:
         """الحصول على نسبة التباين المحفوظة من PCA"""
         if self.is_trained:
@@ -171,7 +709,9 @@ class BiometricMatcher:
             'user_ids': self.user_ids,
             'is_trained': self.is_trained,
             'n_components': self.n_components,
-            'svm_kernel': self.svm_kernel
+            'svm_kernel': self.svm_kernel,
+            'template_weights': list(self.template_weights),
+            'inactive_rows': set(self.inactive_rows)
         }
         
         with open(filepath, 'wb') as f:
@@ -181,6 +721,11 @@ class BiometricMatcher:
     
     def load_model(self, filepath: str) -> None:
         """تحميل النموذج"""
+        if os.path.isdir(filepath):
+            # مجلد بصيغة المعرض المعنونة بالذاكرة
+            self.load_gallery(filepath)
+            return
+        
         with open(filepath, 'rb') as f:
             model_data = pickle.load(f)
         
@@ -193,26 +738,244 @@ class BiometricMatcher:
         self.is_trained = model_data['is_trained']
         self.n_components = model_data['n_components']
         self.svm_kernel = model_data['svm_kernel']
+        self.template_weights = model_data.get('template_weights', [1.0] * len(self.user_ids))
+        self.inactive_rows = model_data.get('inactive_rows', set())
+        self._reset_gallery_index()
         
         self.logger.info(f"تم تحميل النموذج من {filepath}")
     
+    def save_gallery(self, directory: str) -> None:
+        """حفظ المعرض بصيغة قابلة للتعنون في الذاكرة (np.memmap)
+
+        يُكتب المعرض كمصفوفة float32 خام، ومعرفات المستخدمين والتسميات
+        كأعمدة منفصلة، ونماذج التطبيع وPCA وSVM في ملف رأس صغير.
+        ملفات كل حفظ تحمل رقم جيل جديد، وملف الرأس الذي يشير إلى الجيل يُستبدل
+        أخيراً بعملية rename واحدة: الانهيار أثناء الحفظ يترك المعرض السابق كاملاً.
+        يُبقى الجيل السابق لقارئ قرأ الرأس القديم للتو ويُحذف ما قبله.
+        """
+        os.makedirs(directory, exist_ok=True)
+        header_path = os.path.join(directory, GALLERY_HEADER_FILE)
+        previous = 0
+        if os.path.exists(header_path):
+            try:
+                with open(header_path, 'r', encoding='utf-8') as f:
+                    previous = int(json.load(f).get('generation', 0))
+            except (ValueError, OSError):
+                previous = 0
+        generation = previous + 1
+        # القوالب المستبدلة لا تُكتب إلى القرص
+        self.compact_gallery()
+        gallery = np.asarray(self._gallery_matrix(), dtype=np.float32)
+        if gallery.ndim != 2:
+            gallery = gallery.reshape(len(self.user_ids), -1)
+        n_samples, dim = gallery.shape
+        
+        def _write(name: str, write: Callable) -> None:
+            # ملف جيل جديد لا يقرؤه أحد قبل استبدال الرأس، فلا حاجة لملف مؤقت
+            with open(gallery_file(directory, name, generation), 'wb') as f:
+                write(f)
+                f.flush()
+                os.fsync(f.fileno())
+        
+        # مصفوفة القوالب الخام
+        _write(GALLERY_TEMPLATES_FILE, lambda f: f.write(np.ascontiguousarray(gallery).tobytes()))
+        
+        # أعمدة المعرفات والتسميات وأوزان الجودة
+        for name, column in ((GALLERY_USER_IDS_FILE, self.user_ids), (GALLERY_LABELS_FILE, self.labels)):
+            _write(name, lambda f: np.save(f, np.array([str(v) for v in column], dtype=str)))
+        _write(GALLERY_WEIGHTS_FILE, lambda f: np.save(f, np.asarray(self.template_weights, dtype=np.float32).reshape(-1)))
+        
+        # الرموز المكممة (إن وجدت)
+        if self.quantizer is not None:
+            self._sync_quantized_codes(self._gallery_matrix())
+            for name, array in ((GALLERY_CODES_FILE, self.quantized_codes), (GALLERY_NORMS_FILE, self.quantized_norms)):
+                _write(name, lambda f: np.save(f, array))
+        
+        # حالة النماذج (صغيرة مقارنة بالمعرض)
+        estimators = {
+            'pca_model': self.pca_model,
+            'svm_model': self.svm_model,
+            'scaler': self.scaler,
+            'quantizer': self.quantizer,
+            'rerank_size': self.rerank_size,
+            'lsh_index': self.lsh_index,
+            'cascade_shortlist': self.cascade_shortlist,
+            'cascade_svm_margin': self.cascade_svm_margin,
+            'template_policy': self.template_policy,
+            'max_templates_per_user': self.max_templates_per_user
+        }
+        _write(GALLERY_ESTIMATORS_FILE, lambda f: pickle.dump(estimators, f))
+        
+        header = {
+            'format': 'palm-gallery',
+            'version': GALLERY_FORMAT_VERSION,
+            'generation': generation,
+            'n_samples': int(n_samples),
+            'dim': int(dim),
+            'dtype': 'float32',
+            'is_trained': bool(self.is_trained),
+            'n_components': self.n_components,
+            'svm_kernel': self.svm_kernel,
+            'enrollment_sequence': int(self.enrollment_sequence),
+            'store_row_id': int(self.store_row_id),
+            'store_deletion_id': int(self.store_deletion_id),
+            'model_profile': self.model_profile
+        }
+        tmp = header_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(header, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, header_path)
+        if hasattr(os, 'O_DIRECTORY'):
+            # تثبيت عملية rename نفسها على القرص
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        
+        # حذف الأجيال الأقدم من السابق (وملفات الإصدار 1 بلا جيل)
+        for entry in os.listdir(directory):
+            entry_generation = _gallery_file_generation(entry)
+            if entry_generation is not None and entry_generation < previous:
+                try:
+                    os.remove(os.path.join(directory, entry))
+                except OSError:
+                    # ملف معنون في الذاكرة على Windows؛ يُحذف في الحفظ التالي
+                    pass
+        
+        self.logger.info(f"تم حفظ المعرض ({n_samples} قالب، الجيل {generation}) في {directory}")
+    
+    def load_gallery(self, directory: str, mmap: bool = True) -> None:
+        """تحميل المعرض من مجلد بصيغة المعرض
+
+        عند mmap=True تُعنون مصفوفة القوالب في الذاكرة دون قراءتها، فتتشارك
+        العمليات المختلفة نفس صفحات الملف ويكون التحميل فورياً. سياسة القوالب
+        المحفوظة تستبدل الحالية؛ لفرض سياسة أخرى يُستدعى set_template_policy بعده.
+        إذا ضُبط model_profile قبل التحميل يُرفض معرض حُفظ بملف نموذج مختلف.
+        """
+        with open(os.path.join(directory, GALLERY_HEADER_FILE), 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        
+        if header.get('format') != 'palm-gallery':
+            raise ValueError(f"الملف ليس معرض بصمات: {directory}")
+        if header.get('version') not in (1, GALLERY_FORMAT_VERSION):
+            raise ValueError(f"إصدار صيغة المعرض غير مدعوم: {header.get('version')}")
+        stored_profile = header.get('model_profile')
+        if self.model_profile and stored_profile and stored_profile != self.model_profile:
+            raise ValueError(f"المعرض مسجل بملف النموذج '{stored_profile}' والنموذج الحالي "
+                             f"'{self.model_profile}'؛ المتجهات غير متوافقة ويجب إعادة التسجيل")
+        generation = header.get('generation', 0)
+        
+        def _path(name: str) -> str:
+            return gallery_file(directory, name, generation)
+        
+        n_samples, dim = header['n_samples'], header['dim']
+        templates_path = _path(GALLERY_TEMPLATES_FILE)
+        if n_samples == 0:
+            templates = np.empty((0, dim), dtype=np.float32)
+        elif mmap:
+            templates = np.memmap(templates_path, dtype=np.float32, mode='r', shape=(n_samples, dim))
+        else:
+            templates = np.fromfile(templates_path, dtype=np.float32).reshape(n_samples, dim)
+        
+        mmap_mode = 'r' if mmap else None
+        user_ids = np.load(_path(GALLERY_USER_IDS_FILE), mmap_mode=mmap_mode)
+        labels = np.load(_path(GALLERY_LABELS_FILE), mmap_mode=mmap_mode)
+        if len(user_ids) != n_samples or len(labels) != n_samples:
+            raise ValueError("أعمدة المعرض غير متطابقة مع الرأس")
+        
+        with open(_path(GALLERY_ESTIMATORS_FILE), 'rb') as f:
+            estimators = pickle.load(f)
+        
+        self.pca_model = estimators['pca_model']
+        self.svm_model = estimators['svm_model']
+        self.scaler = estimators['scaler']
+        self.feature_vectors = templates
+        self.user_ids = user_ids
+        self.labels = labels
+        weights_path = _path(GALLERY_WEIGHTS_FILE)
+        self.template_weights = np.load(weights_path) if os.path.exists(weights_path) else np.ones(n_samples, dtype=np.float32)
+        self.inactive_rows = set()
+        self._user_rows = None
+        self.is_trained = header['is_trained']
+        self.n_components = header['n_components']
+        self.svm_kernel = header['svm_kernel']
+        self.enrollment_sequence = header.get('enrollment_sequence', 0)
+        self.store_row_id = header.get('store_row_id', 0)
+        self.store_deletion_id = header.get('store_deletion_id', 0)
+        self.model_profile = stored_profile or self.model_profile
+        self._reset_gallery_index()
+        
+        quantizer = estimators.get('quantizer')
+        if quantizer is not None:
+            self.quantized_codes = np.load(_path(GALLERY_CODES_FILE))
+            self.quantized_norms = np.load(_path(GALLERY_NORMS_FILE))
+            self.quantizer = quantizer
+            self.rerank_size = estimators.get('rerank_size', self.rerank_size)
+        # دلاء LSH والمعرض المُسقط تُعاد بناؤها عند أول استعلام
+        self.lsh_index = estimators.get('lsh_index')
+        self.cascade_shortlist = estimators.get('cascade_shortlist', 0)
+        self.cascade_svm_margin = estimators.get('cascade_svm_margin')
+        self.template_policy = estimators.get('template_policy', self.template_policy)
+        self.max_templates_per_user = estimators.get('max_templates_per_user', self.max_templates_per_user)
+        
+        self.logger.info(f"تم تحميل المعرض ({n_samples} قالب) من {directory}")
+    
     def get_model_info(self) -> Dict:
         """الحصول على معلومات النموذج"""
         info = {
             'is_trained': self.is_trained,
-            'n_samples': len(self.feature_vectors) if self.is_trained else 0,
+            'n_samples': len(self.feature_vectors) - len(self.inactive_rows) if self.is_trained else 0,
+            'template_policy': self.template_policy,
             'n_components': self.n_components,
             'svm_kernel': self.svm_kernel,
-            'pca_variance_ratio_sum': float(self.pca_model.explained_variance_ratio_.sum()) if self.is_trained else 0.0
+            'pca_variance_ratio_sum': float(self.pca_model.explained_variance_ratio_.sum())
+                if hasattr(self.pca_model, 'explained_variance_ratio_') else 0.0
         }
         return info
 
+class RunningStatistics:
+    """متوسط وتباين متدفقان بخوارزمية Welford (ذاكرة وزمن O(1))"""
+    
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+    
+    def update(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+    
+    @property
+    def variance(self) -> float:
+        return self._m2 / self.count if self.count > 1 else 0.0
+    
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.variance))
+
 class AdvancedBiometricMatcher(BiometricMatcher):
     """نظام مطابقة متقدم مع دعم للتحليل الإحصائي"""
     
-    def __init__(self, n_components: int = 100, svm_kernel: str = 'rbf'):
+    def __init__(self, n_components: int = 100, svm_kernel: str = 'rbf',
+                 history_size: int = 1000,
+                 metrics_exporter: Optional[Callable[[Dict], None]] = None,
+                 export_every: int = 100):
         super().__init__(n_components, svm_kernel)
-        self.match_history = []
+        # سجل محدود لآخر المطابقات (حلقي) مع إحصائيات تراكمية متدفقة
+        self.match_history = deque(maxlen=history_size)
+        self.total_matches = 0
+        self.successful_matches = 0
+        self.confidence_stats = RunningStatistics()
+        self.similarity_stats = RunningStatistics()
+        
+        # تصدير دوري اختياري للإحصائيات (مثلاً إلى واجهة المقاييس)
+        self.metrics_exporter = metrics_exporter
+        self.export_every = export_every
         
     def advanced_match(self, feature_vector: np.ndarray, threshold: float = 0.7) -> Dict:
         """مطابقة متقدمة مع تحليل إضافي"""
@@ -226,9 +989,9 @@ class AdvancedBiometricMatcher(BiometricMatcher):
             # حساب المسافة إلى مركز المجموعة
             distances = []
             for label in set(self.labels):
-                label_indices = [i for i, l in enumerate(self.labels) if l == label]
+                label_indices = [i for i, l in enumerate(self.labels) if l == label and i not in self.inactive_rows]
                 if label_indices:
-                    label_vectors = np.array(self.feature_vectors)[label_indices]
+                    label_vectors = self._gallery_matrix()[label_indices]
                     label_mean = np.mean(label_vectors, axis=0)
                     distance = np.linalg.norm(query_scaled - label_mean)
                     distances.append((label, distance))
@@ -241,31 +1004,525 @@ class AdvancedBiometricMatcher(BiometricMatcher):
             ]
         
         # إضافة إلى سجل المطابقات
+        self.record_match(basic_result)
+        
+        return basic_result
+    
+    def record_match(self, result: Dict) -> None:
+        """تسجيل نتيجة مطابقة في السجل الحلقي وتحديث الإحصائيات التراكمية"""
+        # نحتفظ بملخص صغير فقط بدلاً من متجه الاستعلام والنتيجة الكاملة
         self.match_history.append({
             'timestamp': np.datetime64('now'),
-            'query_vector': feature_vector.tolist(),
-            'result': basic_result
+            'is_match': bool(result['is_match']),
+            'confidence': float(result['confidence']),
+            'similarity_score': float(result['similarity_score']),
+            'user_id': result['match_details']['user_id']
         })
         
-        return basic_result
+        self.total_matches += 1
+        if result['is_match']:
+            self.successful_matches += 1
+        self.confidence_stats.update(float(result['confidence']))
+        self.similarity_stats.update(float(result['similarity_score']))
+        
+        if self.metrics_exporter is not None and self.total_matches % self.export_every == 0:
+            try:
+                self.metrics_exporter(self.get_matching_statistics())
+            except Exception as e:
+                self.logger.warning(f"فشل تصدير إحصائيات المطابقة: {str(e)}")
     
     def get_matching_statistics(self) -> Dict:
-        """الحصول على إحصائيات المطابقة"""
-        if not self.match_history:
+        """الحصول على إحصائيات المطابقة (O(1) من المجاميع التراكمية)"""
+        if self.total_matches == 0:
             return {'total_matches': 0}
         
-        successful_matches = [h for h in self.match_history if h['result']['is_match']]
-        
         stats = {
-            'total_matches': len(self.match_history),
-            'successful_matches': len(successful_matches),
-            'success_rate': len(successful_matches) / len(self.match_history) if self.match_history else 0,
-            'avg_confidence': np.mean([h['result']['confidence'] for h in self.match_history]) if self.match_history else 0,
-            'avg_similarity': np.mean([h['result']['similarity_score'] for h in self.match_history]) if self.match_history else 0
+            'total_matches': self.total_matches,
+            'successful_matches': self.successful_matches,
+            'success_rate': self.successful_matches / self.total_matches,
+            'avg_confidence': self.confidence_stats.mean,
+            'std_confidence': self.confidence_stats.std,
+            'avg_similarity': self.similarity_stats.mean,
+            'std_similarity': self.similarity_stats.std,
+            'recent_history_size': len(self.match_history)
         }
         
         return stats
 
+class ConcurrentGallery:
+    """معرض آمن للتزامن بلقطات نسخ-عند-الكتابة (Copy-on-Write)
+
+    القراءة تطابق مع لقطة ثابتة بدون أقفال (قراءة المرجع ذرية)، والكتابات
+    تُجمع في دفعات وتُنشر كلقطة جديدة باستبدال مرجع واحد. يمكن إعادة تحميل
+    معرض محفوظ في الخلفية واستبداله دون توقف الخدمة.
+    """
+    
+    def __init__(self, matcher: BiometricMatcher, batch_size: int = 32, max_delay: float = 0.05,
+                 template_store=None, enrollment_log=None):
+        self.logger = logging.getLogger(__name__)
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.version = 0
+        # مستودع القوالب المشترك (اختياري): المصدر الدائم للتسجيلات بين العمال
+        self.template_store = template_store
+        self.store_row_id = matcher.store_row_id
+        self.store_deletion_id = matcher.store_deletion_id
+        # سجل التسجيل (اختياري): يُعاد منه ما لا تتضمنه اللقطة المحمّلة عند reload_async
+        self.enrollment_log = enrollment_log
+        
+        # المطابق الأصلي يبقى لحفظ الإحصائيات فقط، والقراءة من اللقطات
+        self._matcher = matcher
+        self._snapshot = self._freeze(matcher)
+        self._pending = []
+        self._write_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        
+        # نشر الدفعات غير المكتملة بعد max_delay ثانية كحد أقصى
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+    
+    @staticmethod
+    def _freeze(matcher: BiometricMatcher) -> BiometricMatcher:
+        """إنشاء لقطة للقراءة فقط يكون فيها المعرض مصفوفة ثابتة"""
+        snapshot = copy.copy(matcher)
+        if matcher.is_trained:
+            snapshot.feature_vectors = matcher._gallery_matrix()
+            snapshot.labels = list(matcher.labels)
+            snapshot.user_ids = list(matcher.user_ids)
+            snapshot.template_weights = list(matcher.template_weights)
+        snapshot._gallery_cache = None
+        if snapshot.is_trained:
+            snapshot._sync_indexes(snapshot.feature_vectors)
+        return snapshot
+    
+    def snapshot(self) -> BiometricMatcher:
+        """اللقطة الحالية (يجب عدم تعديلها)"""
+        return self._snapshot
+    
+    def match_palm_print(self, feature_vector: np.ndarray, threshold: float = 0.7) -> Dict:
+        """مطابقة بدون أقفال مع اللقطة الحالية"""
+        return self._snapshot.match_palm_print(feature_vector, threshold)
+    
+    def find_best_matches(self, query_vector: np.ndarray, top_k: int = 5) -> List[Dict]:
+        """إيجاد أفضل المطابقات بدون أقفال مع اللقطة الحالية"""
+        return self._snapshot.find_best_matches(query_vector, top_k)
+    
+    def add_palm_sample(self, feature_vector: np.ndarray, label: str, user_id: str,
+                        quality: float = 1.0, sequence: Optional[int] = None) -> None:
+        """إضافة عينة إلى الدفعة المعلقة، وتُنشر عند امتلاء الدفعة أو انقضاء المهلة
+
+        sequence: تسلسل العينة في سجل التسجيل؛ تُتجاهل إن كانت اللقطة تتضمنه
+        (أعيدت من السجل عند reload_async)، وإلا يصبح enrollment_sequence للقطة.
+        """
+        with self._write_lock:
+            self._pending.append((np.asarray(feature_vector), label, user_id, quality, sequence))
+            if len(self._pending) >= self.batch_size:
+                self._publish_pending()
+    
+    def flush(self) -> None:
+        """نشر العينات المعلقة فوراً"""
+        with self._write_lock:
+            self._publish_pending()
+    
+    def _publish_pending(self) -> None:
+        """بناء لقطة جديدة من اللقطة الحالية والدفعة المعلقة ثم نشرها (تحت قفل الكتابة)"""
+        if not self._pending:
+            return
+        
+        current = self._snapshot
+        pending = [sample for sample in self._pending
+                   if sample[4] is None or sample[4] > current.enrollment_sequence]
+        self._pending = []
+        if not pending:
+            return
+        
+        snapshot = copy.copy(current)
+        snapshot.enrollment_sequence = max([current.enrollment_sequence] +
+                                           [sequence for *_, sequence in pending if sequence is not None])
+        if current.template_policy != 'append' and current.is_trained:
+            # دمج القوالب يحتاج منطق add_palm_sample: نعمل على نسخة بقوائم صفوف
+            # (مراجع للصفوف بدون نسخ القيم) ثم نعيد بناء مصفوفة ثابتة
+            snapshot.feature_vectors = list(current._gallery_matrix())
+            snapshot.labels = list(current.labels)
+            snapshot.user_ids = list(current.user_ids)
+            snapshot.template_weights = list(current.template_weights)
+            snapshot._gallery_cache = None
+            for vector, label, user_id, quality, _ in pending:
+                snapshot.add_palm_sample(vector, label, user_id, quality)
+            snapshot.feature_vectors = snapshot._gallery_matrix()
+        else:
+            new_vectors = np.vstack([vector.reshape(1, -1) for vector, *_ in pending])
+            if current.is_trained and len(current.user_ids) > 0:
+                gallery = current._gallery_matrix()
+                snapshot.feature_vectors = np.vstack([gallery, new_vectors.astype(gallery.dtype)])
+            else:
+                snapshot.feature_vectors = new_vectors
+            snapshot.labels = list(current.labels) + [label for _, label, *_ in pending]
+            snapshot.user_ids = list(current.user_ids) + [user_id for _, _, user_id, *_ in pending]
+            snapshot.template_weights = list(current.template_weights) + \
+                [max(float(quality), 1e-3) for _, _, _, quality, _ in pending]
+            snapshot._user_rows = None
+        snapshot.is_trained = True
+        snapshot._gallery_cache = None
+        snapshot._sync_indexes(snapshot.feature_vectors)
+        
+        # الاستبدال الذري: القراء الحاليون يكملون على اللقطة القديمة
+        self._snapshot = snapshot
+        self.version += 1
+    
+    def sync_store(self) -> int:
+        """نشر تغييرات المستودع (من هذه العملية أو غيرها) وإرجاع عدد القوالب والمستخدمين المحذوفين
+
+        حذف المستخدم يُطبق أولاً كلقطة جديدة تُستبعد فيها صفوفه، ثم تُنشر القوالب الجديدة.
+        """
+        if self.template_store is None:
+            return 0
+        with self._write_lock:
+            (ids, vectors, labels, user_ids, qualities), (deletion_ids, deleted_users) = \
+                self.template_store.fetch_changes_since(self.store_row_id, self.store_deletion_id)
+            if len(deletion_ids):
+                # العينات المعلقة أقدم من الحذف فتُنشر قبله
+                self._publish_pending()
+                snapshot = copy.copy(self._snapshot)
+                if snapshot.is_trained:
+                    for user_id in set(deleted_users):
+                        snapshot.retire_user(user_id)
+                self.store_deletion_id = snapshot.store_deletion_id = int(deletion_ids[-1])
+                self._snapshot = snapshot
+                self.version += 1
+            if len(ids) == 0:
+                return len(set(deleted_users))
+            self._pending.extend((vector, label, user_id, quality, None)
+                                 for vector, label, user_id, quality in zip(vectors, labels, user_ids, qualities.tolist()))
+            self.store_row_id = int(ids[-1])
+            self._publish_pending()
+            self._snapshot.store_row_id = self.store_row_id
+        return len(ids) + len(set(deleted_users))
+    
+    def _flush_loop(self) -> None:
+        while not self._closed.wait(self.max_delay):
+            if self._pending:
+                self.flush()
+    
+    def reload_async(self, directory: str, max_attempts: int = 3) -> threading.Thread:
+        """تحميل معرض محفوظ في الخلفية ثم استبداله باللقطة الحالية دون توقف
+
+        تسجيلات سجل التسجيل الأحدث من enrollment_sequence للمعرض المحمّل تُعاد فوقه
+        قبل النشر، وإلا ضاعت من الذاكرة ثم حذفها الضغط التالي من السجل.
+        """
+        def _reload():
+            try:
+                current = self._snapshot
+                for _ in range(max_attempts):
+                    fresh = BiometricMatcher()
+                    fresh.model_profile = current.model_profile
+                    fresh.load_gallery(directory)
+                    # سياسة القوالب المضبوطة للخدمة تبقى كما هي بعد الاستبدال
+                    fresh.set_template_policy(current.template_policy, current.max_templates_per_user)
+                    with self._write_lock:
+                        if self.enrollment_log is not None:
+                            # ضغط متزامن حذف سجلات أحدث من اللقطة المحمّلة: نعيد تحميل اللقطة الجديدة
+                            if self.enrollment_log.compacted_sequence > fresh.enrollment_sequence:
+                                continue
+                            # التسجيلات حتى last_sequence تُعاد من السجل، والأحدث تصل عبر الدفعة المعلقة
+                            last_sequence = self.enrollment_log.last_sequence
+                            self.enrollment_log.replay(fresh.add_palm_sample, after_sequence=fresh.enrollment_sequence,
+                                                       up_to_sequence=last_sequence)
+                            fresh.enrollment_sequence = max(fresh.enrollment_sequence, last_sequence)
+                        self._snapshot = self._freeze(fresh)
+                        self.version += 1
+                        # العينات المعلقة غير المضمّنة تُطبق فوق المعرض الجديد
+                        self._publish_pending()
+                        self.store_row_id = fresh.store_row_id
+                        self.store_deletion_id = fresh.store_deletion_id
+                    break
+                else:
+                    raise RuntimeError(f"سجل التسجيل ضُغط بعد اللقطة المحمّلة في {max_attempts} محاولات")
+                # قوالب المستودع الأحدث من اللقطة المحفوظة
+                self.sync_store()
+                self.logger.info(f"تم استبدال المعرض من {directory} (الإصدار {self.version})")
+            except Exception as e:
+                self.logger.error(f"فشل إعادة تحميل المعرض من {directory}: {str(e)}")
+        
+        thread = threading.Thread(target=_reload, daemon=True)
+        thread.start()
+        return thread
+    
+    def compact_log(self, directory: str) -> int:
+        """حفظ اللقطة الحالية في directory ثم حذف سجلات التسجيل المضمّنة فيها
+
+        الضغط يصل إلى enrollment_sequence للقطة فقط (ما يحتويه المعرض فعلاً)، لا إلى
+        آخر تسلسل في السجل. يعيد التسلسل المضغوط حتى (0 إن لم يكن هناك ما يُضغط).
+        """
+        if self.enrollment_log is None:
+            return 0
+        self.flush()
+        snapshot = copy.copy(self._snapshot)
+        sequence = snapshot.enrollment_sequence
+        if not snapshot.is_trained or sequence <= self.enrollment_log.compacted_sequence:
+            return 0
+        snapshot.save_gallery(directory)
+        self.enrollment_log.compact(min(sequence, self.enrollment_log.last_sequence))
+        return sequence
+    
+    def record_match(self, result: Dict) -> None:
+        """تسجيل نتيجة المطابقة في إحصائيات المطابق الأصلي"""
+        if hasattr(self._matcher, 'record_match'):
+            with self._stats_lock:
+                self._matcher.record_match(result)
+    
+    def get_matching_statistics(self) -> Dict:
+        """إحصائيات المطابقة من المطابق الأصلي"""
+        if hasattr(self._matcher, 'get_matching_statistics'):
+            with self._stats_lock:
+                return self._matcher.get_matching_statistics()
+        return {'total_matches': 0}
+    
+    def get_model_info(self) -> Dict:
+        """معلومات اللقطة الحالية"""
+        info = self._snapshot.get_model_info()
+        info['snapshot_version'] = self.version
+        info['pending_samples'] = len(self._pending)
+        return info
+    
+    def close(self) -> None:
+        """إيقاف خيط النشر بعد نشر العينات المعلقة"""
+        self._closed.set()
+        self.flush()
+
+def shard_for_user(user_id: str, n_shards: int) -> int:
+    """تحديد القطعة (Shard) الخاصة بالمستخدم عبر تجزئة ثابتة لمعرّفه"""
+    # نستخدم crc32 لأن hash() في Python عشوائي بين العمليات
+    return zlib.crc32(str(user_id).encode('utf-8')) % n_shards
+
+def _shard_worker(conn, shard_index: int, n_shards: int) -> None:
+    """حلقة عملية القطعة: تحتفظ بجزء من المعرض وتعيد أفضل k مطابقات محلية"""
+    feature_vectors = []
+    labels = []
+    user_ids = []
+    weights = []
+    gallery = None
+    # سياسة القوالب للقطعة (نفس BiometricMatcher.set_template_policy)
+    template_policy, max_templates_per_user = 'append', 3
+    
+    while True:
+        command, payload = conn.recv()
+        if command == 'stop':
+            break
+        try:
+            if command == 'policy':
+                template_policy, max_templates_per_user = payload
+                result = None
+            elif command == 'add':
+                vector, label, user_id, quality = payload
+                rows = [i for i, uid in enumerate(user_ids) if uid == user_id] \
+                    if template_policy != 'append' else []
+                if rows:
+                    # دمج العينة مع قوالب المستخدم كما في BiometricMatcher.add_palm_sample
+                    fused, fused_weights = fuse_templates(
+                        np.vstack([feature_vectors[i] for i in rows]).astype(np.float64),
+                        np.array([weights[i] for i in rows]), np.asarray(vector, dtype=np.float64), quality,
+                        1 if template_policy == 'mean' else max_templates_per_user)
+                    for i in reversed(rows):
+                        del feature_vectors[i], labels[i], user_ids[i], weights[i]
+                    vectors, vector_weights = list(fused.astype(np.float32)), fused_weights.tolist()
+                else:
+                    vectors, vector_weights = [np.asarray(vector, dtype=np.float32)], [max(float(quality), 1e-3)]
+                feature_vectors.extend(vectors)
+                labels.extend([label] * len(vectors))
+                user_ids.extend([user_id] * len(vectors))
+                weights.extend(vector_weights)
+                gallery = None
+                result = None
+            elif command == 'load_gallery':
+                # كل عملية تفتح نفس ملف المعرض وتحتفظ بصفوف قطعتها فقط
+                shard_matcher = BiometricMatcher()
+                shard_matcher.load_gallery(payload)
+                indices = [i for i, uid in enumerate(shard_matcher.user_ids)
+                           if shard_for_user(uid, n_shards) == shard_index and i not in shard_matcher.inactive_rows]
+                templates = shard_matcher._gallery_matrix()
+                feature_vectors = [np.asarray(templates[i], dtype=np.float32) for i in indices]
+                labels = [str(shard_matcher.labels[i]) for i in indices]
+                user_ids = [str(shard_matcher.user_ids[i]) for i in indices]
+                weights = [float(shard_matcher.template_weights[i]) for i in indices]
+                template_policy = shard_matcher.template_policy
+                max_templates_per_user = shard_matcher.max_templates_per_user
+                gallery = None
+                result = len(indices)
+            elif command == 'top_k':
+                query, top_k = payload
+                if not feature_vectors:
+                    result = []
+                else:
+                    if gallery is None:
+                        gallery = np.vstack(feature_vectors)
+                    similarities = cosine_similarity(query.astype(gallery.dtype), gallery).flatten()
+                    # عدة قوالب لكل مستخدم: أفضل تشابه لكل مستخدم (المستخدم في قطعة واحدة)
+                    per_row = top_k if template_policy == 'append' else top_k * max_templates_per_user
+                    k = min(per_row, len(similarities))
+                    top = np.argpartition(-similarities, k - 1)[:k]
+                    top = top[np.argsort(-similarities[top], kind='stable')]
+                    seen = set()
+                    result = [(float(similarities[i]), user_ids[i], labels[i]) for i in top
+                              if template_policy == 'append' or not (user_ids[i] in seen or seen.add(user_ids[i]))][:top_k]
+            elif command == 'size':
+                result = len(feature_vectors)
+            else:
+                raise ValueError(f"أمر غير معروف: {command}")
+            conn.send(('ok', result))
+        except Exception as e:
+            conn.send(('error', str(e)))
+    
+    conn.close()
+
+class ShardedBiometricMatcher:
+    """مطابقة موزعة على عدة عمليات محلية مع بحث scatter-gather
+
+    تُوزَّع القوالب على العمليات حسب تجزئة user_id، ويُرسل كل استعلام إلى
+    جميع القطع بالتوازي ثم تُدمج أفضل k نتائج من كل قطعة.
+    """
+    
+    def __init__(self, n_shards: int = 4, start_method: str = 'spawn'):
+        self.logger = logging.getLogger(__name__)
+        if n_shards < 1:
+            raise ValueError("عدد القطع يجب أن يكون 1 على الأقل")
+        self.n_shards = n_shards
+        self.scaler = StandardScaler()
+        self.is_trained = False
+        self._lock = threading.Lock()
+        
+        context = mp.get_context(start_method)
+        self._connections = []
+        self._processes = []
+        for shard_index in range(n_shards):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=_shard_worker,
+                args=(child_conn, shard_index, n_shards),
+                daemon=True
+            )
+            process.start()
+            child_conn.close()
+            self._connections.append(parent_conn)
+            self._processes.append(process)
+    
+    def _request(self, shard_index: int, command: str, payload=None):
+        """إرسال أمر إلى قطعة واحدة وانتظار الرد"""
+        with self._lock:
+            conn = self._connections[shard_index]
+            conn.send((command, payload))
+            status, result = conn.recv()
+        if status != 'ok':
+            raise RuntimeError(f"خطأ في القطعة {shard_index}: {result}")
+        return result
+    
+    def _broadcast(self, command: str, payload=None) -> List:
+        """إرسال أمر إلى جميع القطع بالتوازي ثم جمع الردود"""
+        with self._lock:
+            for conn in self._connections:
+                conn.send((command, payload))
+            replies = [conn.recv() for conn in self._connections]
+        errors = [result for status, result in replies if status != 'ok']
+        if errors:
+            raise RuntimeError(f"خطأ في القطع: {errors}")
+        return [result for _, result in replies]
+    
+    def add_palm_sample(self, feature_vector: np.ndarray, label: str, user_id: str,
+                        quality: float = 1.0) -> None:
+        """إضافة عينة إلى القطعة الخاصة بالمستخدم (تُدمج حسب سياسة القوالب)"""
+        shard_index = shard_for_user(user_id, self.n_shards)
+        self._request(shard_index, 'add', (np.asarray(feature_vector, dtype=np.float32), label, user_id, quality))
+        self.is_trained = True
+    
+    def set_template_policy(self, policy: str, max_templates_per_user: int = 3) -> None:
+        """سياسة القوالب في كل القطع ('append' أو 'mean' أو 'cluster')"""
+        if policy not in TEMPLATE_POLICIES:
+            raise ValueError(f"سياسة القوالب غير مدعومة: {policy}")
+        if max_templates_per_user < 1:
+            raise ValueError("عدد القوالب لكل مستخدم يجب أن يكون 1 على الأقل")
+        self._broadcast('policy', (policy, max_templates_per_user))
+    
+    def load_from_matcher(self, matcher: BiometricMatcher) -> None:
+        """توزيع معرض مطابق موجود على القطع (الصفوف النشطة فقط وبنفس سياسة القوالب)"""
+        if not matcher.is_trained:
+            raise ValueError("النموذج غير مدرّب. قم بتدريبه أولاً.")
+        self.scaler = matcher.scaler
+        # الصفوف النشطة مدمجة مسبقاً، فتُنقل كما هي ثم تُضبط السياسة للتسجيلات التالية
+        self.set_template_policy('append')
+        gallery = matcher._gallery_matrix()
+        for i, user_id in enumerate(matcher.user_ids):
+            if i in matcher.inactive_rows:
+                continue
+            self.add_palm_sample(gallery[i], str(matcher.labels[i]), str(user_id), matcher.template_weights[i])
+        self.set_template_policy(matcher.template_policy, matcher.max_templates_per_user)
+    
+    def load_gallery(self, directory: str) -> None:
+        """تحميل معرض محفوظ بصيغة save_gallery، كل قطعة تعنون صفوفها فقط"""
+        header_matcher = BiometricMatcher()
+        header_matcher.load_gallery(directory)
+        self.scaler = header_matcher.scaler
+        counts = self._broadcast('load_gallery', directory)
+        self.is_trained = header_matcher.is_trained
+        self.logger.info(f"تم توزيع المعرض على {self.n_shards} قطع: {counts}")
+    
+    def find_best_matches(self, query_vector: np.ndarray, top_k: int = 5) -> List[Dict]:
+        """إيجاد أفضل المطابقات عبر جميع القطع (نفس شكل BiometricMatcher.find_best_matches)"""
+        if not self.is_trained:
+            raise ValueError("النموذج غير مدرّب. قم بتدريبه أولاً.")
+        
+        query = query_vector.reshape(1, -1)
+        if hasattr(self.scaler, 'mean_'):
+            query = self.scaler.transform(query)
+        
+        # scatter: كل قطعة تعيد أفضل k محلياً، gather: دمج النتائج
+        shard_results = self._broadcast('top_k', (query, top_k))
+        candidates = heapq.nlargest(
+            top_k,
+            (candidate for results in shard_results for candidate in results),
+            key=lambda c: c[0]
+        )
+        
+        matches = []
+        for similarity, user_id, label in candidates:
+            matches.append({
+                'user_id': user_id,
+                'label': label,
+                'similarity': similarity,
+                'rank': len(matches) + 1
+            })
+        return matches
+    
+    def get_model_info(self) -> Dict:
+        """الحصول على معلومات التوزيع"""
+        shard_sizes = self._broadcast('size')
+        return {
+            'is_trained': self.is_trained,
+            'n_samples': sum(shard_sizes),
+            'n_shards': self.n_shards,
+            'shard_sizes': shard_sizes
+        }
+    
+    def close(self) -> None:
+        """إيقاف عمليات القطع"""
+        with self._lock:
+            for conn in self._connections:
+                try:
+                    conn.send(('stop', None))
+                    conn.close()
+                except (OSError, BrokenPipeError):
+                    pass
+            for process in self._processes:
+                process.join(timeout=5)
+            self._connections = []
+            self._processes = []
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
 # مثال على الاستخدام
 if __name__ == "__main__":
     matcher = AdvancedBiometricMatcher(n_components=50)
@@ -0,0 +1,98 @@
+"""
+خط إدخال tf.data لتدريب نماذج بصمة الكف
+فك الترميز والتحسين بالتوازي، تخزين مؤقت على القرص، جلب مسبق وتقسيم حتمي بين العمال
+"""
+import tensorflow as tf
+import numpy as np
+import cv2
+from typing import Optional, Sequence, Tuple, Union
+
+AUTOTUNE = tf.data.AUTOTUNE
+
+def augment_batch(images: np.ndarray, seed: np.ndarray, rotation_degrees: float = 15.0,
+                  shift: float = 0.1, zoom: float = 0.1) -> np.ndarray:
+    """تحسينات مكافئة لـ DeepCNNAnalyzer.create_data_generator على دفعة كاملة
+
+    الدوران والإزاحة والتكبير تُدمج في تحويل أفيني واحد لكل صورة (cv2.warpAffine
+    يحرر GIL فتتوازى الدفعات)، والبذرة لكل دفعة تجعل التحسينات حتمية.
+    """
+    rng = np.random.default_rng(np.asarray(seed, dtype=np.uint64))
+    height, width = images.shape[1:3]
+    center = ((width - 1) / 2, (height - 1) / 2)
+    augmented = np.empty_like(images)
+    for i, image in enumerate(images):
+        matrix = cv2.getRotationMatrix2D(center, rng.uniform(-rotation_degrees, rotation_degrees),
+                                         rng.uniform(1 - zoom, 1 + zoom))
+        matrix[:, 2] += (rng.uniform(-shift, shift) * width, rng.uniform(-shift, shift) * height)
+        warped = cv2.warpAffine(image, matrix, (width, height), flags=cv2.INTER_LINEAR,
+                                borderMode=cv2.BORDER_REPLICATE)
+        augmented[i] = warped[:, ::-1] if rng.random() < 0.5 else warped
+    return augmented
+
+def _augment_tensor(images: tf.Tensor, seed: tf.Tensor) -> tf.Tensor:
+    augmented = tf.numpy_function(augment_batch, [images, seed], tf.float32, stateful=False)
+    augmented.set_shape(images.shape)
+    return augmented
+
+def _decode_and_resize(source, image_size: Tuple[int, int]) -> tf.Tensor:
+    """مسار ملف أو مصفوفة صورة → float32 بحجم الإدخال ومطبّع إلى [0, 1]"""
+    if source.dtype == tf.string:
+        image = tf.io.decode_image(tf.io.read_file(source), channels=3, expand_animations=False)
+    else:
+        image = source
+        if image.shape.rank == 2:
+            image = tf.stack([image] * 3, axis=-1)
+    image = tf.image.resize(tf.cast(image, tf.float32), image_size)
+    return image / 255.0
+
+def build_training_dataset(images: Union[Sequence[str], np.ndarray],
+                           labels: np.ndarray,
+                           image_size: Tuple[int, int] = (224, 224),
+                           batch_size: int = 32,
+                           augment: bool = True,
+                           shuffle: bool = True,
+                           cache_path: Optional[str] = None,
+                           num_shards: int = 1,
+                           shard_index: int = 0,
+                           deterministic: bool = True,
+                           seed: int = 42) -> tf.data.Dataset:
+    """بناء tf.data.Dataset للتدريب من مسارات صور أو مصفوفة صور
+
+    cache_path: ملف تخزين مؤقت للصور بعد فك الترميز والتحجيم (قبل التحسين)،
+    فتقرأ الحقب التالية من القرص بدلاً من فك ترميز JPEG من جديد. '' للذاكرة.
+    num_shards/shard_index: تقسيم حتمي للعينات بين العمال قبل فك الترميز.
+    """
+    if isinstance(images, np.ndarray):
+        sources = images
+    else:
+        sources = np.asarray([str(path) for path in images])
+    dataset = tf.data.Dataset.from_tensor_slices((sources, np.asarray(labels)))
+    if num_shards > 1:
+        dataset = dataset.shard(num_shards, shard_index)
+
+    dataset = dataset.map(lambda source, label: (_decode_and_resize(source, image_size), label),
+                          num_parallel_calls=AUTOTUNE, deterministic=deterministic)
+    if cache_path is not None:
+        dataset = dataset.cache(cache_path)
+    if shuffle:
+        dataset = dataset.shuffle(buffer_size=1024, seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size, num_parallel_calls=AUTOTUNE, deterministic=deterministic)
+
+    if augment:
+        # التحسين على دفعات كاملة (عمليات متجهة) بدلاً من صورة بصورة، ببذرة لكل دفعة
+        seeds = tf.data.Dataset.random(seed=seed).batch(2)
+        dataset = tf.data.Dataset.zip((dataset, seeds))
+        dataset = dataset.map(lambda batch, batch_seed: (_augment_tensor(batch[0], batch_seed), batch[1]),
+                              num_parallel_calls=AUTOTUNE, deterministic=deterministic)
+
+    options = tf.data.Options()
+    options.deterministic = deterministic
+    dataset = dataset.with_options(options)
+    return dataset.prefetch(AUTOTUNE)
+
+def build_validation_dataset(images: Union[Sequence[str], np.ndarray], labels: np.ndarray,
+                             image_size: Tuple[int, int] = (224, 224), batch_size: int = 32,
+                             cache_path: Optional[str] = None) -> tf.data.Dataset:
+    """مجموعة التحقق: نفس فك الترميز والتحجيم بدون تحسين أو خلط"""
+    return build_training_dataset(images, labels, image_size, batch_size, augment=False, shuffle=False,
+                                  cache_path=cache_path)
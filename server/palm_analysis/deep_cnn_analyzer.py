@@ -9,7 +9,7 @@ from tensorflow.keras.layers import (
     Dense, Dropout, BatchNormalization, Input, 
     Activation, Add, GlobalMaxPooling2D
 )
-from tensorflow.keras.applications import ResNet50, VGG16, EfficientNetB0
+from tensorflow.keras.applications import ResNet50, VGG16, EfficientNetB0, MobileNetV2
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau, ModelCheckpoint
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
@@ -18,14 +18,38 @@ import numpy as np
 from typing import Tuple, Optional, Dict, List
 import logging
 
+try:
+    from .inference import CompiledInference, DEFAULT_WARMUP_BATCH_SIZES
+    from .tflite_backend import TFLiteInference
+    from .data_pipeline import build_training_dataset, build_validation_dataset
+    from .backbones import compact_separable_trunk
+except ImportError:
+    from inference import CompiledInference, DEFAULT_WARMUP_BATCH_SIZES
+    from tflite_backend import TFLiteInference
+    from data_pipeline import build_training_dataset, build_validation_dataset
+    from backbones import compact_separable_trunk
+
+class MonteCarloDropout(Dropout):
+    """Dropout نشط دائماً، حتى عند الاستدلال (لتقدير عدم اليقين بـ MC Dropout)"""
+    
+    def call(self, inputs, training=None):
+        return super().call(inputs, training=True)
+
 class DeepCNNAnalyzer:
-    def __init__(self, input_shape: Tuple[int, int, int] = (224, 224, 3), num_classes: int = 128):
+    def __init__(self, input_shape: Tuple[int, int, int] = (224, 224, 3), num_classes: int = 128,
+                 jit_compile: bool = False):
         self.logger = logging.getLogger(__name__)
         self.input_shape = input_shape
         self.num_classes = num_classes
         self.model = None
         self.trained = False
         
+        # الاستدلال المُجمّع يُبنى عند الحاجة ويُعاد بناؤه عند استبدال النموذج
+        self.jit_compile = jit_compile
+        self._inference = None
+        # محرك بديل اختياري (TFLite) يُلغى عند تغيير أوزان النموذج
+        self.inference_backend = None
+        
         # إعداد TensorFlow
         tf.config.run_functions_eagerly(False)  # لتحسين الأداء
         
@@ -86,7 +110,12 @@ class DeepCNNAnalyzer:
         return model
     
     def build_transfer_learning_model(self, base_model_name: str = 'ResNet50') -> Model:
-        """بناء نموذج باستخدام التعلم النقل (Transfer Learning)"""
+        """بناء نموذج باستخدام التعلم النقل (Transfer Learning)
+
+        الخيارات المدمجة لميزانيات الزمن المنخفضة (مع input_shape بدقة 128 أو 160):
+        MobileNetV2 (alpha=0.35، أوزان ImageNet) وCompactSeparable (جذع قابل للفصل
+        عمقياً من backbones بدون أوزان مسبقة فيُدرّب كاملاً).
+        """
         inputs = Input(shape=self.input_shape)
         
         # اختيار نموذج أساسي
@@ -96,11 +125,15 @@ class DeepCNNAnalyzer:
             base_model = VGG16(weights='imagenet', include_top=False, input_tensor=inputs)
         elif base_model_name == 'EfficientNetB0':
             base_model = EfficientNetB0(weights='imagenet', include_top=False, input_tensor=inputs)
+        elif base_model_name == 'MobileNetV2':
+            base_model = MobileNetV2(weights='imagenet', include_top=False, input_tensor=inputs, alpha=0.35)
+        elif base_model_name == 'CompactSeparable':
+            base_model = Model(inputs=inputs, outputs=compact_separable_trunk(inputs), name='compact_separable')
         else:
             raise ValueError(f"النموذج غير مدعوم: {base_model_name}")
         
         # تجميد طبقات النموذج الأساسي
-        base_model.trainable = False
+        base_model.trainable = base_model_name == 'CompactSeparable'
         
         # إضافة طبقات متخصصة
         x = base_model.output
@@ -128,12 +161,18 @@ class DeepCNNAnalyzer:
         return model
     
     def train_model(self, 
-                   train_data: np.ndarray, 
-                   train_labels: np.ndarray,
-                   validation_data: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+                   train_data, 
+                   train_labels: Optional[np.ndarray] = None,
+                   validation_data=None,
                    epochs: int = 50,
                    batch_size: int = 32) -> Dict:
-        """تدريب النموذج"""
+        """تدريب النموذج
+
+        train_data: مصفوفة صور مع train_labels، أو tf.data.Dataset من create_dataset
+        (الدفعات والتحسين محددة فيه، فلا تُمرر train_labels ولا batch_size).
+        validation_data مع tf.data.Dataset: مجموعة جاهزة أو (الصور أو المسارات، التسميات)
+        فتُبنى بـ build_validation_dataset بحجم الإدخال ودفعات batch_size.
+        """
         if self.model is None:
             self.model = self.build_custom_cnn()
             self.model = self.compile_model(self.model)
@@ -146,16 +185,30 @@ class DeepCNNAnalyzer:
         ]
         
         # تدريب النموذج
-        history = self.model.fit(
-            train_data, train_labels,
-            validation_data=validation_data,
-            epochs=epochs,
-            batch_size=batch_size,
-            callbacks=callbacks,
-            verbose=1
-        )
+        if isinstance(train_data, tf.data.Dataset):
+            if isinstance(validation_data, tuple):
+                # نفس فك الترميز والتحجيم بدون تحسين أو خلط
+                validation_data = build_validation_dataset(*validation_data, image_size=self.input_shape[:2],
+                                                           batch_size=batch_size)
+            history = self.model.fit(
+                train_data,
+                validation_data=validation_data,
+                epochs=epochs,
+                callbacks=callbacks,
+                verbose=1
+            )
+        else:
+            history = self.model.fit(
+                train_data, train_labels,
+                validation_data=validation_data,
+                epochs=epochs,
+                batch_size=batch_size,
+                callbacks=callbacks,
+                verbose=1
+            )
         
         self.trained = True
+        self._invalidate_inference_cache()
         return history.history
     
     def extract_features(self, image: np.ndarray) -> np.ndarray:
@@ -163,6 +216,13 @@ class DeepCNNAnalyzer:
         if not self.trained:
             raise ValueError("النموذج غير مدرّب. قم بتدريبه أولاً.")
         
+        # التنبؤ
+        backend = self.inference_backend or self.compiled_inference()
+        features = backend(self._prepare_batch([image]))
+        return features[0]  # إرجاع أول عينة
+    
+    def _prepare_image(self, image: np.ndarray) -> np.ndarray:
+        """تجهيز صورة واحدة بحجم إدخال النموذج"""
         # التأكد من أن الصورة بحجم مناسب
         if image.shape != self.input_shape:
             # إذا كانت الصورة أحادية اللون، تحويلها إلى RGB
@@ -171,25 +231,89 @@ class DeepCNNAnalyzer:
             # تحجيم الصورة
             image = tf.image.resize(image, (self.input_shape[0], self.input_shape[1]))
             image = tf.cast(image, tf.float32) / 255.0
-            image = tf.expand_dims(image, axis=0)  # إضافة بعد الدفعة
+        return np.asarray(image, dtype=np.float32)
+    
+    def _prepare_batch(self, images: List[np.ndarray]) -> np.ndarray:
+        """تجهيز عدة صور في دفعة واحدة (N, H, W, C)"""
+        return np.stack([self._prepare_image(image) for image in images])
+    
+    def _invalidate_inference_cache(self) -> None:
+        """إبطال المحركات المبنية من النموذج السابق أو أوزانه (بعد تحميل أو تدريب)"""
+        self._inference = None
+        self.inference_backend = None
+    
+    def compiled_inference(self) -> CompiledInference:
+        """غلاف الاستدلال المُجمّع للنموذج الحالي"""
+        if self._inference is None or self._inference.model is not self.model:
+            self._inference = CompiledInference(self.model, jit_compile=self.jit_compile)
+        return self._inference
+    
+    def use_tflite(self, model_path: str, num_threads: Optional[int] = None) -> None:
+        """استخدام نموذج TFLite محوّل من النموذج الحالي للاستدلال"""
+        self.inference_backend = TFLiteInference(model_path, num_threads=num_threads)
+        self.inference_backend.warmup()
+        self.logger.info(f"محرك الاستدلال: TFLite {model_path} (خيوط={num_threads})")
+    
+    def warmup_inference(self, batch_sizes: Tuple[int, ...] = DEFAULT_WARMUP_BATCH_SIZES) -> None:
+        """تسخين الاستدلال المُجمّع لأحجام الدفعات الشائعة (بعد تحميل النموذج)"""
+        if self.model is not None:
+            self.compiled_inference().warmup(batch_sizes)
+    
+    def extract_features_batch(self, images: List[np.ndarray], batch_size: int = 32) -> np.ndarray:
+        """استخراج الميزات لعدة صور بدفعات (N, num_classes)"""
+        if not self.trained:
+            raise ValueError("النموذج غير مدرّب. قم بتدريبه أولاً.")
         
-        # التنبؤ
-        features = self.model.predict(image, verbose=0)
-        return features[0]  # إرجاع أول عينة
+        backend = self.inference_backend or self.compiled_inference()
+        features = [backend(self._prepare_batch(images[start:start + batch_size]))
+                    for start in range(0, len(images), batch_size)]
+        return np.concatenate(features) if features else np.empty((0, self.num_classes), dtype=np.float32)
+    
+    @staticmethod
+    def _normalize_features(features: np.ndarray) -> np.ndarray:
+        return features / (np.linalg.norm(features, axis=1, keepdims=True) + 1e-8)
     
     def predict_similarity(self, image1: np.ndarray, image2: np.ndarray) -> float:
         """حساب التشابه بين صورتي كف"""
-        features1 = self.extract_features(image1)
-        features2 = self.extract_features(image2)
+        features1, features2 = self.extract_features_batch([image1, image2])
         
         # حساب التشابه الكosi
         similarity = np.dot(features1, features2) / (np.linalg.norm(features1) * np.linalg.norm(features2))
         return float(similarity)
     
+    def predict_similarity_batch(self, pairs: List[Tuple[np.ndarray, np.ndarray]], batch_size: int = 32) -> np.ndarray:
+        """التشابه الكوسيني لعدة أزواج صور
+
+        كل صورة فريدة (نفس الكائن في عدة أزواج) تُحسب ميزاتها مرة واحدة، ثم
+        تُحسب التشابهات كضرب داخلي للمتجهات المطبّعة.
+        """
+        unique_images, positions = [], {}
+        pair_indices = []
+        for image1, image2 in pairs:
+            indices = []
+            for image in (image1, image2):
+                if id(image) not in positions:
+                    positions[id(image)] = len(unique_images)
+                    unique_images.append(image)
+                indices.append(positions[id(image)])
+            pair_indices.append(indices)
+        
+        if not pair_indices:
+            return np.empty(0, dtype=np.float32)
+        features = self._normalize_features(self.extract_features_batch(unique_images, batch_size))
+        pair_indices = np.asarray(pair_indices)
+        return np.einsum('ij,ij->i', features[pair_indices[:, 0]], features[pair_indices[:, 1]])
+    
+    def similarity_matrix(self, images: List[np.ndarray], batch_size: int = 32) -> np.ndarray:
+        """مصفوفة التشابه الكوسيني N×N بين جميع الصور (ضرب مصفوفات واحد)"""
+        features = self._normalize_features(self.extract_features_batch(images, batch_size))
+        return features @ features.T
+    
     def fine_tune_model(self, base_model_name: str = 'ResNet50'):
         """تحسين النموذج باستخدام التعلم النقل"""
         self.model = self.build_transfer_learning_model(base_model_name)
         self.model = self.compile_model(self.model, learning_rate=0.0001)
+        self._invalidate_inference_cache()
         
         # فك تجميد بعض الطبقات العليا للتحسين
         if base_model_name == 'ResNet50':
@@ -198,6 +322,8 @@ class DeepCNNAnalyzer:
             base_model = self.model.layers[1]
         elif base_model_name == 'EfficientNetB0':
             base_model = self.model.layers[1]
+        elif base_model_name in ('MobileNetV2', 'CompactSeparable'):
+            base_model = self.model.layers[1]
         
         # فك تجميد آخر 20 طبقة
         base_model.trainable = True
@@ -206,6 +332,17 @@ class DeepCNNAnalyzer:
         for layer in base_model.layers[:fine_tune_at]:
             layer.trainable = False
     
+    def create_dataset(self, images, labels: np.ndarray, batch_size: int = 32, augment: bool = True,
+                       cache_path: Optional[str] = None, num_shards: int = 1, shard_index: int = 0,
+                       seed: int = 42) -> tf.data.Dataset:
+        """خط إدخال tf.data متوازٍ (بديل create_data_generator) بحجم إدخال النموذج
+
+        images: مسارات ملفات أو مصفوفة صور. انظر data_pipeline.build_training_dataset.
+        """
+        return build_training_dataset(images, labels, image_size=self.input_shape[:2], batch_size=batch_size,
+                                      augment=augment, shuffle=augment, cache_path=cache_path,
+                                      num_shards=num_shards, shard_index=shard_index, seed=seed)
+    
     def create_data_generator(self) -> ImageDataGenerator:
         """إنشاء مولد بيانات للتدريب"""
         datagen = ImageDataGenerator(
@@ -236,6 +373,7 @@ class DeepCNNAnalyzer:
         """تحميل النموذج"""
         self.model = tf.keras.models.load_model(filepath)
         self.trained = True
+        self._invalidate_inference_cache()
         self.logger.info(f"تم تحميل النموذج من {filepath}")
     
     def get_model_summary(self) -> str:
@@ -251,10 +389,17 @@ class DeepCNNAnalyzer:
 class AdvancedPalmCNN(DeepCNNAnalyzer):
     """نظام CNN متقدم مع دعم للتحليل الإحصائي والتحسين التلقائي"""
     
-    def __init__(self, input_shape: Tuple[int, int, int] = (224, 224, 3), num_classes: int = 128):
-        super().__init__(input_shape, num_classes)
+    def __init__(self, input_shape: Tuple[int, int, int] = (224, 224, 3), num_classes: int = 128,
+                 jit_compile: bool = False):
+        super().__init__(input_shape, num_classes, jit_compile)
         self.training_history = []
         self.feature_cache = {}
+        # نسخة النموذج بـ Dropout نشط (تتشارك الأوزان مع النموذج الأصلي)
+        self._mc_inference = None
+        self._mc_source_model = None
+        # النموذج متعدد المخرجات (خريطة الاهتمام + الميزات) يُبنى مرة لكل نموذج محمّل
+        self._multiscale_inference = None
+        self._multiscale_source_model = None
     
     def build_attention_cnn(self) -> Model:
         """بناء نموذج CNN مع اهتمام (Attention)"""
@@ -309,52 +454,71 @@ class AdvancedPalmCNN(DeepCNNAnalyzer):
         model = Model(inputs=inputs, outputs=features)
         return model
     
+    def _invalidate_inference_cache(self) -> None:
+        super()._invalidate_inference_cache()
+        self._mc_inference = None
+        self._multiscale_inference = None
+    
+    def _multiscale_model(self) -> CompiledInference:
+        """استدلال مُجمّع لنموذج المخرجات المتعددة، مخزّن حتى تغيير النموذج"""
+        if self._multiscale_inference is None or self._multiscale_source_model is not self.model:
+            layer_names = {layer.name for layer in self.model.layers}
+            attention_output = self.model.get_layer('attention_map').output if 'attention_map' in layer_names \
+                else self.model.layers[-4].output
+            intermediate_model = Model(inputs=self.model.input, outputs=[attention_output, self.model.output])
+            self._multiscale_inference = CompiledInference(intermediate_model, jit_compile=self.jit_compile)
+            self._multiscale_source_model = self.model
+        return self._multiscale_inference
+    
     def extract_multiscale_features(self, image: np.ndarray) -> Dict[str, np.ndarray]:
         """استخراج ميزات متعددة المقاييس"""
+        outputs = self.extract_multiscale_features_batch([image])
+        return {
+            'attention_map': outputs['attention_map'][0],
+            'features': outputs['features'][0]
+        }
+    
+    def extract_multiscale_features_batch(self, images: List[np.ndarray], batch_size: int = 32) -> Dict[str, np.ndarray]:
+        """استخراج خرائط الاهتمام والميزات لعدة صور بدفعات (تمرير أمامي واحد لكل دفعة)"""
         if not self.trained:
             raise ValueError("النموذج غير مدرّب. قم بتدريبه أولاً.")
         
-        # التأكد من أن الصورة بحجم مناسب
-        if image.shape != self.input_shape:
-            if len(image.shape) == 2:
-                image = np.stack([image] * 3, axis=-1)
-            image = tf.image.resize(image, (self.input_shape[0], self.input_shape[1]))
-            image = tf.cast(image, tf.float32) / 255.0
-            image = tf.expand_dims(image, axis=0)
-        
-        # إنشاء نموذج فرعي للحصول على مخرجات الطبقات الوسطى
-        intermediate_model = Model(
-            inputs=self.model.input,
-            outputs=[
-                self.model.get_layer('attention_map').output if 'attention_map' in [l.name for l in self.model.layers] else self.model.layers[-4].output,
-                self.model.output
-            ]
-        )
-        
-        intermediate_outputs = intermediate_model.predict(image, verbose=0)
+        multiscale = self._multiscale_model()
+        attention_maps, features = [], []
+        for start in range(0, len(images), batch_size):
+            attention, batch_features = multiscale(self._prepare_batch(images[start:start + batch_size]))
+            attention_maps.append(attention)
+            features.append(batch_features)
         
         return {
-            'attention_map': intermediate_outputs[0][0] if len(intermediate_outputs) > 0 else None,
-            'features': intermediate_outputs[-1][0] if intermediate_outputs else None
+            'attention_map': np.concatenate(attention_maps),
+            'features': np.concatenate(features)
         }
     
+    def _monte_carlo_inference(self) -> CompiledInference:
+        """استدلال مُجمّع لنسخة النموذج بـ Dropout نشط
+
+        طبقات Dropout فقط تُستبدل، وباقي الطبقات هي نفسها (أوزان مشتركة)، فتبقى
+        BatchNormalization على إحصائياتها المتحركة ولا يلزم إعادة البناء بعد التدريب.
+        """
+        if self._mc_inference is None or self._mc_source_model is not self.model:
+            mc_model = tf.keras.models.clone_model(
+                self.model,
+                clone_function=lambda layer: MonteCarloDropout.from_config(layer.get_config())
+                if isinstance(layer, Dropout) else layer
+            )
+            self._mc_inference = CompiledInference(mc_model, jit_compile=self.jit_compile)
+            self._mc_source_model = self.model
+        return self._mc_inference
+    
     def predict_with_uncertainty(self, image: np.ndarray, n_samples: int = 10) -> Dict[str, float]:
-        """التنبؤ مع حساب عدم اليقين"""
-        predictions = []
-        
-        # عمل عدة تنبؤات مع Dropout نشط
-        for _ in range(n_samples):
-            # تعيين dropout إلى نشط مؤقتاً
-            self.model.layers[-1]._name = 'features_temp'  # تغيير الاسم مؤقتاً
-            temp_model = Model(inputs=self.model.input, outputs=self.model.output)
-            
-            pred = temp_model.predict(tf.expand_dims(image, 0), verbose=0)
-            predictions.append(pred[0])
-            
-            # استعادة الاسم الأصلي
-            self.model.layers[-1]._name = 'features'
-        
-        predictions = np.array(predictions)
+        """التنبؤ مع حساب عدم اليقين (MC Dropout في تمرير أمامي واحد)
+
+        تُكرر الصورة في دفعة بحجم n_samples وتُمرر مرة واحدة بـ Dropout نشط،
+        فكل صف عينة مستقلة من توزيع التنبؤ.
+        """
+        batch = np.repeat(np.asarray(image, dtype=np.float32)[np.newaxis], n_samples, axis=0)
+        predictions = self._monte_carlo_inference()(batch)
         
         return {
             'mean_prediction': predictions.mean(axis=0).tolist(),
@@ -0,0 +1,180 @@
+"""
+ذاكرة مؤقتة لمتجهات ميزات CNN مفتاحها تجزئة محتوى الصورة وبصمة أوزان النموذج
+طبقة LRU في الذاكرة وطبقة اختيارية على القرص معنونة في الذاكرة (np.memmap)
+"""
+import numpy as np
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+import logging
+
+CACHE_HEADER_FILE = 'header.json'
+CACHE_VECTORS_FILE = 'vectors.f32'
+CACHE_KEYS_FILE = 'keys.bin'
+CACHE_CHECKSUMS_FILE = 'checksums.bin'
+KEY_BYTES = 16
+# الإصدار 2: مجموع تحقق لكل خانة (مفتاح + متجه) يكشف القراءة أثناء كتابة عملية أخرى
+CACHE_FORMAT_VERSION = 2
+
+def image_digest(image: np.ndarray) -> bytes:
+    """تجزئة محتوى الصورة (البكسلات والشكل والنوع)"""
+    image = np.ascontiguousarray(image)
+    digest = hashlib.sha1(f'{image.shape}{image.dtype}'.encode())
+    digest.update(memoryview(image).cast('B'))
+    return digest.digest()
+
+def model_fingerprint(model) -> str:
+    """بصمة كل أوزان نموذج Keras (الأشكال والقيم)
+
+    تقرأ كل المتغيرات (~0.1 ثانية لكل 100 MB)، لذلك تُحسب مرة عند تحميل الأوزان
+    أو تغييرها وتُحفظ (انظر PalmAnalyzer.refresh_model_fingerprint) لا لكل طلب.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for variable in model.weights:
+        digest.update(str(tuple(variable.shape)).encode())
+        digest.update(np.ascontiguousarray(variable.numpy()).tobytes())
+    return digest.hexdigest()
+
+class EmbeddingCache:
+    """ذاكرة مؤقتة لمتجهات الميزات بطبقتين
+
+    الذاكرة: LRU بسعة capacity. القرص (اختياري): جدول بعنونة مباشرة بسعة
+    disk_capacity (خانة المفتاح = أول 8 بايت منه)، يُقرأ عبر np.memmap ويبقى بعد
+    إعادة التشغيل. تغيير بصمة النموذج يفرغ طبقة الذاكرة، ومدخلات القرص القديمة
+    لا تطابق لأن البصمة جزء من المفتاح. طبقة القرص قد تتشاركها عدة عمليات بلا قفل:
+    كل خانة تحمل مجموع تحقق للمفتاح والمتجه، والخانة نصف المكتوبة تُعامل كإخفاق.
+    """
+
+    def __init__(self, dim: int, capacity: int = 1024, disk_path: Optional[str] = None,
+                 disk_capacity: int = 100000):
+        self.logger = logging.getLogger(__name__)
+        self.dim = dim
+        self.capacity = capacity
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.disk_path = disk_path
+        self._disk_vectors = None
+        self._disk_keys = None
+        self._disk_checksums = None
+        if disk_path:
+            self._open_disk(disk_path, disk_capacity)
+
+    def _open_disk(self, directory: str, disk_capacity: int) -> None:
+        os.makedirs(directory, exist_ok=True)
+        header_path = os.path.join(directory, CACHE_HEADER_FILE)
+        if os.path.exists(header_path):
+            with open(header_path, 'r', encoding='utf-8') as f:
+                header = json.load(f)
+            if header['dim'] != self.dim:
+                raise ValueError(f"بُعد الذاكرة المؤقتة على القرص {header['dim']} لا يطابق {self.dim}")
+            disk_capacity = header['capacity']
+            mode = 'r+'
+            if header.get('version', 1) != CACHE_FORMAT_VERSION:
+                # ذاكرة بلا مجاميع تحقق: تُنشأ من جديد (مجرد ذاكرة مؤقتة)
+                self.logger.info(f"إعادة إنشاء الذاكرة المؤقتة على القرص {directory} بالصيغة {CACHE_FORMAT_VERSION}")
+                mode = 'w+'
+        else:
+            mode = 'w+'
+        self._disk_vectors = np.memmap(os.path.join(directory, CACHE_VECTORS_FILE), dtype=np.float32,
+                                       mode=mode, shape=(disk_capacity, self.dim))
+        self._disk_keys = np.memmap(os.path.join(directory, CACHE_KEYS_FILE), dtype=np.uint8,
+                                    mode=mode, shape=(disk_capacity, KEY_BYTES))
+        self._disk_checksums = np.memmap(os.path.join(directory, CACHE_CHECKSUMS_FILE), dtype=np.uint8,
+                                         mode=mode, shape=(disk_capacity, KEY_BYTES))
+        if mode == 'w+':
+            with open(header_path, 'w', encoding='utf-8') as f:
+                json.dump({'dim': self.dim, 'capacity': disk_capacity, 'version': CACHE_FORMAT_VERSION}, f)
+        self.disk_capacity = disk_capacity
+
+    def _key(self, image_key: bytes, fingerprint: str) -> bytes:
+        if fingerprint != self._fingerprint:
+            # تغيرت أوزان النموذج: كل ما في الذاكرة محسوب بالأوزان القديمة
+            self._memory.clear()
+            self._fingerprint = fingerprint
+        return hashlib.blake2b(image_key + fingerprint.encode(), digest_size=KEY_BYTES).digest()
+
+    def _slot(self, key: bytes) -> int:
+        return int.from_bytes(key[:8], 'little') % self.disk_capacity
+
+    @staticmethod
+    def _checksum(key: bytes, vector: np.ndarray) -> bytes:
+        return hashlib.blake2b(key + vector.tobytes(), digest_size=KEY_BYTES).digest()
+
+    def get(self, image_key: bytes, fingerprint: str) -> Optional[np.ndarray]:
+        """المتجه المخزن لهذه الصورة وهذه الأوزان أو None"""
+        with self._lock:
+            key = self._key(image_key, fingerprint)
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return vector.copy()
+
+            if self._disk_vectors is not None:
+                slot = self._slot(key)
+                if self._disk_keys[slot].tobytes() == key:
+                    # نسخة واحدة من المتجه ثم التحقق: كتابة متزامنة من عملية أخرى تُرفض كإخفاق
+                    vector = np.array(self._disk_vectors[slot])
+                    checksum = self._disk_checksums[slot].tobytes()
+                    if self._disk_keys[slot].tobytes() != key or checksum != self._checksum(key, vector):
+                        self.misses += 1
+                        return None
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    return vector.copy()
+
+            self.misses += 1
+            return None
+
+    def put(self, image_key: bytes, fingerprint: str, vector: np.ndarray) -> None:
+        """تخزين متجه في الطبقتين"""
+        vector = np.asarray(vector, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            key = self._key(image_key, fingerprint)
+            self._remember(key, vector.copy())
+            if self._disk_vectors is not None:
+                # مجموع التحقق آخراً: القارئ في عملية أخرى يرى خانة متسقة أو إخفاقاً
+                slot = self._slot(key)
+                self._disk_keys[slot] = 0
+                self._disk_vectors[slot] = vector
+                self._disk_keys[slot] = np.frombuffer(key, dtype=np.uint8)
+                self._disk_checksums[slot] = np.frombuffer(self._checksum(key, vector), dtype=np.uint8)
+
+    def _remember(self, key: bytes, vector: np.ndarray) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+
+    def clear(self) -> None:
+        """تفريغ الطبقتين"""
+        with self._lock:
+            self._memory.clear()
+            if self._disk_keys is not None:
+                self._disk_keys[:] = 0
+
+    def flush(self) -> None:
+        """كتابة صفحات طبقة القرص المعدلة"""
+        if self._disk_vectors is not None:
+            self._disk_vectors.flush()
+            self._disk_keys.flush()
+            self._disk_checksums.flush()
+
+    def get_stats(self) -> Dict:
+        """إحصائيات الإصابة"""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'memory_entries': len(self._memory),
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0
+        }
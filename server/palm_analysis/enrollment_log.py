@@ -0,0 +1,291 @@
+"""
+سجل التسجيل المسبق (Write-Ahead Log) لقوالب بصمة الكف
+سجل ثنائي للإلحاق فقط مع fsync مجمّع، وإعادة تشغيل سريعة عند بدء الخدمة
+"""
+import numpy as np
+import os
+import struct
+import threading
+import zlib
+import logging
+from typing import Callable, Iterator, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: لا قفل بين العمليات
+    fcntl = None
+
+# رأس السجل: الطول، CRC32، رقم التسلسل، طول المعرف، طول التسمية، البُعد، وزن الجودة
+RECORD_HEADER = struct.Struct('<IIQHHIf')
+RECORD_HEADER_TAIL = struct.Struct('<QHHIf')
+# سجلات الإصدار الأول بلا وزن جودة (لا تظهر إلا في ملفات LEGACY_MAGIC، وجودتها 1.0)
+RECORD_HEADER_V1 = struct.Struct('<IIQHHI')
+RECORD_HEADER_V1_TAIL = struct.Struct('<QHHI')
+# رأس الملف: المعرّف وتسلسل الأساس (أكبر تسلسل حُذف بالضغط) حتى لا يعود الترقيم للخلف
+LOG_HEADER = struct.Struct('<4sQ')
+LOG_MAGIC = b'PWL2'
+# الصيغة السابقة بلا تسلسل أساس (سجلاتها بالإصدار الأول أو الحالي)؛ تُحوَّل عند الفتح
+LEGACY_MAGIC = b'PWAL'
+
+class EnrollmentLog:
+    """سجل تسجيل للإلحاق فقط بسجلات ثنائية (قالب float32 + المعرف + التسمية + الجودة)
+
+    كل إلحاق هو كتابة تسلسلية صغيرة واحدة. خيط خلفي يستدعي fsync مرة لكل
+    sync_interval ثانية، ويمكن للمستدعي انتظار الوصول إلى القرص فيتشارك عدة
+    مستدعين نفس عملية fsync.
+
+    السجل ملك عملية واحدة: عداد التسلسل في الذاكرة والضغط يستبدل الملف، فعاملان
+    على نفس المسار يكرران الترقيم ويكتب أحدهما في ملف محذوف. الفتح يأخذ قفلاً حصرياً
+    (fcntl.flock على path + '.lock') ويرفع RuntimeError إن كانت عملية أخرى تملكه.
+    """
+
+    def __init__(self, path: str, sync_interval: float = 0.01):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.sync_interval = sync_interval
+
+        self._lock = threading.Lock()
+        self._synced = threading.Condition(self._lock)
+        self._written_sequence = 0
+        self._synced_sequence = 0
+        self._lock_file = self._acquire_ownership(path)
+        self._owner_pid = os.getpid()
+
+        # فحص السجل الموجود لمعرفة آخر تسلسل وقص الذيل التالف (كتابة مقطوعة)
+        if os.path.exists(path) and self._read_header()[1]:
+            self._migrate_legacy()
+        valid_end, last_sequence = self._scan()
+        self._file = open(path, 'ab')
+        if self._file.tell() != valid_end:
+            self.logger.warning(f"قص ذيل تالف من سجل التسجيل {path} عند {valid_end}")
+            self._file.truncate(valid_end)
+            self._file.seek(valid_end)
+        if valid_end == 0:
+            self._file.write(LOG_HEADER.pack(LOG_MAGIC, 0))
+            self._file.flush()
+        self._written_sequence = self._synced_sequence = last_sequence
+
+        self._closed = threading.Event()
+        self._syncer = threading.Thread(target=self._sync_loop, daemon=True)
+        self._syncer.start()
+
+    @staticmethod
+    def _acquire_ownership(path: str):
+        """قفل حصري غير حاجب على ملف القفل طوال عمر السجل"""
+        if fcntl is None:
+            return None
+        lock_file = open(path + '.lock', 'a')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise RuntimeError(f"سجل التسجيل {path} مفتوح في عملية أخرى؛ "
+                               f"استخدم سجلاً لكل عملية أو PALM_TEMPLATE_STORE لعدة عمال")
+        return lock_file
+
+    def _check_owner(self) -> None:
+        """رفض الكتابة من عملية متفرعة ورثت السجل (مثلاً gunicorn --preload)"""
+        if os.getpid() != self._owner_pid:
+            raise RuntimeError(f"سجل التسجيل {self.path} مملوك للعملية {self._owner_pid}؛ "
+                               f"افتحه داخل العامل وليس قبل التفرع")
+
+    @property
+    def last_sequence(self) -> int:
+        return self._written_sequence
+
+    @staticmethod
+    def _encode_record(sequence: int, vector: np.ndarray, label: str, user_id: str, quality: float) -> bytes:
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        user_bytes = str(user_id).encode('utf-8')
+        label_bytes = str(label).encode('utf-8')
+        payload = user_bytes + label_bytes + vector.tobytes()
+        header_tail = RECORD_HEADER_TAIL.pack(sequence, len(user_bytes), len(label_bytes), len(vector), quality)
+        crc = zlib.crc32(header_tail + payload)
+        return struct.pack('<II', RECORD_HEADER.size + len(payload), crc) + header_tail + payload
+
+    def advance_to(self, sequence: int) -> None:
+        """بدء الترقيم بعد sequence على الأقل (مثلاً تسلسل لقطة أحدث من السجل)"""
+        with self._lock:
+            if sequence > self._written_sequence:
+                self._written_sequence = self._synced_sequence = sequence
+
+    def append(self, feature_vector: np.ndarray, label: str, user_id: str,
+               quality: float = 1.0, wait_durable: bool = True) -> int:
+        """إلحاق سجل تسجيل وإرجاع رقم تسلسله"""
+        self._check_owner()
+        with self._lock:
+            sequence = self._written_sequence + 1
+            record = self._encode_record(sequence, feature_vector, label, user_id, quality)
+            self._file.write(record)
+            self._file.flush()
+            self._written_sequence = sequence
+
+        if wait_durable:
+            self.wait_durable(sequence)
+        return sequence
+
+    def wait_durable(self, sequence: int) -> None:
+        """الانتظار حتى يصل السجل ذو التسلسل المحدد إلى القرص (fsync)"""
+        with self._lock:
+            while self._synced_sequence < sequence and not self._closed.is_set():
+                self._synced.wait()
+
+    def _sync_loop(self) -> None:
+        while not self._closed.wait(self.sync_interval):
+            self.sync()
+
+    def sync(self) -> None:
+        """fsync لكل السجلات المكتوبة وإيقاظ المنتظرين"""
+        with self._lock:
+            target = self._written_sequence
+            if self._synced_sequence >= target:
+                return
+            os.fsync(self._file.fileno())
+            self._synced_sequence = target
+            self._synced.notify_all()
+
+    def _read_header(self) -> Tuple[int, bool]:
+        """تسلسل الأساس من رأس الملف وهل الملف بالصيغة السابقة (ValueError إن لم يكن سجلاً)"""
+        with open(self.path, 'rb') as f:
+            header = f.read(LOG_HEADER.size)
+        if header[:len(LEGACY_MAGIC)] == LEGACY_MAGIC:
+            return 0, True
+        if len(header) < LOG_HEADER.size and LOG_MAGIC.startswith(header[:len(LOG_MAGIC)]):
+            # ملف فارغ أو رأس مقطوع عند الإنشاء
+            return 0, False
+        if header[:len(LOG_MAGIC)] != LOG_MAGIC:
+            raise ValueError(f"الملف ليس سجل تسجيل: {self.path}")
+        return LOG_HEADER.unpack(header)[1], False
+
+    def _migrate_legacy(self) -> None:
+        """تحويل سجل بالصيغة السابقة (بلا تسلسل أساس) إلى الصيغة الحالية باستبدال ذري"""
+        tmp_path = self.path + '.migrate'
+        migrated = 0
+        with open(tmp_path, 'wb') as dst:
+            dst.write(LOG_HEADER.pack(LOG_MAGIC, 0))
+            for _, sequence, vector, label, user_id, quality in self._iter_records():
+                dst.write(self._encode_record(sequence, vector, label, user_id, quality))
+                migrated += 1
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(tmp_path, self.path)
+        self.logger.info(f"تم تحويل سجل التسجيل {self.path} إلى الصيغة الحالية ({migrated} سجل)")
+
+    def _scan(self) -> Tuple[int, int]:
+        """إرجاع نهاية آخر سجل سليم وأكبر رقم تسلسل (لا يقل عن تسلسل الأساس)"""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < LOG_HEADER.size:
+            return 0, 0
+        base_sequence, _ = self._read_header()
+        valid_end, last_sequence = LOG_HEADER.size, base_sequence
+        for end, sequence, _, _, _, _ in self._iter_records():
+            valid_end, last_sequence = end, max(sequence, base_sequence)
+        return valid_end, last_sequence
+
+    def _iter_records(self) -> Iterator[Tuple[int, int, np.ndarray, str, str, float]]:
+        """قراءة السجلات السليمة بالترتيب والتوقف عند أول سجل مقطوع أو تالف"""
+        with open(self.path, 'rb') as f:
+            magic = f.read(len(LOG_MAGIC))
+            if magic == LOG_MAGIC:
+                f.seek(LOG_HEADER.size)
+            elif magic != LEGACY_MAGIC:
+                return
+            legacy = magic == LEGACY_MAGIC
+            while True:
+                prefix = f.read(8)
+                if len(prefix) < 8:
+                    return
+                length, crc = struct.unpack('<II', prefix)
+                if length < RECORD_HEADER_V1.size:
+                    return
+                body = f.read(length - 8)
+                if len(body) != length - 8 or zlib.crc32(body) != crc:
+                    return
+                # الطول يحدد الإصدار: رأس الإصدار الأول أقصر بأربعة بايتات (بلا الجودة)
+                sequence, user_len, label_len, dim, quality = RECORD_HEADER_TAIL.unpack_from(body) \
+                    if length >= RECORD_HEADER.size else (0, 0, 0, 0, 0.0)
+                if length == RECORD_HEADER.size + user_len + label_len + dim * 4:
+                    payload = body[RECORD_HEADER_TAIL.size:]
+                elif legacy:
+                    sequence, user_len, label_len, dim = RECORD_HEADER_V1_TAIL.unpack_from(body)
+                    if length != RECORD_HEADER_V1.size + user_len + label_len + dim * 4:
+                        return
+                    payload, quality = body[RECORD_HEADER_V1_TAIL.size:], 1.0
+                else:
+                    return
+                user_id = payload[:user_len].decode('utf-8')
+                label = payload[user_len:user_len + label_len].decode('utf-8')
+                vector = np.frombuffer(payload[user_len + label_len:], dtype=np.float32)
+                yield f.tell(), sequence, vector, label, user_id, quality
+
+    @property
+    def compacted_sequence(self) -> int:
+        """أكبر تسلسل حذفه الضغط: ما قبل أول سجل باقٍ، أو تسلسل الأساس إن لم يبقَ سجل"""
+        with self._lock:
+            self._file.flush()
+            for _, sequence, _, _, _, _ in self._iter_records():
+                return sequence - 1
+            return self._read_header()[0]
+
+    def replay(self, apply: Callable[[np.ndarray, str, str, float], None], after_sequence: int = 0,
+               up_to_sequence: Optional[int] = None) -> int:
+        """إعادة تطبيق السجلات ذات التسلسل الأكبر من after_sequence (مثلاً فوق آخر لقطة)
+
+        up_to_sequence يحد الإعادة بتسلسل معروف (السجلات الأحدث تصل عبر مسار آخر).
+        """
+        with self._lock:
+            self._file.flush()
+        count = 0
+        for _, sequence, vector, label, user_id, quality in self._iter_records():
+            if up_to_sequence is not None and sequence > up_to_sequence:
+                break
+            if sequence > after_sequence:
+                apply(vector, label, user_id, quality)
+                count += 1
+        self.logger.info(f"تمت إعادة تشغيل {count} تسجيل من {self.path}")
+        return count
+
+    def compact(self, up_to_sequence: int) -> None:
+        """حذف السجلات المضمّنة في لقطة المعرض (تسلسل <= up_to_sequence)
+
+        تُنسخ السجلات الأحدث إلى ملف جديد يستبدل السجل بشكل ذري. آخر تسلسل
+        مكتوب يُحفظ في رأس الملف الجديد فيستمر الترقيم منه ولو لم يبقَ أي سجل.
+        """
+        self._check_owner()
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            tmp_path = self.path + '.compact'
+            kept = 0
+            with open(self.path, 'rb') as src, open(tmp_path, 'wb') as dst:
+                dst.write(LOG_HEADER.pack(LOG_MAGIC, self._written_sequence))
+                start = LOG_HEADER.size
+                for end, sequence, _, _, _, _ in self._iter_records():
+                    if sequence > up_to_sequence:
+                        src.seek(start)
+                        dst.write(src.read(end - start))
+                        kept += 1
+                    start = end
+                dst.flush()
+                os.fsync(dst.fileno())
+            self._file.close()
+            os.replace(tmp_path, self.path)
+            self._file = open(self.path, 'ab')
+            self._synced_sequence = self._written_sequence
+        self.logger.info(f"تم ضغط سجل التسجيل حتى التسلسل {up_to_sequence} ({kept} سجل متبقٍ)")
+
+    def size_bytes(self) -> int:
+        """حجم ملف السجل الحالي"""
+        with self._lock:
+            self._file.flush()
+            return os.path.getsize(self.path)
+
+    def close(self) -> None:
+        """fsync نهائي وإغلاق الملف"""
+        self._closed.set()
+        self.sync()
+        with self._lock:
+            self._synced.notify_all()
+            self._file.close()
+            if self._lock_file is not None:
+                self._lock_file.close()
@@ -0,0 +1,38 @@
+"""
+إحصائيات الصورة المشتركة لمقيّمات الحيوية والجودة في أقل عدد من المرور على الصورة
+cv2.meanStdDev مباشرة على uint8 بدون نسخ float، وLaplacian بعمق int16
+"""
+import cv2
+import numpy as np
+from typing import Dict
+
+def compute_image_stats(image: np.ndarray) -> Dict[str, object]:
+    """متوسطات وتباينات القنوات، متوسط التشبع، إحصائيات الرمادي وتباين Laplacian
+
+    القيم مطابقة لـ np.var/np.std (تباين المجتمع) ولـ cv2.Laplacian(gray, CV_64F).var().
+    الصورة الرمادية تُعامل كثلاث قنوات متطابقة وتشبعها صفر. القيم أعداد Python فقط.
+    """
+    if len(image.shape) == 3:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        channel_means, channel_stds = cv2.meanStdDev(image)
+        channel_means, channel_stds = channel_means.ravel(), channel_stds.ravel()
+        saturation_mean = cv2.mean(cv2.cvtColor(image, cv2.COLOR_BGR2HSV))[1]
+    else:
+        gray = image
+        channel_means, channel_stds = (np.repeat(stat.ravel(), 3) for stat in cv2.meanStdDev(gray))
+        saturation_mean = 0.0
+
+    gray_mean, gray_std = cv2.meanStdDev(gray)
+    # نواة Laplacian الافتراضية على uint8 في [-1020, 1020] فيكفي int16
+    depth = cv2.CV_16S if gray.dtype == np.uint8 else cv2.CV_64F
+    _, laplacian_std = cv2.meanStdDev(cv2.Laplacian(gray, depth))
+
+    return {
+        'channel_means': [float(value) for value in channel_means],
+        'channel_stds': [float(value) for value in channel_stds],
+        'channel_vars': [float(value) ** 2 for value in channel_stds],
+        'saturation_mean': float(saturation_mean),
+        'gray_mean': float(gray_mean[0, 0]),
+        'gray_std': float(gray_std[0, 0]),
+        'laplacian_var': float(laplacian_std[0, 0]) ** 2
+    }
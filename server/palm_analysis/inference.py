@@ -0,0 +1,43 @@
+"""
+مسار استدلال مُجمّع لنماذج Keras (tf.function مع XLA اختياري)
+يتجاوز model.predict الذي يبني محوّل بيانات وحلقة callbacks في كل استدعاء
+"""
+import tensorflow as tf
+import numpy as np
+from typing import Iterable
+import logging
+
+# أحجام الدفعات الشائعة التي تُسخّن عند التشغيل (صورة واحدة للتسجيل والتحقق)
+DEFAULT_WARMUP_BATCH_SIZES = (1,)
+
+class CompiledInference:
+    """غلاف استدلال لنموذج Keras بتوقيع إدخال ثابت
+
+    بُعد الدفعة فقط متغير، فيُتتبّع الرسم البياني مرة واحدة. مع jit_compile=True
+    يُجمّع XLA نسخة لكل حجم دفعة، لذلك تُسخّن الأحجام الشائعة مسبقاً.
+    """
+
+    def __init__(self, model: tf.keras.Model, jit_compile: bool = False):
+        self.logger = logging.getLogger(__name__)
+        self.model = model
+        self.jit_compile = jit_compile
+        self.input_shape = tuple(model.input_shape[1:])
+
+        signature = [tf.TensorSpec(shape=(None,) + self.input_shape, dtype=tf.float32)]
+        self._forward = tf.function(self._call_model, input_signature=signature, jit_compile=jit_compile)
+
+    def _call_model(self, batch: tf.Tensor):
+        return self.model(batch, training=False)
+
+    def warmup(self, batch_sizes: Iterable[int] = DEFAULT_WARMUP_BATCH_SIZES) -> None:
+        """تتبع الرسم البياني (وتجميع XLA) لأحجام الدفعات المحددة"""
+        for batch_size in batch_sizes:
+            self._forward(tf.zeros((batch_size,) + self.input_shape, dtype=tf.float32))
+        self.logger.info(f"تم تسخين الاستدلال المُجمّع لأحجام الدفعات {tuple(batch_sizes)} (XLA={self.jit_compile})")
+
+    def __call__(self, batch) -> np.ndarray:
+        """تشغيل النموذج على دفعة وإرجاع مصفوفة NumPy"""
+        outputs = self._forward(tf.convert_to_tensor(batch, dtype=tf.float32))
+        if isinstance(outputs, (list, tuple)):
+            return [output.numpy() for output in outputs]
+        return outputs.numpy()
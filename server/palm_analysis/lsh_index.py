@@ -0,0 +1,94 @@
+"""
+فهرسة بصمات الكف بالتجزئة الحساسة للموقع (LSH)
+تواقيع المستويات العشوائية (SimHash) للترشيح السريع وكشف التسجيل المكرر
+"""
+import numpy as np
+from typing import Dict, List, Optional
+import logging
+
+# بذرة ثابتة حتى تتطابق التواقيع بين العمليات وإعادة التشغيل
+DEFAULT_LSH_SEED = 42
+
+def _hyperplanes(dim: int, n_bits: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((dim, n_bits)).astype(np.float32)
+
+def simhash_signature(features: np.ndarray, n_bits: int = 128, center: float = 0.0,
+                      seed: int = DEFAULT_LSH_SEED) -> str:
+    """توقيع SimHash بالمستويات العشوائية لكامل المتجه (سلسلة سداسية عشرية)
+
+    المتجهات المتقاربة بزاوية صغيرة تعطي تواقيع بمسافة هامنغ صغيرة،
+    على عكس تجزئة السلاسل النصية التي تتغير كلياً مع أي ضوضاء.
+    """
+    vector = np.asarray(features, dtype=np.float32).ravel() - center
+    bits = (vector @ _hyperplanes(len(vector), n_bits, seed)) > 0
+    return np.packbits(bits).tobytes().hex()
+
+def hamming_distance(signature1: str, signature2: str) -> int:
+    """مسافة هامنغ بين توقيعين سداسيين عشريين"""
+    return bin(int(signature1, 16) ^ int(signature2, 16)).count('1')
+
+class RandomHyperplaneLSH:
+    """فهرس LSH متعدد الجداول بالمستويات العشوائية للتشابه الكوسيني"""
+
+    def __init__(self, dim: int, n_tables: int = 8, n_bits: int = 12, seed: int = DEFAULT_LSH_SEED):
+        if n_bits > 63:
+            raise ValueError("عدد البتات لكل جدول يجب ألا يتجاوز 63")
+        self.logger = logging.getLogger(__name__)
+        self.dim = dim
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.seed = seed
+        # مستويات جميع الجداول في مصفوفة واحدة: (dim, n_tables * n_bits)
+        self.planes = _hyperplanes(dim, n_tables * n_bits, seed)
+        self._powers = (1 << np.arange(n_bits, dtype=np.int64))
+        self.buckets: List[Dict[int, List[int]]] = [{} for _ in range(n_tables)]
+        self.n_indexed = 0
+
+    def __getstate__(self):
+        # لا نحفظ الدلاء، تُعاد بناؤها من المعرض عند التحميل
+        state = self.__dict__.copy()
+        state['buckets'] = [{} for _ in range(self.n_tables)]
+        state['n_indexed'] = 0
+        del state['logger']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.logger = logging.getLogger(__name__)
+
+    def bucket_keys(self, vectors: np.ndarray) -> np.ndarray:
+        """مفاتيح الدلاء لكل متجه في كل جدول: (N, n_tables)"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        bits = (vectors @ self.planes) > 0
+        bits = bits.reshape(len(vectors), self.n_tables, self.n_bits)
+        return bits.astype(np.int64) @ self._powers
+
+    def add(self, vectors: np.ndarray) -> None:
+        """إضافة متجهات جديدة إلى الفهرس (فهارسها تتبع آخر فهرس مضاف)"""
+        keys = self.bucket_keys(vectors)
+        for offset, row in enumerate(keys):
+            index = self.n_indexed + offset
+            for table, key in zip(self.buckets, row):
+                table.setdefault(int(key), []).append(index)
+        self.n_indexed += len(keys)
+
+    def candidates(self, query: np.ndarray, n_rows: Optional[int] = None) -> np.ndarray:
+        """فهارس المرشحين المتصادمين مع الاستعلام في أي جدول
+
+        n_rows يحدد حجم المعرض المرئي للقارئ، فتُتجاهل الفهارس المضافة
+        بعد إنشاء لقطته.
+        """
+        keys = self.bucket_keys(query)[0]
+        found = set()
+        for table, key in zip(self.buckets, keys):
+            found.update(table.get(int(key), ()))
+        result = np.fromiter(found, dtype=np.int64, count=len(found))
+        if n_rows is not None:
+            result = result[result < n_rows]
+        return np.sort(result)
+
+    def reset(self) -> None:
+        """تفريغ الدلاء"""
+        self.buckets = [{} for _ in range(self.n_tables)]
+        self.n_indexed = 0
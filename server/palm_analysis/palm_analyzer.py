@@ -5,26 +5,75 @@
 import cv2
 import numpy as np
 from tensorflow.keras.models import Sequential, Model
-from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout, Input
+from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout, Input, GlobalAveragePooling2D
 from sklearn.decomposition import PCA
 from sklearn.svm import SVC
 import base64
+import hashlib
 from typing import Dict, List, Tuple, Optional
 import logging
 
+try:
+    from .lsh_index import simhash_signature
+    from .inference import CompiledInference, DEFAULT_WARMUP_BATCH_SIZES
+    from .tflite_backend import TFLiteInference
+    from .embedding_cache import EmbeddingCache, image_digest, model_fingerprint
+    from .backbones import MODEL_PROFILES, DEFAULT_PROFILE, compact_separable_trunk
+    from .quality_gate import quality_precheck
+    from .image_stats import compute_image_stats
+except ImportError:
+    from lsh_index import simhash_signature
+    from inference import CompiledInference, DEFAULT_WARMUP_BATCH_SIZES
+    from tflite_backend import TFLiteInference
+    from embedding_cache import EmbeddingCache, image_digest, model_fingerprint
+    from backbones import MODEL_PROFILES, DEFAULT_PROFILE, compact_separable_trunk
+    from quality_gate import quality_precheck
+    from image_stats import compute_image_stats
+
 class PalmAnalyzer:
-    def __init__(self):
+    def __init__(self, jit_compile: bool = False, warmup_batch_sizes: Tuple[int, ...] = DEFAULT_WARMUP_BATCH_SIZES,
+                 profile: str = DEFAULT_PROFILE):
         self.logger = logging.getLogger(__name__)
-        self.palm_cnn_model = self._build_cnn_model()
+        if profile not in MODEL_PROFILES:
+            raise ValueError(f"ملف تعريف النموذج غير معروف: {profile}")
+        # ملف التعريف يحدد الجذع ودقة الإدخال (انظر backbones.select_model_profile)
+        self.profile = profile
+        self.input_size = MODEL_PROFILES[profile]['input_size']
+        # نموذج واحد بجذع مشترك: متجه الميزات ودرجة الحيوية في تمرير أمامي واحد
+        self.multi_head_model = self._build_cnn_model()
+        # عرض رأس الميزات فقط (نفس الطبقات والأوزان) للتحويل والتوافق
+        self.palm_cnn_model = Model(inputs=self.multi_head_model.input,
+                                    outputs=self.multi_head_model.get_layer('features').output)
+        # استدلال مُجمّع بدلاً من predict لكل صورة
+        self.palm_cnn_inference = CompiledInference(self.multi_head_model, jit_compile=jit_compile)
+        self.palm_cnn_inference.warmup(warmup_batch_sizes)
+        # ذاكرة مؤقتة اختيارية للميزات (انظر enable_embedding_cache)
+        self.embedding_cache = None
+        self._backend_fingerprint = None
+        self._weights_fingerprint = None
         self.pca_model = PCA(n_components=100)
         self.svm_model = SVC(kernel='rbf', probability=True)
         self.is_trained = False
         
     def _build_cnn_model(self) -> Model:
-        """بناء نموذج CNN لتحليل بصمة الكف"""
-        input_layer = Input(shape=(224, 224, 3))
-        
-        # طبقات التعلم العميق
+        """بناء نموذج CNN متعدد الرؤوس لتحليل بصمة الكف
+
+        جذع تلافيفي مشترك يغذي رأسين: متجه الميزات (128) ودرجة الحيوية
+        (بدلاً من نموذج مكافحة التزوير المنفصل AntiSpoofingSystem.cnn_detector).
+        الملفات المدمجة تستخدم جذعاً قابلاً للفصل عمقياً مع تجميع عام بدلاً من Flatten.
+        """
+        input_layer = Input(shape=(self.input_size, self.input_size, 3))
+        
+        if MODEL_PROFILES[self.profile]['backbone'] == 'separable':
+            pooled = GlobalAveragePooling2D()(compact_separable_trunk(input_layer))
+            x = Dense(256, activation='relu')(pooled)
+            x = Dropout(0.3)(x)
+            output = Dense(128, activation='sigmoid', name='features')(x)
+            y = Dense(64, activation='relu')(pooled)
+            liveness = Dense(1, activation='sigmoid', name='liveness')(y)
+            return self._compile_multi_head(Model(inputs=input_layer, outputs=[output, liveness]))
+        
+        # الجذع المشترك
         x = Conv2D(32, (3, 3), activation='relu', padding='same')(input_layer)
         x = MaxPooling2D((2, 2))(x)
         x = Conv2D(64, (3, 3), activation='relu', padding='same')(x)
@@ -32,19 +81,71 @@ class PalmAnalyzer:
         x = Conv2D(128, (3, 3), activation='relu', padding='same')(x)
         x = MaxPooling2D((2, 2))(x)
         x = Conv2D(256, (3, 3), activation='relu', padding='same')(x)
-        x = MaxPooling2D((2, 2))(x)
+        trunk = MaxPooling2D((2, 2))(x)
         
-        x = Flatten()(x)
+        # رأس متجه الميزات
+        x = Flatten()(trunk)
         x = Dense(512, activation='relu')(x)
         x = Dropout(0.5)(x)
         x = Dense(256, activation='relu')(x)
         x = Dropout(0.5)(x)
         output = Dense(128, activation='sigmoid', name='features')(x)  # متجه مميزات
         
-        model = Model(inputs=input_layer, outputs=output)
-        model.compile(optimizer='adam', loss='mse', metrics=['accuracy'])
+        # رأس الحيوية (بنية رأس cnn_detector)
+        y = GlobalAveragePooling2D()(trunk)
+        y = Dense(64, activation='relu')(y)
+        liveness = Dense(1, activation='sigmoid', name='liveness')(y)
+        
+        return self._compile_multi_head(Model(inputs=input_layer, outputs=[output, liveness]))
+    
+    @staticmethod
+    def _compile_multi_head(model: Model) -> Model:
+        model.compile(optimizer='adam',
+                      loss={'features': 'mse', 'liveness': 'binary_crossentropy'},
+                      metrics={'liveness': ['accuracy']})
         return model
     
+    def use_tflite(self, model_path: str, num_threads: Optional[int] = None) -> None:
+        """استبدال محرك الاستدلال بنموذج TFLite محوّل (انظر tflite_backend.convert_palm_models)"""
+        self.palm_cnn_inference = TFLiteInference(model_path, num_threads=num_threads)
+        self.palm_cnn_inference.warmup()
+        with open(model_path, 'rb') as f:
+            self._backend_fingerprint = 'tflite:' + hashlib.sha1(f.read()).hexdigest()
+        self.logger.info(f"محرك الاستدلال: TFLite {model_path} (خيوط={num_threads})")
+    
+    def enable_embedding_cache(self, capacity: int = 1024, disk_path: Optional[str] = None,
+                               disk_capacity: int = 100000) -> EmbeddingCache:
+        """تخزين مخرجات CNN (الميزات ودرجة الحيوية) مؤقتاً حسب محتوى الصورة وأوزان النموذج"""
+        dim = self.palm_cnn_model.output_shape[-1] + 1
+        self.embedding_cache = EmbeddingCache(dim, capacity, disk_path, disk_capacity)
+        if self._backend_fingerprint is None and self._weights_fingerprint is None:
+            self.refresh_model_fingerprint()
+        return self.embedding_cache
+    
+    def refresh_model_fingerprint(self, version: Optional[str] = None) -> str:
+        """إعادة حساب بصمة الأوزان بعد تحميلها أو تدريبها (تجزئة كل المتغيرات مرة واحدة)
+
+        version: معرف صريح لنسخة الأوزان (مثلاً اسم نقطة الحفظ) بدلاً من التجزئة.
+        يجب استدعاؤها بعد أي تعديل لأوزان multi_head_model خارج load_weights وإلا
+        تعيد الذاكرة المؤقتة ميزات الأوزان السابقة.
+        """
+        self._weights_fingerprint = f'version:{version}' if version is not None \
+            else model_fingerprint(self.multi_head_model)
+        return self._weights_fingerprint
+    
+    def load_weights(self, filepath: str) -> None:
+        """تحميل أوزان النموذج متعدد الرؤوس وتحديث بصمة الذاكرة المؤقتة"""
+        self.multi_head_model.load_weights(filepath)
+        self.refresh_model_fingerprint()
+    
+    def _model_fingerprint(self) -> str:
+        """بصمة محرك الاستدلال الحالي (ملف TFLite أو أوزان النموذج المحسوبة مسبقاً)"""
+        if self._backend_fingerprint is not None:
+            return self._backend_fingerprint
+        if self._weights_fingerprint is None:
+            self.refresh_model_fingerprint()
+        return self._weights_fingerprint
+    
     def preprocess_palm_image(self, image: np.ndarray) -> np.ndarray:
         """تحسين جودة صورة الكف وتحسين التباين"""
         # تحويل إلى لون رمادي
@@ -67,7 +168,7 @@ class PalmAnalyzer:
         enhanced_with_edges = cv2.addWeighted(denoised, 0.8, edges, 0.2, 0)
         
         # تحجيم الصورة
-        resized = cv2.resize(enhanced_with_edges, (224, 224))
+        resized = cv2.resize(enhanced_with_edges, (self.input_size, self.input_size))
         
         # تحويل إلى RGB وتوسيع الأبعاد
         rgb_image = cv2.cvtColor(resized, cv2.COLOR_GRAY2RGB)
@@ -77,9 +178,29 @@ class PalmAnalyzer:
     
     def extract_palm_features(self, image: np.ndarray) -> np.ndarray:
         """استخراج الخصائص البيومترية من صورة الكف"""
+        return self.extract_features_and_liveness(image)[0]
+    
+    def extract_features_and_liveness(self, image: np.ndarray) -> Tuple[np.ndarray, Optional[float]]:
+        """متجه الميزات ودرجة حيوية CNN من تمرير أمامي واحد بنفس المعالجة
+
+        محرك TFLite المحوّل من palm_cnn_model يعطي الميزات فقط، فتكون الدرجة None.
+        """
+        if self.embedding_cache is not None:
+            image_key, fingerprint = image_digest(image), self._model_fingerprint()
+            cached = self.embedding_cache.get(image_key, fingerprint)
+            if cached is not None:
+                return cached[:-1], None if np.isnan(cached[-1]) else float(cached[-1])
+        
         processed_image = self.preprocess_palm_image(image)
-        features = self.palm_cnn_model.predict(processed_image, verbose=0)
-        return features[0]
+        outputs = self.palm_cnn_inference(processed_image)
+        if isinstance(outputs, list):
+            features, liveness = outputs[0][0], float(outputs[1][0, 0])
+        else:
+            features, liveness = outputs[0], None
+        
+        if self.embedding_cache is not None:
+            self.embedding_cache.put(image_key, fingerprint, np.append(features, np.nan if liveness is None else liveness))
+        return features, liveness
     
     def detect_palm_lines(self, image: np.ndarray) -> Dict[str, List]:
         """كشف الخطوط الرئيسية والدقيقة في بصمة الكف"""
@@ -143,8 +264,10 @@ class PalmAnalyzer:
         
         return texture_features
     
-    def detect_liveness(self, image: np.ndarray, thermal_data: Optional[np.ndarray] = None) -> Dict[str, bool]:
+    def detect_liveness(self, image: np.ndarray, thermal_data: Optional[np.ndarray] = None,
+                        image_stats: Optional[Dict] = None) -> Dict[str, bool]:
         """التحقق من الحياة (Anti-spoofing)"""
+        stats = image_stats or compute_image_stats(image)
         results = {
             'blood_flow_detected': False,
             'temperature_valid': False,
@@ -154,9 +277,7 @@ class PalmAnalyzer:
         
         # التحقق من تدفق الدم (تحليل الألوان والتشبع)
         if len(image.shape) == 3:
-            hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-            saturation = hsv[:,:,1]
-            mean_saturation = np.mean(saturation)
+            mean_saturation = stats['saturation_mean']
             
             # تحليل الألوان (الدم يعطي تشبعاً عالياً)
             results['blood_flow_detected'] = mean_saturation > 50
@@ -174,9 +295,7 @@ class PalmAnalyzer:
             liveness_score += 0.3
             
         # التحقق من الجودة البصرية
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
-        laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
-        if laplacian_var > 100:  # صورة حادة
+        if stats['laplacian_var'] > 100:  # صورة حادة
             liveness_score += 0.3
             
         results['liveness_score'] = min(liveness_score, 1.0)
@@ -184,10 +303,30 @@ class PalmAnalyzer:
         
         return results
     
-    def analyze_palm(self, image: np.ndarray, thermal_data: Optional[np.ndarray] = None) -> Dict:
-        """تحليل بصمة الكف الشامل"""
-        # استخراج الميزات
-        features = self.extract_palm_features(image)
+    def analyze_palm(self, image: np.ndarray, thermal_data: Optional[np.ndarray] = None,
+                     precheck: bool = False) -> Dict:
+        """تحليل بصمة الكف الشامل
+
+        precheck: فحص جودة سريع (quality_gate.quality_precheck) قبل أي عمل CNN. عند
+        الرفض تُعاد نتيجة بدون ميزات مع أسباب الرفض في quality_gate.
+        """
+        quality_gate = quality_precheck(image) if precheck else None
+        if quality_gate is not None and not quality_gate['passed']:
+            return {
+                'palm_hash': None,
+                'features': None,
+                'lines': None,
+                'texture': None,
+                'liveness': None,
+                'quality_score': 0.0,
+                'cnn_liveness_score': None,
+                'confidence': 0.0,
+                'quality_gate': quality_gate,
+                'image_stats': None
+            }
+        
+        # استخراج الميزات ودرجة حيوية CNN (تمرير أمامي واحد)
+        features, cnn_liveness_score = self.extract_features_and_liveness(image)
         
         # كشف الخطوط
         lines = self.detect_palm_lines(image)
@@ -195,8 +334,12 @@ class PalmAnalyzer:
         # تحليل الملمس
         texture = self.analyze_palm_texture(image)
         
+        # إحصائيات الصورة مرة واحدة لمقيّمات الحيوية والجودة (وcomprehensive_spoofing_detection)
+        image_stats = compute_image_stats(image)
+        
         # التحقق من الحياة
-        liveness = self.detect_liveness(image, thermal_data)
+        liveness = self.detect_liveness(image, thermal_data, image_stats)
+        liveness['cnn_liveness_score'] = cnn_liveness_score
         
         # توليد البصمة الفريدة
         palm_hash = self._generate_palm_hash(features)
@@ -207,27 +350,32 @@ class PalmAnalyzer:
             'lines': lines,
             'texture': texture,
             'liveness': liveness,
-            'quality_score': self._calculate_quality_score(image),
-            'confidence': liveness['liveness_score'] * 0.8 + 0.2  # الثقة المحسوبة
+            'quality_score': self._calculate_quality_score(image, image_stats),
+            'cnn_liveness_score': cnn_liveness_score,
+            'confidence': liveness['liveness_score'] * 0.8 + 0.2,  # الثقة المحسوبة
+            'quality_gate': quality_gate,
+            'image_stats': image_stats
         }
         
         return result
     
     def _generate_palm_hash(self, features: np.ndarray) -> str:
-        """توليد تجزئة فريدة لبصمة الكف"""
-        import hashlib
-        feature_str = ''.join([str(x) for x in features[:10]])  # استخدام أول 10 ميزات
-        return hashlib.sha256(feature_str.encode()).hexdigest()[:32]
+        """توليد تجزئة بصمة الكف (SimHash بطول 128 بت لكامل متجه الميزات)
+
+        البصمات المتقاربة تعطي تجزئات بمسافة هامنغ صغيرة، فيمكن استخدامها
+        للفهرسة وكشف التسجيل المكرر. مخرجات sigmoid تُمركز حول 0.5.
+        """
+        return simhash_signature(features, n_bits=128, center=0.5)
     
-    def _calculate_quality_score(self, image: np.ndarray) -> float:
+    def _calculate_quality_score(self, image: np.ndarray, image_stats: Optional[Dict] = None) -> float:
         """حساب جودة الصورة"""
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+        stats = image_stats or compute_image_stats(image)
         
         # تباين الصورة
-        contrast = np.std(gray)
+        contrast = stats['gray_std']
         
         # وضوح الحواف
-        laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
+        laplacian_var = stats['laplacian_var']
         
         # تقييم الجودة (0-1)
         quality = min((contrast / 50 + laplacian_var / 1000) / 2, 1.0)
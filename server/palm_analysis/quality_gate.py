@@ -0,0 +1,91 @@
+"""
+فحص جودة سريع لالتقاطات الكف قبل فك الترميز بالدقة الكاملة وقبل استدلال CNN
+يعمل على إطار مصغّر: الحجم، الضبابية (تباين Laplacian)، التعريض ووجود الكف
+"""
+import cv2
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+# الضلع الأطول للإطار المصغّر الذي تُحسب عليه كل الفحوص
+GATE_FRAME_SIZE = 320
+# معامل التصغير عند فك ترميز JPEG (IMREAD_REDUCED_COLOR_2 يفك الترميز بنصف الدقة مباشرة)
+REDUCED_DECODE_FACTOR = 2
+
+# العتبات الافتراضية. تباين Laplacian على الإطار المصغّر لخطوط كف اصطناعية: حاد
+# 300-540، ضبابية Gaussian بعرض 1 بكسل لكل 640 بكسل ~40-120، بعرض 2 بكسل ~5-15.
+# لم تُعاير على التقاطات حقيقية بعد، لذلك البوابة معطلة افتراضياً في api.py
+DEFAULT_THRESHOLDS = {
+    'min_size': 100,
+    'min_sharpness': 20.0,
+    'min_brightness': 40.0,
+    'max_brightness': 220.0,
+    'max_clipped_ratio': 0.4,
+    'min_palm_coverage': 0.15,
+    # متوسط التشبع (HSV) الذي تُعد الصورة دونه رمادية أو أشعة تحت حمراء
+    'max_achromatic_saturation': 12.0
+}
+
+def _skin_mask(frame: np.ndarray) -> np.ndarray:
+    """بكسلات لون البشرة في فضاء YCrCb (مستقلة عن الإضاءة إلى حد كبير)"""
+    ycrcb = cv2.cvtColor(frame, cv2.COLOR_BGR2YCrCb)
+    return cv2.inRange(ycrcb, (0, 133, 77), (255, 173, 127))
+
+def quality_precheck(image: np.ndarray, full_size: Optional[Tuple[int, int]] = None,
+                     thresholds: Optional[Dict] = None) -> Dict:
+    """فحص جودة سريع على إطار مصغّر
+
+    image: الصورة بالدقة الكاملة أو فك ترميز مصغّر (decode_reduced)، وحينها full_size
+    هو (الارتفاع، العرض) التقريبي للأصل. يعيد passed وأسباب الرفض والقياسات.
+    palm_coverage تكون None للصور غير الملونة (رمادية أو تحت حمراء) لأن فحص لون
+    البشرة لا ينطبق عليها.
+    """
+    limits = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+    height, width = full_size or image.shape[:2]
+    reasons = []
+    if min(height, width) < limits['min_size']:
+        reasons.append('too_small')
+
+    scale = GATE_FRAME_SIZE / max(image.shape[:2])
+    frame = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else image
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+
+    sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    if sharpness < limits['min_sharpness']:
+        reasons.append('blurry')
+
+    brightness = float(np.mean(gray))
+    clipped_ratio = float(np.mean((gray <= 5) | (gray >= 250)))
+    if brightness < limits['min_brightness']:
+        reasons.append('underexposed')
+    elif brightness > limits['max_brightness']:
+        reasons.append('overexposed')
+    if clipped_ratio > limits['max_clipped_ratio']:
+        reasons.append('clipped')
+
+    # الالتقاطات الرمادية وتحت الحمراء (Cr=Cb=128) خارج نطاق لون البشرة دائماً، فلا
+    # يُفحص وجود الكف بلون البشرة إلا للصور الملونة
+    saturation = float(cv2.mean(cv2.cvtColor(frame, cv2.COLOR_BGR2HSV))[1]) if frame.ndim == 3 else 0.0
+    achromatic = saturation < limits['max_achromatic_saturation']
+    palm_coverage = None if achromatic else float(np.mean(_skin_mask(frame) > 0))
+    if palm_coverage is not None and palm_coverage < limits['min_palm_coverage']:
+        reasons.append('no_palm')
+
+    return {
+        'passed': not reasons,
+        'reasons': reasons,
+        'width': int(width),
+        'height': int(height),
+        'sharpness': sharpness,
+        'brightness': brightness,
+        'clipped_ratio': clipped_ratio,
+        'achromatic': achromatic,
+        'palm_coverage': palm_coverage
+    }
+
+def decode_reduced(data: bytes) -> Tuple[Optional[np.ndarray], Optional[Tuple[int, int]]]:
+    """فك ترميز مصغّر سريع للفحص، مع الحجم التقريبي للصورة الأصلية"""
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    image = cv2.imdecode(buffer, cv2.IMREAD_REDUCED_COLOR_2)
+    if image is None:
+        return None, None
+    return image, (image.shape[0] * REDUCED_DECODE_FACTOR, image.shape[1] * REDUCED_DECODE_FACTOR)
@@ -0,0 +1,96 @@
+"""
+إعداد خيوط المعالجة لـ TensorFlow وOpenCV وoneDNN لكل عامل عند بدء التشغيل
+عدة عمال على نفس الخادم يقتسمون الأنوية بدلاً من أن ينشئ كل منهم خيطاً لكل نواة
+"""
+import os
+import sys
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# الإعداد المطبق في هذه العملية (انظر get_runtime_config)
+_runtime_config: Optional[Dict] = None
+
+def available_cores() -> int:
+    """عدد الأنوية المتاحة لهذه العملية (يحترم cpuset/taskset في الحاويات)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+def compute_thread_budget(workers: int = 1, cores: Optional[int] = None) -> Dict[str, int]:
+    """توزيع الأنوية على العمال: خيوط intra-op وinter-op وOpenCV لكل عامل
+
+    حصة العامل = الأنوية / العمال (واحد على الأقل). inter-op خيط واحد إلا مع حصة
+    كبيرة، لأن رسم الاستدلال تسلسلي تقريباً والتوازي داخل العمليات يكفي.
+    """
+    cores = cores or available_cores()
+    per_worker = max(1, cores // max(1, workers))
+    return {
+        'cores': cores,
+        'workers': workers,
+        'intra_op_threads': per_worker,
+        'inter_op_threads': 2 if per_worker >= 4 else 1,
+        'cv2_threads': per_worker,
+    }
+
+def configure_runtime(workers: Optional[int] = None,
+                      intra_op_threads: Optional[int] = None,
+                      inter_op_threads: Optional[int] = None,
+                      cv2_threads: Optional[int] = None,
+                      onednn: Optional[bool] = None) -> Dict:
+    """تطبيق إعداد الخيوط على هذه العملية ويُستدعى قبل بناء أي نموذج
+
+    القيم غير المحددة تُقرأ من PALM_WORKERS (أو WEB_CONCURRENCY) وPALM_INTRA_OP_THREADS
+    وPALM_INTER_OP_THREADS وPALM_CV2_THREADS وPALM_ONEDNN، وإلا تُحسب من
+    compute_thread_budget. إعداد oneDNN لا يسري إلا قبل استيراد TensorFlow.
+    """
+    global _runtime_config
+    import cv2
+
+    workers = workers or _env_int('PALM_WORKERS') or _env_int('WEB_CONCURRENCY') or 1
+    config = compute_thread_budget(workers)
+    config['intra_op_threads'] = intra_op_threads or _env_int('PALM_INTRA_OP_THREADS') or config['intra_op_threads']
+    config['inter_op_threads'] = inter_op_threads or _env_int('PALM_INTER_OP_THREADS') or config['inter_op_threads']
+    config['cv2_threads'] = cv2_threads or _env_int('PALM_CV2_THREADS') or config['cv2_threads']
+    if onednn is None:
+        onednn = os.environ.get('PALM_ONEDNN', '1') != '0'
+
+    # oneDNN وOpenMP يقرآن متغيرات البيئة عند تحميل TensorFlow
+    config['onednn_applied'] = 'tensorflow' not in sys.modules
+    if config['onednn_applied']:
+        os.environ['TF_ENABLE_ONEDNN_OPTS'] = '1' if onednn else '0'
+        os.environ.setdefault('OMP_NUM_THREADS', str(config['intra_op_threads']))
+        # بدون انتظار نشط للخيوط بعد كل عملية حتى لا تسرق الأنوية من العمال الآخرين
+        os.environ.setdefault('KMP_BLOCKTIME', '0')
+    config['onednn'] = os.environ.get('TF_ENABLE_ONEDNN_OPTS', '1') != '0'
+
+    cv2.setNumThreads(config['cv2_threads'])
+
+    import tensorflow as tf
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(config['intra_op_threads'])
+        tf.config.threading.set_inter_op_parallelism_threads(config['inter_op_threads'])
+        for gpu in tf.config.list_physical_devices('GPU'):
+            # حجز ذاكرة GPU عند الحاجة بدلاً من حجزها كاملة لعامل واحد
+            tf.config.experimental.set_memory_growth(gpu, True)
+    except RuntimeError:
+        logger.warning("سياق TensorFlow مهيأ مسبقاً؛ بقيت إعدادات الخيوط الحالية")
+    # القيم الفعلية (0 يعني أن TensorFlow يختار بنفسه)
+    config['intra_op_threads'] = tf.config.threading.get_intra_op_parallelism_threads()
+    config['inter_op_threads'] = tf.config.threading.get_inter_op_parallelism_threads()
+
+    _runtime_config = config
+    logger.info(f"إعداد التشغيل: {config}")
+    return config
+
+def get_runtime_config() -> Optional[Dict]:
+    """الإعداد المطبق في هذه العملية أو None قبل configure_runtime"""
+    if _runtime_config is None:
+        return None
+    return dict(_runtime_config)
@@ -0,0 +1,140 @@
+"""
+تكميم قوالب بصمة الكف لتقليل ذاكرة المعارض الكبيرة
+يدعم التكميم القياسي int8 لكل بُعد وتكميم المنتج (PQ) مع حساب المسافة غير المتماثل
+"""
+import numpy as np
+from sklearn.cluster import KMeans
+from typing import Tuple
+import logging
+
+# حجم الكتلة عند حساب التشابه لتحديد الذاكرة المؤقتة
+SCORING_CHUNK_SIZE = 65536
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """تطبيع الصفوف إلى طول الوحدة (التشابه الكوسيني لا يتأثر بالطول)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / (norms + 1e-8)
+
+class ScalarQuantizer:
+    """تكميم قياسي int8 بمقياس مستقل لكل بُعد"""
+
+    method = 'int8'
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.scales = None
+
+    def fit(self, vectors: np.ndarray) -> 'ScalarQuantizer':
+        """حساب مقياس كل بُعد من القيمة المطلقة العظمى"""
+        normalized = _normalize_rows(vectors)
+        absmax = np.abs(normalized).max(axis=0)
+        self.scales = np.where(absmax > 0, absmax / 127.0, 1.0).astype(np.float32)
+        return self
+
+    def encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """ترميز المتجهات إلى int8 مع أطوال المتجهات المعاد بناؤها"""
+        normalized = _normalize_rows(vectors)
+        codes = np.clip(np.rint(normalized / self.scales), -127, 127).astype(np.int8)
+        norms = np.linalg.norm(self.decode(codes), axis=1).astype(np.float32)
+        return codes, norms
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """إعادة بناء متجهات float32 تقريبية"""
+        return codes.astype(np.float32) * self.scales
+
+    def similarities(self, query: np.ndarray, codes: np.ndarray, norms: np.ndarray) -> np.ndarray:
+        """التشابه الكوسيني التقريبي بين الاستعلام وجميع القوالب المكممة"""
+        query = _normalize_rows(query.reshape(1, -1))[0]
+        # دمج المقياس في الاستعلام بدلاً من فك ترميز المعرض
+        scaled_query = query * self.scales
+
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORING_CHUNK_SIZE):
+            chunk = codes[start:start + SCORING_CHUNK_SIZE]
+            scores[start:start + len(chunk)] = chunk.astype(np.float32) @ scaled_query
+        return scores / (norms + 1e-8)
+
+    def bytes_per_template(self, dim: int) -> int:
+        """عدد البايتات لكل قالب (الرموز + الطول)"""
+        return dim + 4
+
+class ProductQuantizer:
+    """تكميم المنتج (PQ) مع حساب المسافة غير المتماثل (ADC)"""
+
+    method = 'pq'
+
+    def __init__(self, n_subvectors: int = 16, n_centroids: int = 256, random_state: int = 42):
+        if n_centroids > 256:
+            raise ValueError("عدد المراكز يجب ألا يتجاوز 256 لترميز uint8")
+        self.logger = logging.getLogger(__name__)
+        self.n_subvectors = n_subvectors
+        self.n_centroids = n_centroids
+        self.random_state = random_state
+        self.codebooks = None
+        self.subvector_dim = None
+
+    def fit(self, vectors: np.ndarray) -> 'ProductQuantizer':
+        """تدريب دفتر رموز (KMeans) لكل فضاء فرعي"""
+        normalized = _normalize_rows(vectors)
+        dim = normalized.shape[1]
+        if dim % self.n_subvectors != 0:
+            raise ValueError(f"البُعد {dim} لا يقبل القسمة على {self.n_subvectors}")
+
+        self.subvector_dim = dim // self.n_subvectors
+        n_clusters = min(self.n_centroids, len(normalized))
+        self.codebooks = []
+        for j in range(self.n_subvectors):
+            sub = normalized[:, j * self.subvector_dim:(j + 1) * self.subvector_dim]
+            kmeans = KMeans(n_clusters=n_clusters, n_init=1, random_state=self.random_state)
+            kmeans.fit(sub)
+            self.codebooks.append(kmeans.cluster_centers_.astype(np.float32))
+        self.codebooks = np.stack(self.codebooks)
+
+        self.logger.info(f"تم تدريب تكميم المنتج: {self.n_subvectors} فضاء فرعي × {n_clusters} مركز")
+        return self
+
+    def encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """ترميز المتجهات إلى رموز uint8 (رمز لكل فضاء فرعي)"""
+        normalized = _normalize_rows(vectors)
+        codes = np.empty((len(normalized), self.n_subvectors), dtype=np.uint8)
+        for j in range(self.n_subvectors):
+            sub = normalized[:, j * self.subvector_dim:(j + 1) * self.subvector_dim]
+            centroids = self.codebooks[j]
+            distances = (
+                (sub ** 2).sum(axis=1, keepdims=True)
+                - 2 * sub @ centroids.T
+                + (centroids ** 2).sum(axis=1)
+            )
+            codes[:, j] = distances.argmin(axis=1)
+        norms = np.linalg.norm(self.decode(codes), axis=1).astype(np.float32)
+        return codes, norms
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """إعادة بناء متجهات float32 تقريبية من مراكز الفضاءات الفرعية"""
+        parts = [self.codebooks[j][codes[:, j]] for j in range(self.n_subvectors)]
+        return np.concatenate(parts, axis=1)
+
+    def similarities(self, query: np.ndarray, codes: np.ndarray, norms: np.ndarray) -> np.ndarray:
+        """التشابه الكوسيني التقريبي عبر جداول البحث (ADC)"""
+        query = _normalize_rows(query.reshape(1, -1))[0]
+        # جدول الضرب الداخلي بين جزء الاستعلام وكل مركز: (m, K)
+        query_parts = query.reshape(self.n_subvectors, self.subvector_dim)
+        tables = np.einsum('mkd,md->mk', self.codebooks, query_parts)
+
+        scores = np.zeros(len(codes), dtype=np.float32)
+        for j in range(self.n_subvectors):
+            scores += tables[j][codes[:, j]]
+        return scores / (norms + 1e-8)
+
+    def bytes_per_template(self, dim: int) -> int:
+        """عدد البايتات لكل قالب (الرموز + الطول)"""
+        return self.n_subvectors + 4
+
+def create_quantizer(method: str = 'int8', **kwargs):
+    """إنشاء مكمم حسب الاسم"""
+    if method == 'int8':
+        return ScalarQuantizer()
+    elif method == 'pq':
+        return ProductQuantizer(**kwargs)
+    raise ValueError(f"طريقة التكميم غير مدعومة: {method}")
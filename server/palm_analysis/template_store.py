@@ -0,0 +1,170 @@
+"""
+مستودع قوالب بصمة الكف المبني على SQLite
+تخزين دائم ومشترك بين العمليات بدون قاعدة بيانات خارجية
+"""
+import numpy as np
+import sqlite3
+import threading
+import time
+import logging
+from typing import Dict, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS templates (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    label TEXT NOT NULL,
+    dim INTEGER NOT NULL,
+    vector BLOB NOT NULL,
+    quality REAL NOT NULL DEFAULT 1.0,
+    enrolled_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_templates_user_id ON templates (user_id);
+CREATE INDEX IF NOT EXISTS idx_templates_enrolled_at ON templates (enrolled_at);
+CREATE TABLE IF NOT EXISTS deletions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    deleted_at REAL NOT NULL
+);
+"""
+
+# نتيجة القراءة: المعرفات، مصفوفة القوالب، التسميات، معرفات المستخدمين، أوزان الجودة
+TemplateRows = Tuple[np.ndarray, np.ndarray, List[str], List[str], np.ndarray]
+# الحذف منذ آخر مزامنة: معرفات صفوف جدول deletions ومعرفات المستخدمين المحذوفين
+DeletionRows = Tuple[np.ndarray, List[str]]
+
+TEMPLATE_COLUMNS = 'SELECT id, user_id, label, dim, vector, quality FROM templates'
+
+class TemplateStore:
+    """مستودع قوالب SQLite: القالب float32 كـ BLOB مع فهارس على المستخدم ووقت التسجيل
+
+    يعمل بوضع WAL في SQLite فيقرأ العمال الآخرون أثناء الكتابة، ويلتقط كل عامل
+    الصفوف الجديدة بمقارنة المعرف التصاعدي مع آخر معرف حمّله. حذف مستخدم يُسجل
+    في جدول deletions فيلتقطه العمال بنفس الطريقة ويستبعدون صفوفه من معارضهم.
+    """
+
+    def __init__(self, path: str, timeout: float = 30.0):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def add(self, feature_vector: np.ndarray, label: str, user_id: str, quality: float = 1.0) -> int:
+        """حفظ قالب وإرجاع معرف صفه"""
+        vector = np.asarray(feature_vector, dtype=np.float32).ravel()
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT INTO templates (user_id, label, dim, vector, quality, enrolled_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (str(user_id), str(label), len(vector), vector.tobytes(), float(quality), time.time())
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def add_many(self, feature_vectors: List[np.ndarray], labels: List[str], user_ids: List[str],
+                 qualities: Optional[List[float]] = None) -> int:
+        """حفظ دفعة قوالب في معاملة واحدة"""
+        if qualities is None:
+            qualities = [1.0] * len(feature_vectors)
+        now = time.time()
+        rows = []
+        for vector, label, user_id, quality in zip(feature_vectors, labels, user_ids, qualities):
+            vector = np.asarray(vector, dtype=np.float32).ravel()
+            rows.append((str(user_id), str(label), len(vector), vector.tobytes(), float(quality), now))
+        with self._lock:
+            self._conn.executemany(
+                'INSERT INTO templates (user_id, label, dim, vector, quality, enrolled_at) VALUES (?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            self._conn.commit()
+        return len(rows)
+
+    def _fetch(self, where: str = '', params: tuple = ()) -> TemplateRows:
+        with self._lock:
+            rows = self._conn.execute(f'{TEMPLATE_COLUMNS} {where} ORDER BY id', params).fetchall()
+        return self._to_arrays(rows)
+
+    @staticmethod
+    def _to_arrays(rows: List[tuple]) -> TemplateRows:
+        if not rows:
+            return (np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32), [], [],
+                    np.empty(0, dtype=np.float32))
+
+        dims = {row[3] for row in rows}
+        if len(dims) != 1:
+            raise ValueError(f"أبعاد القوالب غير متطابقة في المستودع: {sorted(dims)}")
+        # دمج كل الـ BLOBs في مخزن واحد ثم عرضه كمصفوفة بدون نسخ لكل صف
+        vectors = np.frombuffer(b''.join(row[4] for row in rows), dtype=np.float32).reshape(len(rows), dims.pop())
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        qualities = np.array([row[5] for row in rows], dtype=np.float32)
+        return ids, vectors, [row[2] for row in rows], [row[1] for row in rows], qualities
+
+    def load_all(self) -> TemplateRows:
+        """تحميل جميع القوالب دفعة واحدة (عند بدء التشغيل)"""
+        return self._fetch()
+
+    def fetch_since(self, last_id: int) -> TemplateRows:
+        """القوالب المضافة بعد last_id (بما فيها ما أضافته عمليات أخرى)"""
+        return self._fetch('WHERE id > ?', (int(last_id),))
+
+    def fetch_changes_since(self, last_id: int, last_deletion_id: int) -> Tuple[TemplateRows, DeletionRows]:
+        """القوالب المضافة بعد last_id والمستخدمون المحذوفون بعد last_deletion_id
+
+        القراءتان في معاملة واحدة (لقطة WAL متسقة): كل قالب في المعرض قبلها أقدم من
+        الحذف المُعاد، والقوالب المُعادة هي ما بقي بعده، فيُطبق الحذف أولاً ثم الإضافة.
+        """
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                deletions = self._conn.execute(
+                    'SELECT id, user_id FROM deletions WHERE id > ? ORDER BY id', (int(last_deletion_id),)
+                ).fetchall()
+                rows = self._conn.execute(f'{TEMPLATE_COLUMNS} WHERE id > ? ORDER BY id', (int(last_id),)).fetchall()
+            finally:
+                self._conn.commit()
+        deletion_ids = np.array([row[0] for row in deletions], dtype=np.int64)
+        return self._to_arrays(rows), (deletion_ids, [row[1] for row in deletions])
+
+    def user_templates(self, user_id: str) -> TemplateRows:
+        """قوالب مستخدم واحد (عبر فهرس user_id)"""
+        return self._fetch('WHERE user_id = ?', (str(user_id),))
+
+    def enrolled_between(self, start: float, end: Optional[float] = None) -> TemplateRows:
+        """القوالب المسجلة في فترة زمنية (عبر فهرس enrolled_at)"""
+        end = time.time() if end is None else end
+        return self._fetch('WHERE enrolled_at >= ? AND enrolled_at < ?', (float(start), float(end)))
+
+    def delete_user(self, user_id: str) -> int:
+        """حذف قوالب مستخدم وإرجاع عددها (يُنشر إلى معارض العمال عبر جدول deletions)"""
+        with self._lock:
+            cursor = self._conn.execute('DELETE FROM templates WHERE user_id = ?', (str(user_id),))
+            self._conn.execute('INSERT INTO deletions (user_id, deleted_at) VALUES (?, ?)',
+                               (str(user_id), time.time()))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def last_id(self) -> int:
+        """أكبر معرف صف في المستودع"""
+        with self._lock:
+            return self._conn.execute('SELECT COALESCE(MAX(id), 0) FROM templates').fetchone()[0]
+
+    def last_deletion_id(self) -> int:
+        """أكبر معرف في جدول deletions"""
+        with self._lock:
+            return self._conn.execute('SELECT COALESCE(MAX(id), 0) FROM deletions').fetchone()[0]
+
+    def get_store_info(self) -> Dict:
+        """معلومات المستودع"""
+        with self._lock:
+            n_templates, n_users = self._conn.execute(
+                'SELECT COUNT(*), COUNT(DISTINCT user_id) FROM templates'
+            ).fetchone()
+        return {'path': self.path, 'n_templates': n_templates, 'n_users': n_users}
+
+    def close(self) -> None:
+        """إغلاق الاتصال"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,35 @@
+"""
+اختبار مكتشف الشذوذ: التدريب على العينات الحقيقية فقط
+"""
+import os
+import sys
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from anti_spoofing import AdvancedAntiSpoofingSystem
+
+def _textured(rng, n):
+    """التقاطات حقيقية اصطناعية: خطوط حادة مع ضوضاء مستشعر"""
+    images = []
+    for _ in range(n):
+        image = np.full((120, 160, 3), rng.integers(120, 200, 3), dtype=np.uint8)
+        for _ in range(12):
+            x1, y1, x2, y2 = (int(v) for v in rng.integers(0, 120, 4))
+            cv2.line(image, (x1, y1), (x2, y2), (60, 50, 50), 2)
+        images.append(np.clip(image + rng.normal(0, 8, image.shape), 0, 255).astype(np.uint8))
+    return images
+
+def test_fit_on_genuine_only():
+    rng = np.random.default_rng(0)
+    genuine = _textured(rng, 60)
+    # إعادة التصوير (شاشة أو طباعة): ضبابية تفقد النسيج الدقيق
+    fake = [cv2.GaussianBlur(image, (9, 9), 4) for image in _textured(rng, 30)]
+
+    system = AdvancedAntiSpoofingSystem(build_cnn_detector=False)
+    report = system.train_anomaly_detector(genuine, fake, n_workers=1)
+    assert report['n_genuine'] == 60 and report['n_fake'] == 30
+    # لو دخلت المزيفة التدريب لصارت "طبيعية"؛ بالتدريب على الحقيقية فقط تُرفض
+    assert report['fake_rejection_rate'] > 0.9
+    assert report['genuine_acceptance_rate'] > 0.8
@@ -0,0 +1,162 @@
+"""
+اختبارات ترتيب المعرض مع الصفوف المستبدلة (سياسة القوالب 'mean') وحفظ المعرض بالأجيال
+"""
+import os
+import pickle
+import sys
+import numpy as np
+import pytest
+from sklearn.metrics.pairwise import cosine_similarity
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from biometric_matcher import BiometricMatcher, ConcurrentGallery, ShardedBiometricMatcher
+
+N_USERS = 40
+DIM = 32
+
+def _matcher_with_tombstones():
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(N_USERS, DIM))
+    vectors = np.repeat(centers, 2, axis=0) + 0.1 * rng.normal(size=(2 * N_USERS, DIM))
+    users = [str(i // 2) for i in range(2 * N_USERS)]
+    matcher = BiometricMatcher(n_components=8)
+    matcher.train_pca_svm(list(vectors), [f'user_{u}' for u in users], users)
+    matcher.set_template_policy('mean')
+    # كل تسجيل جديد يستبدل صفوف المستخدم القديمة بقالب مدمج
+    for user in range(N_USERS // 2):
+        matcher.add_palm_sample(centers[user] + 0.1 * rng.normal(size=DIM), f'user_{user}', str(user))
+    return matcher, centers
+
+def _brute_force(matcher, query, top_k):
+    gallery = np.asarray(matcher.feature_vectors)
+    scores = cosine_similarity(matcher.scaler.transform(query.reshape(1, -1)), gallery).ravel()
+    scores[list(matcher.inactive_rows)] = -np.inf
+    best = {}
+    for idx in np.argsort(-scores, kind='stable'):
+        if np.isfinite(scores[idx]):
+            best.setdefault(matcher.user_ids[idx], scores[idx])
+    return list(best)[:top_k]
+
+@pytest.mark.parametrize('mode', ['exact', 'cascade', 'int8'])
+def test_tombstoned_rows_are_masked(mode, monkeypatch):
+    matcher, centers = _matcher_with_tombstones()
+    assert matcher.inactive_rows
+    if mode == 'cascade':
+        matcher.enable_cascade(shortlist_size=N_USERS * 3)
+    elif mode == 'int8':
+        matcher.quantize_gallery('int8', rerank_size=N_USERS * 3)
+
+    requested = []
+    rank_rows = matcher._rank_rows
+    monkeypatch.setattr(matcher, '_rank_rows',
+                        lambda query, top_k, *args: requested.append(top_k) or rank_rows(query, top_k, *args))
+
+    for user in range(N_USERS):
+        matches = matcher.find_best_matches(centers[user], top_k=5)
+        returned = [match['user_id'] for match in matches]
+        assert returned == _brute_force(matcher, centers[user], 5)
+    # الصفوف المستبدلة لا تكبّر حجم الطلب
+    assert set(requested) == {5 * matcher.max_templates_per_user}
+
+def test_save_gallery_generations(tmp_path, monkeypatch):
+    matcher, centers = _matcher_with_tombstones()
+    directory = str(tmp_path / 'gallery')
+    matcher.save_gallery(directory)
+    matcher.add_palm_sample(centers[-1], f'user_{N_USERS - 1}', str(N_USERS - 1))
+    matcher.save_gallery(directory)
+    expected = [match['user_id'] for match in matcher.find_best_matches(centers[3], top_k=3)]
+
+    # انهيار أثناء الحفظ الثالث: الرأس ما زال يشير إلى الجيل 2 المكتمل
+    writes = []
+    real_dump = pickle.dump
+    def crash(*args, **kwargs):
+        writes.append(args)
+        raise OSError('disk full')
+    monkeypatch.setattr(pickle, 'dump', crash)
+    matcher.add_palm_sample(centers[5], 'user_5', '5')
+    with pytest.raises(OSError):
+        matcher.save_gallery(directory)
+    monkeypatch.setattr(pickle, 'dump', real_dump)
+    assert writes
+
+    loaded = BiometricMatcher()
+    loaded.load_gallery(directory)
+    assert [match['user_id'] for match in loaded.find_best_matches(centers[3], top_k=3)] == expected
+
+    matcher.save_gallery(directory)
+    # الجيل السابق يبقى والأقدم يُحذف
+    generations = sorted(entry for entry in os.listdir(directory) if entry.startswith('templates'))
+    assert generations == ['templates.2.f32', 'templates.3.f32']
+
+def test_concurrent_gallery_read_after_write():
+    matcher, centers = _matcher_with_tombstones()
+    # مهلة طويلة حتى لا ينشر خيط الخلفية الدفعة أثناء الاختبار
+    gallery = ConcurrentGallery(matcher, batch_size=32, max_delay=60)
+    try:
+        vector = np.random.default_rng(1).normal(size=DIM) * 5
+        gallery.add_palm_sample(vector, 'user_new', 'new')
+        # التسجيل غير مرئي للتحقق حتى تُنشر الدفعة
+        assert gallery.find_best_matches(vector, top_k=1)[0]['user_id'] != 'new'
+        gallery.flush()
+        assert gallery.find_best_matches(vector, top_k=1)[0]['user_id'] == 'new'
+    finally:
+        gallery.close()
+
+def test_load_gallery_rejects_other_model_profile(tmp_path):
+    matcher, _ = _matcher_with_tombstones()
+    matcher.model_profile = 'standard'
+    directory = str(tmp_path / 'gallery')
+    matcher.save_gallery(directory)
+
+    other = BiometricMatcher()
+    other.model_profile = 'compact_128'
+    with pytest.raises(ValueError):
+        other.load_gallery(directory)
+    # بدون ملف محدد يُعتمد الملف المحفوظ
+    unknown = BiometricMatcher()
+    unknown.load_gallery(directory)
+    assert unknown.model_profile == 'standard'
+
+@pytest.mark.parametrize('mode', ['exact', 'cascade', 'lsh'])
+def test_all_rows_tombstoned_is_no_match(mode):
+    matcher, centers = _matcher_with_tombstones()
+    if mode == 'cascade':
+        matcher.enable_cascade(shortlist_size=10, svm_skip_margin=0.1)
+    elif mode == 'lsh':
+        matcher.build_lsh_index(n_tables=2, n_bits=4)
+    matcher._retire_rows(range(len(matcher.user_ids)))
+    result = matcher.match_palm_print(centers[0])
+    assert not result['is_match'] and result['match_details']['user_id'] is None
+    assert matcher.find_best_matches(centers[0], top_k=3) == []
+
+@pytest.mark.parametrize('lsh', [False, True])
+def test_near_duplicates_skip_tombstoned_rows(lsh):
+    matcher, _ = _matcher_with_tombstones()
+    if lsh:
+        matcher.build_lsh_index(n_tables=4, n_bits=4)
+    gallery = np.asarray(matcher.feature_vectors)
+    for row in sorted(matcher.inactive_rows)[:5]:
+        # القالب المستبدل نفسه كاستعلام: يطابقه بتشابه 1.0 لو لم يُستبعد
+        query = matcher.scaler.inverse_transform(gallery[row].reshape(1, -1)).ravel()
+        duplicates = matcher.find_near_duplicates(query, similarity_threshold=0.999)
+        assert duplicates == []
+        best = matcher.find_best_matches(query, top_k=1)[0]
+        assert best['similarity'] < 0.999
+
+def test_sharded_matches_single_process_gallery():
+    matcher, centers = _matcher_with_tombstones()
+    rng = np.random.default_rng(2)
+    with ShardedBiometricMatcher(n_shards=2, start_method='fork') as sharded:
+        sharded.load_from_matcher(matcher)
+        # الصفوف المستبدلة لا تُنقل
+        assert sharded.get_model_info()['n_samples'] == len(matcher.user_ids) - len(matcher.inactive_rows)
+        # تسجيل جديد يُدمج في القطعة بنفس السياسة
+        sample = matcher.scaler.transform((centers[30] + 0.1 * rng.normal(size=DIM)).reshape(1, -1)).ravel()
+        matcher.add_palm_sample(sample, 'user_30', '30')
+        sharded.add_palm_sample(sample, 'user_30', '30')
+        for user in (3, 30, 35):
+            expected = matcher.find_best_matches(centers[user], top_k=5)
+            got = sharded.find_best_matches(centers[user], top_k=5)
+            assert [m['user_id'] for m in got] == [m['user_id'] for m in expected]
+            assert np.allclose([m['similarity'] for m in got], [m['similarity'] for m in expected], atol=1e-5)
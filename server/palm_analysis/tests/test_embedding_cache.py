@@ -0,0 +1,31 @@
+"""
+اختبارات طبقة القرص في الذاكرة المؤقتة للميزات: الخانات نصف المكتوبة تُعامل كإخفاق
+"""
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embedding_cache import EmbeddingCache
+
+DIM = 8
+
+def test_torn_disk_slot_is_a_miss(tmp_path):
+    directory = str(tmp_path / 'cache')
+    writer = EmbeddingCache(DIM, capacity=4, disk_path=directory, disk_capacity=16)
+    vector = np.arange(DIM, dtype=np.float32)
+    writer.put(b'image', 'weights', vector)
+    writer.flush()
+
+    # عملية أخرى تقرأ من القرص (ذاكرتها فارغة)
+    reader = EmbeddingCache(DIM, capacity=4, disk_path=directory)
+    assert np.array_equal(reader.get(b'image', 'weights'), vector)
+
+    # كتابة متزامنة: المفتاح الجديد مكتوب والمتجه نصف مكتوب
+    slot = int(np.flatnonzero(writer._disk_keys.any(axis=1))[0])
+    writer._disk_vectors[slot, :DIM // 2] = -1
+    writer.flush()
+    reader = EmbeddingCache(DIM, capacity=4, disk_path=directory)
+    assert reader.get(b'image', 'weights') is None
+    assert reader.misses == 1
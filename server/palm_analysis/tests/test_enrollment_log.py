@@ -0,0 +1,158 @@
+"""
+اختبارات سجل التسجيل المسبق: الترقيم بعد الضغط وإعادة التشغيل
+التشغيل: python -m pytest tests
+"""
+import os
+import struct
+import sys
+import zlib
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from biometric_matcher import BiometricMatcher, ConcurrentGallery
+from enrollment_log import EnrollmentLog, LEGACY_MAGIC, LOG_MAGIC, RECORD_HEADER_V1, RECORD_HEADER_V1_TAIL
+
+def _append(log, count, start=0):
+    rng = np.random.default_rng(start)
+    return [log.append(rng.random(8), f'user_{start + i}', str(start + i), wait_durable=False)
+            for i in range(count)]
+
+def _replayed(path, after_sequence):
+    applied = []
+    log = EnrollmentLog(path)
+    log.replay(lambda vector, label, user_id, quality: applied.append(user_id), after_sequence=after_sequence)
+    return log, applied
+
+def test_compact_restart_append_restart(tmp_path):
+    path = str(tmp_path / 'enrollments.wal')
+    log = EnrollmentLog(path)
+    assert _append(log, 5) == [1, 2, 3, 4, 5]
+    # اللقطة تضم التسلسل 5 فيُحذف كل السجل
+    snapshot_sequence = log.last_sequence
+    log.compact(snapshot_sequence)
+    log.close()
+
+    log, applied = _replayed(path, snapshot_sequence)
+    assert applied == []
+    assert log.last_sequence == 5
+    assert _append(log, 3, start=5) == [6, 7, 8]
+    log.close()
+
+    log, applied = _replayed(path, snapshot_sequence)
+    assert applied == ['5', '6', '7']
+    assert log.last_sequence == 8
+    log.close()
+
+def test_advance_to_snapshot_sequence(tmp_path):
+    # سجل جديد بجانب لقطة أحدث منه: الترقيم يبدأ بعد تسلسل اللقطة
+    log = EnrollmentLog(str(tmp_path / 'enrollments.wal'))
+    log.advance_to(10)
+    log.advance_to(4)
+    assert _append(log, 2) == [11, 12]
+    log.close()
+
+def test_torn_tail_is_truncated(tmp_path):
+    path = str(tmp_path / 'enrollments.wal')
+    log = EnrollmentLog(path)
+    _append(log, 3)
+    log.close()
+    with open(path, 'ab') as f:
+        f.write(b'\x40\x00\x00\x00partial')
+
+    log, applied = _replayed(path, 0)
+    assert applied == ['0', '1', '2']
+    assert _append(log, 1, start=3) == [4]
+    log.close()
+
+def test_legacy_v1_log_is_migrated(tmp_path):
+    # سجل بالصيغة الأولى: معرّف PWAL بلا تسلسل أساس وسجلات بلا وزن جودة
+    path = str(tmp_path / 'enrollments.wal')
+    vector = np.arange(4, dtype=np.float32)
+    with open(path, 'wb') as f:
+        f.write(LEGACY_MAGIC)
+        for sequence in (1, 2):
+            payload = b'7' + b'user_7' + vector.tobytes()
+            tail = RECORD_HEADER_V1_TAIL.pack(sequence, 1, 6, len(vector))
+            f.write(struct.pack('<II', RECORD_HEADER_V1.size + len(payload), zlib.crc32(tail + payload)) + tail + payload)
+
+    applied = []
+    log = EnrollmentLog(path)
+    log.replay(lambda v, label, user_id, quality: applied.append((label, user_id, quality, v.tolist())))
+    assert applied == [('user_7', '7', 1.0, vector.tolist())] * 2
+    assert _append(log, 1) == [3]
+    log.close()
+    with open(path, 'rb') as f:
+        assert f.read(len(LOG_MAGIC)) == LOG_MAGIC
+
+@pytest.mark.parametrize('policy', ['append', 'mean'])
+def test_reload_then_compact_keeps_log_only_records(tmp_path, policy):
+    rng = np.random.default_rng(0)
+    vectors = {user: rng.normal(size=16) for user in 'abcd'}
+    matcher = BiometricMatcher(n_components=2)
+    matcher.train_pca_svm([vectors['a'], vectors['b']], ['user_a', 'user_b'], ['a', 'b'])
+    matcher.set_template_policy(policy)
+    log = EnrollmentLog(str(tmp_path / 'enrollments.wal'))
+    gallery = ConcurrentGallery(matcher, enrollment_log=log)
+    directory = str(tmp_path / 'gallery')
+
+    def register(user):
+        sequence = log.append(vectors[user], f'user_{user}', user)
+        gallery.add_palm_sample(vectors[user], f'user_{user}', user, sequence=sequence)
+
+    try:
+        register('c')
+        assert gallery.compact_log(directory) == 1
+        register('d')
+        gallery.flush()
+        # d موجود في السجل والذاكرة فقط، واللقطة المحفوظة تنتهي عند c
+        gallery.reload_async(directory).join()
+        assert sorted(set(gallery.snapshot().user_ids)) == ['a', 'b', 'c', 'd']
+        # عينة معلقة أعيدت من السجل لا تُضاف مرتين
+        register('d')
+        gallery.reload_async(directory).join()
+        gallery.flush()
+        snapshot = gallery.snapshot()
+        active = [user for i, user in enumerate(snapshot.user_ids) if i not in snapshot.inactive_rows]
+        assert active.count('d') == (2 if policy == 'append' else 1)
+        assert gallery.compact_log(directory) == 3
+    finally:
+        gallery.close()
+        log.close()
+
+    restored = BiometricMatcher()
+    restored.load_gallery(directory)
+    log, applied = _replayed(str(tmp_path / 'enrollments.wal'), restored.enrollment_sequence)
+    log.close()
+    assert applied == []
+    assert sorted(set(restored.user_ids)) == ['a', 'b', 'c', 'd']
+
+def test_compact_log_stops_at_gallery_sequence(tmp_path):
+    # سجل أحدث مما يحتويه المعرض (تسجيل لم يُنشر بعد) لا يُحذف بالضغط
+    matcher = BiometricMatcher(n_components=2)
+    rng = np.random.default_rng(1)
+    matcher.train_pca_svm([rng.normal(size=16), rng.normal(size=16)], ['user_a', 'user_b'], ['a', 'b'])
+    log = EnrollmentLog(str(tmp_path / 'enrollments.wal'))
+    gallery = ConcurrentGallery(matcher, enrollment_log=log, max_delay=60)
+    try:
+        sequence = log.append(rng.normal(size=16), 'user_c', 'c')
+        gallery.add_palm_sample(rng.normal(size=16), 'user_c', 'c', sequence=sequence)
+        gallery.flush()
+        log.append(rng.normal(size=16), 'user_d', 'd')
+        assert gallery.compact_log(str(tmp_path / 'gallery')) == 1
+        assert log.compacted_sequence == 1
+    finally:
+        gallery.close()
+        log.close()
+    _, applied = _replayed(str(tmp_path / 'enrollments.wal'), 1)
+    assert applied == ['d']
+
+def test_second_owner_is_refused(tmp_path):
+    # عاملان على نفس السجل يكرران الترقيم ويكتب أحدهما في ملف استبدله ضغط الآخر
+    path = str(tmp_path / 'enrollments.wal')
+    log = EnrollmentLog(path)
+    with pytest.raises(RuntimeError):
+        EnrollmentLog(path)
+    log.close()
+    EnrollmentLog(path).close()
@@ -0,0 +1,35 @@
+"""
+اختبارات فحص الجودة المسبق: الالتقاطات الرمادية وتحت الحمراء لا تُرفض كـ no_palm
+"""
+import os
+import sys
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from quality_gate import quality_precheck
+
+def _palm_lines(color):
+    rng = np.random.default_rng(0)
+    image = np.full((480, 640, 3), color, dtype=np.uint8)
+    for _ in range(15):
+        x1, y1, x2, y2 = (int(v) for v in rng.integers(0, 480, 4))
+        cv2.line(image, (x1, y1), (x2, y2), (40, 40, 40), 3)
+    return image
+
+def test_achromatic_capture_skips_skin_check():
+    ir = cv2.cvtColor(cv2.cvtColor(_palm_lines((150, 150, 150)), cv2.COLOR_BGR2GRAY), cv2.COLOR_GRAY2BGR)
+    result = quality_precheck(ir)
+    assert result['achromatic'] and result['palm_coverage'] is None
+    assert result['passed'], result['reasons']
+
+def test_color_capture_without_skin_is_rejected():
+    result = quality_precheck(_palm_lines((200, 60, 20)))
+    assert not result['achromatic']
+    assert 'no_palm' in result['reasons']
+
+def test_skin_colored_capture_passes():
+    result = quality_precheck(_palm_lines((120, 150, 200)))
+    assert result['palm_coverage'] > 0.15
+    assert result['passed'], result['reasons']
@@ -0,0 +1,65 @@
+"""
+اختبارات مستودع القوالب: نشر الإضافة والحذف إلى معارض العمال
+"""
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from biometric_matcher import BiometricMatcher, ConcurrentGallery
+from template_store import TemplateStore
+
+DIM = 16
+
+def _worker(path):
+    """عامل: معرض محمّل من المستودع عند البدء ثم مزامنة تزايدية"""
+    store = TemplateStore(path)
+    matcher = BiometricMatcher()
+    matcher.scaler.fit(np.vstack([np.zeros(DIM), np.ones(DIM)]))
+    matcher.sync_from_store(store)
+    return store, ConcurrentGallery(matcher, template_store=store, max_delay=60)
+
+def _active_users(gallery):
+    snapshot = gallery.snapshot()
+    return sorted({user for i, user in enumerate(snapshot.user_ids) if i not in snapshot.inactive_rows})
+
+def test_deletion_reaches_every_worker(tmp_path):
+    path = str(tmp_path / 'templates.db')
+    rng = np.random.default_rng(0)
+    vectors = {user: rng.normal(size=DIM) for user in 'abc'}
+    store = TemplateStore(path)
+    for user in 'ab':
+        store.add(vectors[user], f'user_{user}', user)
+
+    workers = [_worker(path) for _ in range(2)]
+    try:
+        store.add(vectors['c'], 'user_c', 'c')
+        store.delete_user('a')
+        for _, gallery in workers:
+            assert gallery.sync_store() == 2
+            assert _active_users(gallery) == ['b', 'c']
+            assert gallery.find_best_matches(vectors['a'], top_k=3)[0]['user_id'] != 'a'
+
+        # حذف ثم إعادة تسجيل بين مزامنتين: يبقى التسجيل الجديد فقط
+        store.delete_user('b')
+        store.add(vectors['b'], 'user_b', 'b')
+        for _, gallery in workers:
+            gallery.sync_store()
+            snapshot = gallery.snapshot()
+            rows = [i for i, user in enumerate(snapshot.user_ids) if user == 'b' and i not in snapshot.inactive_rows]
+            assert len(rows) == 1
+    finally:
+        for worker_store, gallery in workers:
+            gallery.close()
+            worker_store.close()
+
+    # عامل جديد بعد الحذف يبدأ بدون المستخدم المحذوف
+    store_copy, gallery = _worker(path)
+    try:
+        assert _active_users(gallery) == ['b', 'c']
+        assert gallery.snapshot().store_deletion_id == store.last_deletion_id()
+    finally:
+        gallery.close()
+        store_copy.close()
+        store.close()
@@ -0,0 +1,60 @@
+"""
+اختبارات التحليل الزمني التدفقي مقابل TemporalPatternAnalyzer.analyze_sequence
+"""
+import os
+import sys
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from anti_spoofing import StreamingTemporalAnalyzer, TemporalPatternAnalyzer
+
+def _hand_sequence(n_frames, shift, noise, seed=0):
+    """نمط خطوط يتحرك shift بكسل لكل إطار مع ضوضاء مستشعر"""
+    rng = np.random.default_rng(seed)
+    base = np.full((360, 480, 3), (120, 150, 200), dtype=np.uint8)
+    for _ in range(20):
+        x1, y1, x2, y2 = (int(v) for v in rng.integers(0, 360, 4))
+        cv2.line(base, (x1, y1), (x2, y2), (60, 70, 90), 3)
+    frames = []
+    for i in range(n_frames):
+        matrix = np.float32([[1, 0, shift * i], [0, 1, 0]])
+        frame = cv2.warpAffine(base, matrix, (480, 360), borderMode=cv2.BORDER_REPLICATE).astype(np.float32)
+        frames.append(np.clip(frame + rng.normal(0, noise, frame.shape), 0, 255).astype(np.uint8))
+    return frames
+
+def _stream(frames, **kwargs):
+    analyzer = StreamingTemporalAnalyzer(**kwargs)
+    for frame in frames:
+        analyzer.push(frame)
+    return analyzer
+
+@pytest.mark.parametrize('shift, noise', [(0, 2), (2, 6), (6, 12), (0, 25)])
+def test_matches_batch_analyzer(shift, noise):
+    frames = _hand_sequence(6, shift, noise)
+    batch = TemporalPatternAnalyzer().analyze_sequence(frames)
+    stream = _stream(frames).result()
+    assert stream['avg_motion'] == pytest.approx(batch['avg_motion'], rel=1e-4)
+    assert stream['temporal_consistency'] == pytest.approx(batch['temporal_consistency'], rel=1e-4)
+    assert stream['motion_validity'] == batch['motion_validity']
+    assert stream['temporal_score'] == pytest.approx(batch['temporal_score'], rel=1e-4)
+
+def test_mixed_frame_sizes_are_resized_not_skipped():
+    frames = _hand_sequence(2, 2, 6)
+    analyzer = _stream([frames[0], cv2.resize(frames[1], (240, 180))])
+    assert analyzer.pairs == 1
+
+def test_no_pairs_fails_closed():
+    analyzer = _stream(_hand_sequence(1, 0, 2))
+    assert analyzer.pairs == 0
+    assert analyzer.result()['temporal_score'] == 0.0
+    assert not analyzer.is_live()
+
+def test_downsampled_analysis_changes_scale():
+    # التصغير يخفض الضوضاء: الحركة أقل والعتبات الافتراضية لا تنطبق كما هي
+    frames = _hand_sequence(6, 2, 12)
+    full = _stream(frames).result()
+    small = _stream(frames, frame_size=160).result()
+    assert small['avg_motion'] < full['avg_motion']
@@ -0,0 +1,147 @@
+"""
+تحويل نماذج بصمة الكف إلى TFLite مكممة (نطاق ديناميكي أو int8 كامل)
+ومحرك استدلال tf.lite.Interpreter لخوادم CPU
+"""
+import tensorflow as tf
+import numpy as np
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import logging
+
+TFLITE_MODES = ('float32', 'dynamic', 'int8')
+
+def convert_to_tflite(model: tf.keras.Model, mode: str = 'dynamic',
+                      representative_batches: Optional[Iterable[np.ndarray]] = None) -> bytes:
+    """تحويل نموذج Keras إلى TFLite
+
+    mode: 'float32' (بدون تكميم)، 'dynamic' (أوزان int8 وتنشيطات float)،
+    'int8' (أوزان وتنشيطات int8، يحتاج دفعات معايرة بنفس معالجة الاستدلال).
+    الإدخال والإخراج يبقيان float32 حتى يكون المحرك بديلاً مباشراً.
+    """
+    if mode not in TFLITE_MODES:
+        raise ValueError(f"وضع TFLite غير مدعوم: {mode}")
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if mode in ('dynamic', 'int8'):
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if mode == 'int8':
+        if representative_batches is None:
+            raise ValueError("التكميم int8 الكامل يحتاج مجموعة صور معايرة")
+        batches = list(representative_batches)
+
+        def _representative_dataset():
+            for batch in batches:
+                # المعايرة صورة بصورة بتوقيع الإدخال (1, H, W, C)
+                for sample in np.asarray(batch, dtype=np.float32).reshape((-1,) + tuple(model.input_shape[1:])):
+                    yield [sample[np.newaxis]]
+
+        converter.representative_dataset = _representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return converter.convert()
+
+class TFLiteInference:
+    """محرك استدلال tf.lite.Interpreter بنفس واجهة CompiledInference
+
+    num_threads يحدد خيوط المعالجة لكل مفسر (None يترك الاختيار لـ TFLite).
+    المفسر غير آمن للخيوط، لذلك يُنشأ لكل خيط مفسر خاص من نفس محتوى النموذج
+    (threading.local) ويمكن مشاركة المحرك بين خيوط Flask. داخل كل خيط يُحتفظ
+    بمفسر لكل حجم دفعة فلا يُعاد تخصيص الموترات عند تبادل الأحجام.
+    """
+
+    def __init__(self, model_path: Optional[str] = None, model_content: Optional[bytes] = None,
+                 num_threads: Optional[int] = None):
+        if model_path is None and model_content is None:
+            raise ValueError("يجب تحديد مسار النموذج أو محتواه")
+        self.logger = logging.getLogger(__name__)
+        self.num_threads = num_threads
+        if model_content is None:
+            with open(model_path, 'rb') as f:
+                model_content = f.read()
+        self._model_content = model_content
+        self._local = threading.local()
+        # المفسر الأول يحدد شكل الإدخال ويبقى مفسر الخيط المنشئ
+        interpreter = tf.lite.Interpreter(model_content=model_content, num_threads=num_threads)
+        interpreter.allocate_tensors()
+        input_details = interpreter.get_input_details()[0]
+        self.input_shape = tuple(input_details['shape'][1:])
+        self._default_batch_size = int(input_details['shape'][0])
+        self._local.interpreters = {
+            self._default_batch_size: (interpreter, input_details, interpreter.get_output_details())
+        }
+
+    def _interpreter(self, batch_size: int) -> Tuple[tf.lite.Interpreter, Dict, List[Dict]]:
+        """مفسر هذا الخيط لحجم الدفعة المحدد مع تفاصيل الإدخال والإخراج"""
+        interpreters = getattr(self._local, 'interpreters', None)
+        if interpreters is None:
+            interpreters = self._local.interpreters = {}
+        entry = interpreters.get(batch_size)
+        if entry is None:
+            interpreter = tf.lite.Interpreter(model_content=self._model_content, num_threads=self.num_threads)
+            if batch_size != self._default_batch_size:
+                interpreter.resize_tensor_input(interpreter.get_input_details()[0]['index'],
+                                                (batch_size,) + self.input_shape)
+            interpreter.allocate_tensors()
+            entry = (interpreter, interpreter.get_input_details()[0], interpreter.get_output_details())
+            interpreters[batch_size] = entry
+        return entry
+
+    def warmup(self, batch_sizes: Iterable[int] = (1,)) -> None:
+        """تخصيص الموترات لأحجام الدفعات المحددة (لمفسرات الخيط المستدعي)"""
+        for batch_size in batch_sizes:
+            self(np.zeros((batch_size,) + self.input_shape, dtype=np.float32))
+
+    def __call__(self, batch) -> np.ndarray:
+        """تشغيل مفسر الخيط الحالي على دفعة وإرجاع مصفوفة NumPy"""
+        batch = np.asarray(batch, dtype=np.float32)
+        interpreter, input_details, output_details = self._interpreter(len(batch))
+        interpreter.set_tensor(input_details['index'], batch)
+        interpreter.invoke()
+        outputs = [interpreter.get_tensor(output['index']) for output in output_details]
+        return outputs[0] if len(outputs) == 1 else outputs
+
+def embedding_drift_report(reference: Callable, backends: Dict[str, Callable],
+                           batches: Iterable[np.ndarray]) -> Dict[str, Dict[str, float]]:
+    """انحراف مخرجات كل محرك عن نموذج float32 المرجعي
+
+    للمتجهات: التشابه الكوسيني (متوسط، أدنى، الشريحة 5%). للمخرجات العددية
+    (مثل درجة التزوير) يكون أقصى فرق مطلق هو المقياس المفيد.
+    """
+    reference_outputs, backend_outputs = [], {name: [] for name in backends}
+    for batch in batches:
+        reference_outputs.append(np.asarray(reference(batch), dtype=np.float32))
+        for name, backend in backends.items():
+            backend_outputs[name].append(np.asarray(backend(batch), dtype=np.float32))
+    reference_matrix = np.concatenate(reference_outputs).reshape(-1, reference_outputs[0].shape[-1])
+
+    report = {}
+    for name, outputs in backend_outputs.items():
+        matrix = np.concatenate(outputs).reshape(reference_matrix.shape)
+        cosine = (reference_matrix * matrix).sum(axis=1) / (
+            np.linalg.norm(reference_matrix, axis=1) * np.linalg.norm(matrix, axis=1) + 1e-8)
+        report[name] = {
+            'mean_cosine': float(cosine.mean()),
+            'min_cosine': float(cosine.min()),
+            'p5_cosine': float(np.percentile(cosine, 5)),
+            'max_abs_error': float(np.abs(reference_matrix - matrix).max())
+        }
+    return report
+
+def convert_palm_models(models: Dict[str, tf.keras.Model], calibration_batches: Dict[str, List[np.ndarray]],
+                        output_dir: str, modes: Iterable[str] = ('dynamic', 'int8')) -> Dict[str, str]:
+    """تحويل عدة نماذج إلى ملفات <الاسم>_<الوضع>.tflite وإرجاع مساراتها
+
+    calibration_batches: دفعات معايرة لكل نموذج بعد معالجة الإدخال الخاصة به.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    logger = logging.getLogger(__name__)
+    paths = {}
+    for name, model in models.items():
+        for mode in modes:
+            content = convert_to_tflite(model, mode, calibration_batches.get(name))
+            path = os.path.join(output_dir, f'{name}_{mode}.tflite')
+            with open(path, 'wb') as f:
+                f.write(content)
+            paths[f'{name}_{mode}'] = path
+            logger.info(f"تم تحويل {name} ({mode}): {len(content) / 1e6:.2f} MB → {path}")
+    return paths